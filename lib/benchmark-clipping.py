@@ -0,0 +1,50 @@
+#coding=utf-8
+
+'''
+Benchmark and compare clipping backends of the boolean operations,
+removing overlaps of all glyphs of the test fonts with each backend that loads on this machine.
+Results are compared with those of the first backend, contours being compared regardless of their starting point.
+'''
+
+import glob
+import time
+
+from defcon import Font
+from mutatorScale.booleanOperations import clipperBackends
+from mutatorScale.booleanOperations.booleanGlyph import BooleanGlyph, booleanResultsCache
+from mutatorScale.booleanOperations.flatten import flatSegmentsCache
+
+repeat = 3
+
+def normalizeContour(points):
+    start = points.index(min(points, key=lambda point: point[1]))
+    return tuple(points[start:] + points[:start])
+
+def getOutline(glyph):
+    return sorted([normalizeContour(contour._points) for contour in glyph.contours])
+
+glyphs = []
+for path in sorted(glob.glob('testFonts/*/*.ufo')):
+    font = Font(path)
+    glyphs += [(path, glyph) for glyph in font if len(glyph)]
+
+results = {}
+backendNames = clipperBackends.getAvailableBackendNames()
+for backendName in backendNames:
+    clipperBackends.setBackend(backendName)
+    times = []
+    for i in range(repeat):
+        flatSegmentsCache.clear()
+        booleanResultsCache.clear()
+        start = time.time()
+        outlines = [getOutline(BooleanGlyph(glyph).removeOverlap()) for path, glyph in glyphs]
+        times.append(time.time() - start)
+    results[backendName] = outlines
+
+    reference = results[backendNames[0]]
+    mismatches = ['%s %s' % (path.split('/')[-1], glyph.name) for (path, glyph), outline, referenceOutline in zip(glyphs, outlines, reference) if outline != referenceOutline]
+    print '%-10s %7.3f s   %d glyphs, %d differing from %s' % (backendName, min(times), len(glyphs), len(mismatches), backendNames[0])
+    for mismatch in mismatches:
+        print '    ', mismatch
+
+clipperBackends.setBackend()
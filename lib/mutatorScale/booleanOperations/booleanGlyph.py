@@ -2,12 +2,26 @@ import weakref
 from copy import deepcopy
 
 from robofab.pens.pointPen import AbstractPointPen
+from mutatorScale.objects.mathGlyph import MathGlyph, MathGlyphPen
 from mutatorScale.pens.utilityPens import ClockwiseTestPointPen
+from mutatorScale.utilities.cacheUtils import LRUCache
 
 from booleanOperationManager import BooleanOperationManager
+import clipperBackends
+import flatten
 
 manager = BooleanOperationManager()
 
+# contours resulting from boolean operations, keyed by operation, clipping backend, flattening settings
+# and input contours, a capacity of 0 disables it
+booleanResultsCache = LRUCache(256)
+
+def _getSettingsKey(operation):
+    return operation, clipperBackends.getBackendName(), manager.flatteningTolerance, flatten._approximateSegmentLength
+
+def _getContoursKey(contours):
+    return tuple([tuple([(segmentType, tuple(pt), smooth, name) for segmentType, pt, smooth, name in contour._points]) for contour in contours])
+
 class BooleanGlyphDataPointPen(AbstractPointPen):
 
     def __init__(self, glyph):
@@ -119,19 +133,58 @@ class BooleanGlyph(object):
         self.note = None
 
         if glyph:
-            pen = self.getPointPen()
-            pen.copyContourData = copyContourData
-            glyph.drawPoints(pen)
+            if isinstance(glyph, (BooleanGlyph, MathGlyph)):
+                # read point data directly, contour points are immutable tuples in both
+                if copyContourData:
+                    for contour in glyph._contours if isinstance(glyph, MathGlyph) else glyph.contours:
+                        self.appendContourData(contour._points if isinstance(contour, BooleanContour) else contour)
+                if isinstance(glyph, MathGlyph):
+                    self.components = list(glyph._components)
+                    self.anchors = list(glyph._anchors)
+                    lib = glyph._lib
+                else:
+                    self.components = list(glyph.components)
+                    self.anchors = list(glyph.anchors)
+                    lib = glyph.lib
+                # the lib is read without copying the copy-on-write lib of a MathGlyph, empty libs aren't copied
+                if lib:
+                    self.lib = deepcopy(lib)
+            else:
+                pen = self.getPointPen()
+                pen.copyContourData = copyContourData
+                glyph.drawPoints(pen)
+                self.lib = deepcopy(glyph.lib)
 
             self.name = glyph.name
             self.unicodes = glyph.unicodes
             self.width = glyph.width
-            self.lib = deepcopy(glyph.lib)
             self.note = glyph.note
 
             if not isinstance(glyph, self.__class__):
                 self.getSourceGlyph = weakref.ref(glyph)
 
+    def appendContourData(self, points):
+        """Append a contour given as a list of (segmentType, pt, smooth, name) tuples."""
+        contour = self.contourClass()
+        contour._points = list(points)
+        self.contours.append(contour)
+
+    def toMathGlyph(self):
+        """Return a MathGlyph built from the contour data, without drawing it through a pen."""
+        pen = MathGlyphPen()
+        for contour in self.contours:
+            pen.addContourData(contour._points)
+        mathGlyph = MathGlyph(None)
+        mathGlyph.contours = pen.contours
+        mathGlyph.components = list(self.components)
+        mathGlyph.anchors = pen.anchors + list(self.anchors)
+        mathGlyph.lib = dict(self.lib)
+        mathGlyph.name = self.name
+        mathGlyph.unicodes = self.unicodes
+        mathGlyph.width = self.width
+        mathGlyph.note = self.note
+        return mathGlyph
+
     def __repr__(self):
         return "<BooleanGlyph %s>" % self.name
 
@@ -181,11 +234,25 @@ class BooleanGlyph(object):
             contours = self.contours
             if other is not None:
                 contours += other.contours
-            func(contours, destination.getPointPen())
+            key = _getSettingsKey(operation), _getContoursKey(contours)
         else:
             subjectContours = self.contours
             clipContours = other.contours
+            key = _getSettingsKey(operation), _getContoursKey(subjectContours), _getContoursKey(clipContours)
+
+        # identical requests get the stored result
+        result = booleanResultsCache.get(key)
+        if result is not None:
+            for points in result:
+                destination.appendContourData(points)
+            return destination
+
+        contourCount = len(destination.contours)
+        if operation == "union":
+            func(contours, destination.getPointPen())
+        else:
             func(subjectContours, clipContours, destination.getPointPen())
+        booleanResultsCache.set(key, [tuple(contour._points) for contour in destination.contours[contourCount:]])
         return destination
 
     def __or__(self, other):
@@ -223,3 +290,83 @@ class BooleanGlyph(object):
     def removeOverlap(self):
         return self._booleanMath("union", None)
 
+
+
+if __name__ == '__main__':
+
+    import unittest
+
+    class BooleanGlyphTests(unittest.TestCase):
+
+        def setUp(self):
+            booleanResultsCache.clear()
+            self.glyph = BooleanGlyph()
+            pen = self.glyph.getPen()
+            pen.moveTo((0, 0))
+            pen.curveTo((0, 300), (300, 300), (300, 0))
+            pen.closePath()
+            pen.moveTo((150, 0))
+            pen.lineTo((150, 400))
+            pen.lineTo((450, 400))
+            pen.lineTo((450, 0))
+            pen.closePath()
+
+        def tearDown(self):
+            manager.flatteningTolerance = None
+
+        def test_identical_requests_reuse_result(self):
+            result = self.glyph.removeOverlap()
+            self.assertEqual(len(booleanResultsCache), 1)
+            self.assertEqual([contour._points for contour in self.glyph.removeOverlap()], [contour._points for contour in result])
+
+        def test_flattening_settings_are_part_of_the_cache_key(self):
+            self.glyph.removeOverlap()
+            manager.flatteningTolerance = 1.0
+            self.glyph.removeOverlap()
+            self.assertEqual(len(booleanResultsCache), 2)
+
+        def test_lib_is_copied_from_source(self):
+            source = self.glyph
+            source.lib['key'] = [1]
+            glyph = BooleanGlyph(source)
+            source.lib['key'].append(2)
+            self.assertEqual(glyph.lib, {'key': [1]})
+
+        def test_lib_of_source_math_glyph_is_copied_on_write(self):
+            mathGlyph = MathGlyph(self.glyph)
+            mathGlyph.lib['key'] = 1
+            glyph = BooleanGlyph(mathGlyph)
+            mathGlyph.lib['key'] = 2
+            self.assertEqual(glyph.lib, {'key': 1})
+            glyph.lib['key'] = 3
+            self.assertEqual(mathGlyph.lib, {'key': 2})
+
+        def test_component_only_math_glyph_is_read(self):
+            mathGlyph = MathGlyph(None)
+            mathGlyph.name = 'acomb'
+            mathGlyph.width = 300
+            mathGlyph.unicodes = [0x0300]
+            mathGlyph.components = [('a', (1, 0, 0, 1, 10, 0))]
+            glyph = BooleanGlyph(mathGlyph)
+            self.assertEqual((glyph.name, glyph.width, glyph.unicodes, glyph.components), ('acomb', 300, [0x0300], [('a', (1, 0, 0, 1, 10, 0))]))
+
+        def test_nested_lib_of_source_math_glyph_is_copied(self):
+            mathGlyph = MathGlyph(self.glyph)
+            mathGlyph.lib['key'] = [1]
+            glyph = BooleanGlyph(mathGlyph)
+            # the source glyph is left untouched
+            self.assertFalse(mathGlyph._sharedLib)
+            mathGlyph.lib['key'].append(2)
+            self.assertEqual(glyph.lib, {'key': [1]})
+
+        def test_to_math_glyph_matches_drawn_math_glyph(self):
+            self.glyph.anchors.append(((10, 20), 'top'))
+            self.glyph.components.append(('a', (1, 0, 0, 1, 0, 0)))
+            result = self.glyph.removeOverlap()
+            mathGlyph = result.toMathGlyph()
+            drawnMathGlyph = MathGlyph(result)
+            self.assertEqual(mathGlyph.contours, drawnMathGlyph.contours)
+            self.assertEqual(mathGlyph.components, drawnMathGlyph.components)
+            self.assertEqual(mathGlyph.anchors, drawnMathGlyph.anchors)
+
+    unittest.main()
@@ -1,27 +1,139 @@
 from fontTools.pens.basePen import BasePen
+from fontTools.misc.arrayTools import calcBounds
+from mutatorScale.pens.utilityPens import CollectOutlinePointPen
 from flatten import InputContour, OutputContour
-import pyClipper
+import clipperBackends
 
 
 """
 General Suggestions:
 - Contours should only be sent here if they actually overlap.
   This can be checked easily using contour bounds.
+  (Done here: contours are grouped into clusters of overlapping bounds
+  and only clusters that need it are sent to Clipper.)
 - Only perform operations on closed contours.
 - contours must have an on curve point
 - some kind of a log
 """
 
 
+def _getContourPoints(contour):
+    pen = CollectOutlinePointPen()
+    contour.drawPoints(pen)
+    if not pen.contours:
+        return []
+    return pen.contours[0]
+
+
+def _boxesTouch((xMin1, yMin1, xMax1, yMax1), (xMin2, yMin2, xMax2, yMax2)):
+    # touching boxes count, contours sharing an edge must be merged
+    return xMin1 <= xMax2 and xMin2 <= xMax1 and yMin1 <= yMax2 and yMin2 <= yMax1
+
+
+def _getOverlapClusters(boxes):
+    """
+    Return lists of indexes of boxes that overlap, directly or through other boxes, in order of first index.
+    Boxes are swept along x so that only boxes with overlapping x ranges are compared.
+    """
+    parents = range(len(boxes))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    order = sorted(range(len(boxes)), key=lambda index: boxes[index][0])
+    active = []
+    for index in order:
+        box = boxes[index]
+        active = [other for other in active if boxes[other][2] >= box[0]]
+        for other in active:
+            if _boxesTouch(box, boxes[other]):
+                parents[find(other)] = find(index)
+        active.append(index)
+
+    clusters = {}
+    for index in range(len(boxes)):
+        clusters.setdefault(find(index), []).append(index)
+    return sorted(clusters.values())
+
+
+def _mayIntersectItself(points):
+    """
+    Rough test for self intersection: True if control boxes of two segments that don't follow each other touch.
+    Contours with no on curve point are always considered as intersecting themselves.
+    """
+    onCurves = [index for index, (segmentType, pt, smooth, name) in enumerate(points) if segmentType is not None]
+    if not onCurves:
+        return True
+    points = points[onCurves[0]:] + points[:onCurves[0]]
+    closed = points[0][0] != "move"
+    if closed:
+        points = points + points[:1]
+    boxes = []
+    segment = [points[0][1]]
+    for segmentType, pt, smooth, name in points[1:]:
+        segment.append(pt)
+        if segmentType is not None:
+            boxes.append(calcBounds(segment))
+            segment = [pt]
+    count = len(boxes)
+    for i in range(count):
+        for j in range(i + 2, count):
+            if closed and i == 0 and j == count - 1:
+                continue
+            if _boxesTouch(boxes[i], boxes[j]):
+                return True
+    return False
+
+
 class BooleanOperationManager(object):
 
+    """
+    flatteningTolerance is passed on to InputContour, see flatten.InputContour.
+    """
+
+    def __init__(self, flatteningTolerance=None):
+        self.flatteningTolerance = flatteningTolerance
+
     def _performOperation(self, operation, subjectContours, clipContours, outPen):
+        """
+        Contours are first grouped into clusters whose control bounds overlap,
+        clusters don't interact so each one is handled on its own:
+        - a single contour that doesn't intersect itself is drawn as is in a union or xor, and in a difference if it's a subject;
+        - clusters that can't contribute to the result (no subject, or no clip in an intersection) are skipped;
+        - other clusters are clipped and re-curved, input contours being only matched against outputs of their own cluster.
+        Return the output contours of clipped clusters.
+        """
+        subjectContours = [contour for contour in subjectContours if contour and len(contour) > 1]
+        clipContours = [contour for contour in clipContours if contour and len(contour) > 1]
+        contours = subjectContours + clipContours
+        contourPoints = [_getContourPoints(contour) for contour in contours]
+        boxes = [calcBounds([pt for segmentType, pt, smooth, name in points]) for points in contourPoints]
+        subjectCount = len(subjectContours)
+
+        outputContours = []
+        for cluster in _getOverlapClusters(boxes):
+            subjects = [contours[index] for index in cluster if index < subjectCount]
+            clips = [contours[index] for index in cluster if index >= subjectCount]
+            if not subjects and operation != "xor":
+                continue
+            if not clips and operation == "intersection":
+                continue
+            if len(cluster) == 1 and operation != "intersection" and not _mayIntersectItself(contourPoints[cluster[0]]):
+                contours[cluster[0]].drawPoints(outPen)
+                continue
+            outputContours += self._clipContours(operation, subjects, clips, outPen)
+        return outputContours
+
+    def _clipContours(self, operation, subjectContours, clipContours, outPen):
         # prep the contours
-        subjectInputContours = [InputContour(contour) for contour in subjectContours if contour and len(contour) > 1]
-        clipInputContours = [InputContour(contour) for contour in clipContours if contour and len(contour) > 1]
+        subjectInputContours = [InputContour(contour, self.flatteningTolerance) for contour in subjectContours]
+        clipInputContours = [InputContour(contour, self.flatteningTolerance) for contour in clipContours]
         inputContours = subjectInputContours + clipInputContours
 
-        resultContours = pyClipper.clipExecute([subjectInputContour.originalFlat for subjectInputContour in subjectInputContours], 
+        resultContours = clipperBackends.clipExecute([subjectInputContour.originalFlat for subjectInputContour in subjectInputContours], 
                                                [clipInputContour.originalFlat for clipInputContour in clipInputContours], 
                                                operation, subjectFillType="noneZero", clipFillType="noneZero")
         # convert to output contours
@@ -67,13 +179,13 @@ class BooleanOperationManager(object):
     def getIntersections(self, contours):
         from flatten import _scalePoints, inverseClipperScale
         # prep the contours
-        inputContours = [InputContour(contour) for contour in contours if contour and len(contour) > 1]
+        inputContours = [InputContour(contour, self.flatteningTolerance) for contour in contours if contour and len(contour) > 1]
 
         inputFlatPoints = set()
         for contour in inputContours:
             inputFlatPoints.update(contour.originalFlat)
         
-        resultContours = pyClipper.clipExecute([inputContour.originalFlat for inputContour in inputContours], 
+        resultContours = clipperBackends.clipExecute([inputContour.originalFlat for inputContour in inputContours], 
                                                [], 
                                                "union", subjectFillType="noneZero", clipFillType="noneZero")
 
@@ -85,4 +197,62 @@ class BooleanOperationManager(object):
         return _scalePoints(intersections, inverseClipperScale)
 
 
-    
\ No newline at end of file
+    
+
+if __name__ == '__main__':
+
+    import os
+    import glob
+    import unittest
+    from defcon import Font
+    from mutatorScale.booleanOperations.booleanGlyph import BooleanGlyph, BooleanContour
+
+    def makeContour(cx, cy, r):
+        k = 0.5523 * r
+        contour = BooleanContour()
+        contour._points = [
+            ('curve', (cx + r, cy), False, None), (None, (cx + r, cy + k), False, None), (None, (cx + k, cy + r), False, None),
+            ('curve', (cx, cy + r), False, None), (None, (cx - k, cy + r), False, None), (None, (cx - r, cy + k), False, None),
+            ('curve', (cx - r, cy), False, None), (None, (cx - r, cy - k), False, None), (None, (cx - k, cy - r), False, None),
+            ('curve', (cx, cy - r), False, None), (None, (cx + k, cy - r), False, None), (None, (cx + r, cy - k), False, None),
+            ]
+        return contour
+
+    def makePolygon(points):
+        contour = BooleanContour()
+        contour._points = [('line', pt, False, None) for pt in points]
+        return contour
+
+    def normalizeContour(points):
+        start = points.index(min(points, key=lambda point: (point[1], point[0], point[2])))
+        return tuple(points[start:] + points[:start])
+
+    class BooleanOperationManagerTests(unittest.TestCase):
+
+        def setUp(self):
+            self.manager = BooleanOperationManager()
+
+        def assertClustersMatchSingleOperation(self, operation, subjectContours, clipContours):
+            pen = CollectOutlinePointPen()
+            self.manager._performOperation(operation, subjectContours, clipContours, pen)
+            singlePen = CollectOutlinePointPen()
+            self.manager._clipContours(operation, subjectContours, clipContours, singlePen)
+            self.assertEqual(sorted([normalizeContour(points) for points in pen.contours]), sorted([normalizeContour(points) for points in singlePen.contours]))
+
+        def test_clusters_match_single_union_of_glyphs(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            for fontPath in glob.glob(os.path.join(libFolder, 'testFonts/*/*.ufo')):
+                for glyph in Font(fontPath):
+                    contours = [contour for contour in BooleanGlyph(glyph).contours if len(contour) > 1]
+                    if contours:
+                        self.assertClustersMatchSingleOperation('union', contours, [])
+
+        def test_clusters_match_single_operation(self):
+            # overlapping subjects, lone subjects, a bow tie, a clip overlapping nothing
+            subjectContours = [makeContour(0, 0, 100), makeContour(120, 0, 100), makeContour(1000, 0, 100), makePolygon([(2000, 0), (2100, 100), (2100, 0), (2000, 100)]), makeContour(3000, 0, 100)]
+            clipContours = [makeContour(60, 100, 80), makeContour(1000, 0, 50), makeContour(5000, 0, 100), makePolygon([(2950, -20), (2950, 20), (3200, 20), (3200, -20)])]
+            self.assertClustersMatchSingleOperation('union', subjectContours, [])
+            for operation in ['difference', 'intersection', 'xor']:
+                self.assertClustersMatchSingleOperation(operation, subjectContours, clipContours)
+
+    unittest.main()
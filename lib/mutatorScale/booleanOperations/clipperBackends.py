@@ -0,0 +1,120 @@
+"""
+Clipping backends of the boolean operations.
+
+A backend is any object with a clipExecute(subjectContours, clipContours, operation, subjectFillType, clipFillType) function,
+taking contours as lists of (x, y) integer points and returning the resulting contours in the same form.
+Available backends, in order of preference:
+- pyClipper: the Clipper module bundled with this package, built for one platform only;
+- pyclipper: the pyclipper package, if it is installed;
+- python: a pure Python implementation, always available but much slower.
+The first one that can be loaded is used unless another one is chosen with setBackend().
+"""
+
+
+class PyclipperBackend(object):
+
+    """Backend calling the pyclipper package."""
+
+    def __init__(self):
+        import pyclipper
+        self._pyclipper = pyclipper
+        self._operations = {
+            "union": pyclipper.CT_UNION,
+            "difference": pyclipper.CT_DIFFERENCE,
+            "intersection": pyclipper.CT_INTERSECTION,
+            "xor": pyclipper.CT_XOR,
+        }
+        self._fillTypes = {
+            "evenOdd": pyclipper.PFT_EVENODD,
+            "noneZero": pyclipper.PFT_NONZERO,
+            "positive": pyclipper.PFT_POSITIVE,
+            "negative": pyclipper.PFT_NEGATIVE,
+        }
+
+    def clipExecute(self, subjectContours, clipContours, operation, subjectFillType="noneZero", clipFillType="noneZero"):
+        pyclipper = self._pyclipper
+        clipper = pyclipper.Pyclipper()
+        for contours, polyType in [(subjectContours, pyclipper.PT_SUBJECT), (clipContours, pyclipper.PT_CLIP)]:
+            for contour in contours:
+                # pyclipper refuses degenerate contours, Clipper ignores them
+                if len(contour) > 2:
+                    try:
+                        clipper.AddPath(contour, polyType, True)
+                    except pyclipper.ClipperException:
+                        pass
+        result = clipper.Execute(self._operations[operation], self._fillTypes[subjectFillType], self._fillTypes[clipFillType])
+        return [[tuple(point) for point in contour] for contour in result]
+
+
+def _loadBundled():
+    import pyClipper
+    return pyClipper
+
+def _loadPyclipper():
+    return PyclipperBackend()
+
+def _loadPython():
+    import pythonClipper
+    return pythonClipper
+
+_loaders = [
+    ("pyClipper", _loadBundled),
+    ("pyclipper", _loadPyclipper),
+    ("python", _loadPython),
+]
+
+_backends = {}
+_currentBackend = None
+
+
+def getBackendNames():
+    """Return names of all backends, in order of preference."""
+    return [name for name, loader in _loaders]
+
+
+def loadBackend(name):
+    """Return the backend of a given name, raise ImportError if it can't be loaded on this platform."""
+    if name not in _backends:
+        loaders = dict(_loaders)
+        if name not in loaders:
+            raise ValueError("unknown clipping backend: %s" % name)
+        try:
+            _backends[name] = loaders[name]()
+        except ImportError:
+            _backends[name] = None
+    if _backends[name] is None:
+        raise ImportError("clipping backend %s can't be loaded" % name)
+    return _backends[name]
+
+
+def getAvailableBackendNames():
+    """Return names of backends that can be loaded, in order of preference."""
+    names = []
+    for name in getBackendNames():
+        try:
+            loadBackend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def setBackend(name=None):
+    """Use the backend of a given name, or the first one that loads if name is None."""
+    global _currentBackend
+    if name is None:
+        name = getAvailableBackendNames()[0]
+    loadBackend(name)
+    _currentBackend = name
+
+
+def getBackendName():
+    """Return the name of the backend in use."""
+    if _currentBackend is None:
+        setBackend()
+    return _currentBackend
+
+
+def clipExecute(subjectContours, clipContours, operation, subjectFillType="noneZero", clipFillType="noneZero"):
+    backend = loadBackend(getBackendName())
+    return backend.clipExecute(subjectContours, clipContours, operation, subjectFillType, clipFillType)
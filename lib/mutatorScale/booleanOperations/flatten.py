@@ -4,6 +4,12 @@ from fontTools.misc import bezierTools
 from fontTools.pens.basePen import decomposeQuadraticSegment
 from robofab.pens.reverseContourPointPen import ReverseContourPointPen
 from robofab.pens.adapterPens import PointToSegmentPen
+from mutatorScale.utilities.cacheUtils import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 """
 To Do:
@@ -29,6 +35,9 @@ optimization ideas:
 - cache input contour objects. matching these to incoming
   will be a little difficult because of point names and
   identifiers. alternatively, deal with those after the fact.
+  (done for the flattening: flat segments are cached by point
+  coordinates and types, points with their names and other
+  attributes are taken from each incoming contour.)
 - some tests on input before conversion to input objects
   could yield significant speedups. would need to check
   each contour for self intersection and each
@@ -54,6 +63,12 @@ inverseClipperScale = 1.0 / clipperScale
 # approximateSegmentLength setting
 _approximateSegmentLength = 5.3
 
+# flat points of input contour segments keyed by flattening tolerance and contour geometry
+flatSegmentsCache = LRUCache(512)
+
+# below this number of curves in a contour, numpy's overhead outweighs vectorized flattening
+_vectorizeThreshold = 4
+
 # -------------
 # Input Objects
 # -------------
@@ -62,40 +77,79 @@ _approximateSegmentLength = 5.3
 
 class InputContour(object):
 
-    def __init__(self, contour):
+    """
+    flatteningTolerance is the maximum distance, in font units, between curves and their flattened approximation.
+    If None, curves are flattened in steps of _approximateSegmentLength along their estimated length.
+    """
+
+    def __init__(self, contour, flatteningTolerance=None):
         # gather the point data
         pointPen = ContourPointDataPen()
         contour.drawPoints(pointPen)
         points = pointPen.getData()
-        reversedPoints = _reversePoints(points)
-        # gather segments
-        self.segments = _convertPointsToSegments(points)
-        # only calculate once all the flat points.
-        # it seems to have some tiny difference and its a lot faster
-        # if the flat points are calculated from the reversed input points.
-        self.reversedSegments = _convertPointsToSegments(reversedPoints, willBeReversed=True)
-        # simple reverse the flat points and store them in the reversedSegments
-        index = 0
-        for segment in self.segments:
-            otherSegment = self.reversedSegments[index]
-            otherSegment.flat = segment.getReversedFlatPoints()
-            index -= 1
+        # reverse the points before segments are built,
+        # as degenerate curves are converted to lines in place
+        self._reversedPoints = _reversePoints(points)
+        # gather segments, reusing flat points of a contour with the same geometry
+        key = flatteningTolerance, tuple([(tuple(point.coordinates), point.segmentType) for point in points])
+        flatSegments = flatSegmentsCache.get(key)
+        if flatSegments is None:
+            # flatten the curves of all segments at once
+            self.segments = _convertPointsToSegments(points, deferFlattening=True)
+            _flattenSegments(self.segments, flatteningTolerance)
+            flatSegmentsCache.set(key, [segment.flat for segment in self.segments])
+        else:
+            self.segments = _convertPointsToSegments(points, flatSegments=flatSegments)
+        # segments in the reverse direction are only built when re-curving needs them
+        self._reversedSegments = None
         # get the direction
         self.clockwise = contour.clockwise
-        # store the gathered data
-        if self.clockwise:
-            self.clockwiseSegments = self.segments
-            self.counterClockwiseSegments = self.reversedSegments
-        else:
-            self.clockwiseSegments = self.reversedSegments
-            self.counterClockwiseSegments = self.segments
         # flag indicating if the contour has been used
         self.used = False
+        # flat points and their signatures in each direction, built on first use
+        self._flats = {}
+        self._flatSignatures = {}
 
     # ----------
     # Attributes
     # ----------
 
+    # the segments in the reverse direction
+
+    def _get_reversedSegments(self):
+        if self._reversedSegments is None:
+            # only calculate once all the flat points.
+            # it seems to have some tiny difference and its a lot faster
+            # if the flat points are calculated from the reversed input points.
+            reversedSegments = _convertPointsToSegments(self._reversedPoints, willBeReversed=True)
+            # simple reverse the flat points and store them in the reversedSegments
+            index = 0
+            for segment in self.segments:
+                otherSegment = reversedSegments[index]
+                otherSegment.flat = segment.getReversedFlatPoints()
+                index -= 1
+            self._reversedSegments = reversedSegments
+            self._reversedPoints = None
+        return self._reversedSegments
+
+    reversedSegments = property(_get_reversedSegments)
+
+    # the segments in each direction
+
+    def _get_clockwiseSegments(self):
+        if self.clockwise:
+            return self.segments
+        return self.reversedSegments
+
+    clockwiseSegments = property(_get_clockwiseSegments)
+
+    def _get_counterClockwiseSegments(self):
+        if self.clockwise:
+            return self.reversedSegments
+        return self.segments
+
+    counterClockwiseSegments = property(_get_counterClockwiseSegments)
+
     # the original direction in flat segments
 
     def _get_originalFlat(self):
@@ -109,25 +163,48 @@ class InputContour(object):
     # the clockwise direction in flat segments
 
     def _get_clockwiseFlat(self):
-        flat = []
-        segments = self.clockwiseSegments
-        for segment in segments:
-            flat.extend(segment.flat)
-        return flat
+        return self._getFlat(True)
 
     clockwiseFlat = property(_get_clockwiseFlat)
 
     # the counter-clockwise direction in flat segments
 
     def _get_counterClockwiseFlat(self):
-        flat = []
-        segments = self.counterClockwiseSegments
-        for segment in segments:
-            flat.extend(segment.flat)
-        return flat
+        return self._getFlat(False)
 
     counterClockwiseFlat = property(_get_counterClockwiseFlat)
 
+    def _getFlat(self, clockwise):
+        """
+        Return the flat points in a direction.
+        The reverse direction is read from the segments in reverse order
+        without building the reversed segments.
+        """
+        if clockwise not in self._flats:
+            flat = []
+            if bool(self.clockwise) == clockwise:
+                for segment in self.segments:
+                    flat.extend(segment.flat)
+            elif self.segments:
+                segments = self.segments
+                for segment in [segments[0]] + segments[:0:-1]:
+                    flat.extend(segment.getReversedFlatPoints())
+            self._flats[clockwise] = flat
+        return self._flats[clockwise]
+
+    def getFlatSignature(self, clockwise):
+        """
+        Return a signature of the flat points in a direction,
+        which doesn't depend on the starting point, see _getFlatSignature().
+        """
+        if clockwise not in self._flatSignatures:
+            if clockwise:
+                flat = self.clockwiseFlat
+            else:
+                flat = self.counterClockwiseFlat
+            self._flatSignatures[clockwise] = _getFlatSignature(flat)
+        return self._flatSignatures[clockwise]
+
     def hasOnCurve(self):
         for inputSegment in self.segments:
             if not inputSegment.used and inputSegment.segmentType != "line":
@@ -137,9 +214,9 @@ class InputContour(object):
 
 class InputSegment(object):
 
-    #__slots__ = ["points", "previousOnCurve", "scaledPreviousOnCurve", "flat", "used"]
+    __slots__ = ["points", "previousOnCurve", "scaledPreviousOnCurve", "flat", "cubics", "used"]
 
-    def __init__(self, points=None, previousOnCurve=None, willBeReversed=False):
+    def __init__(self, points=None, previousOnCurve=None, willBeReversed=False, flat=None, deferFlattening=False):
         if points is None:
             points = []
         self.points = points
@@ -147,6 +224,7 @@ class InputSegment(object):
         self.scaledPreviousOnCurve = _scaleSinglePoint(previousOnCurve, scale=clipperScale)
         self.used = False
         self.flat = []
+        self.cubics = None
         # if the bcps are equal to the oncurves convert the segment to a line segment.
         # otherwise this causes an error when flattening.
         if self.segmentType == "curve":
@@ -165,10 +243,26 @@ class InputSegment(object):
         # its a reversed segment the flat points will be set later on in the InputContour
         if willBeReversed:
             return
-        pointsToFlatten = []
+        # flat points already computed for the same geometry
+        if flat is not None:
+            self.flat = list(flat)
+            return
+        self.cubics = self._getCubics()
+        # flattening may be left to the InputContour, for all segments at once
+        if deferFlattening:
+            return
+        self.setFlat(_flattenCubics(self.cubics))
+
+    def _getCubics(self):
+        """
+        Return the cubic curves to flatten for this segment,
+        quadratic curves are converted to cubics, lines have none.
+        """
+        points = self.points
+        previousOnCurve = self.previousOnCurve
         if self.segmentType == "qcurve":
             assert len(points) >= 0
-            flat = []
+            cubics = []
             currentOnCurve = previousOnCurve
             pointCoordinates = [point.coordinates for point in points]
             for pt1, pt2 in decomposeQuadraticSegment(pointCoordinates[1:]):
@@ -180,25 +274,33 @@ class InputSegment(object):
                 mid2x = pt2x + 0.66666666666666667 * (pt1x - pt2x)
                 mid2y = pt2y + 0.66666666666666667 * (pt1y - pt2y)
                 
-                convertedQuadPointToFlatten = [currentOnCurve, (mid1x, mid1y), (mid2x, mid2y), pt2]
-                flat.extend(_flattenSegment(convertedQuadPointToFlatten))
+                cubics.append([currentOnCurve, (mid1x, mid1y), (mid2x, mid2y), pt2])
                 currentOnCurve = pt2
-            self.flat = flat
             # this shoudl be easy.
             # copy the quad to cubic from fontTools.pens.basePen
+            return cubics
         elif self.segmentType == "curve":
-            pointsToFlatten = [previousOnCurve] + [point.coordinates for point in points]
+            return [[previousOnCurve] + [point.coordinates for point in points]]
         else:
             assert len(points) == 1
-            self.flat = [point.coordinates for point in points]
-        if pointsToFlatten:
-            self.flat = _flattenSegment(pointsToFlatten)
+            return []
+
+    def setFlat(self, flattenedCubics):
+        """
+        Set the flat points of the segment from its cubics flattened in Clipper coordinates,
+        as returned by _flattenCubics(), a line only has its end point.
+        """
+        if self.cubics:
+            flat = []
+            for cubicFlat in flattenedCubics:
+                flat.extend(cubicFlat)
+        else:
+            flat = _scalePoints([point.coordinates for point in self.points], scale=clipperScale)
         # if len(self.flat) == 1 and self.segmentType == "curve":
         #     oncurve = self.points[-1]
         #     oncurve.segmentType = "line"
         #     self.points = [oncurve]
-        self.flat = _scalePoints(self.flat, scale=clipperScale)
-        self.flat = _checkFlatPoints(self.flat)
+        self.flat = _checkFlatPoints(flat)
         self.used = False
 
     def _get_segmentType(self):
@@ -401,9 +503,10 @@ def _reversePoints(points):
     # done
     return final
 
-def _convertPointsToSegments(points, willBeReversed=False):
+def _convertPointsToSegments(points, willBeReversed=False, flatSegments=None, deferFlattening=False):
     """
     Compile points into InputSegment objects.
+    If provided, flatSegments holds the flat points of each segment.
     """
     # get the last on curve
     previousOnCurve = None
@@ -423,7 +526,9 @@ def _convertPointsToSegments(points, willBeReversed=False):
             segment = InputSegment(
                 points=offCurves + [point],
                 previousOnCurve=previousOnCurve,
-                willBeReversed=willBeReversed
+                willBeReversed=willBeReversed,
+                flat=flatSegments[len(segments)] if flatSegments is not None else None,
+                deferFlattening=deferFlattening
             )
             segments.append(segment)
             offCurves = []
@@ -431,6 +536,20 @@ def _convertPointsToSegments(points, willBeReversed=False):
     assert not offCurves
     return segments
 
+def _flattenSegments(segments, tolerance=None):
+    """
+    Flatten the curves of InputSegment objects created with deferFlattening, all at once.
+    """
+    cubics = []
+    for segment in segments:
+        cubics.extend(segment.cubics)
+    flattenedCubics = _flattenCubics(cubics, tolerance)
+    index = 0
+    for segment in segments:
+        count = len(segment.cubics)
+        segment.setFlat(flattenedCubics[index:index + count])
+        index += count
+
 
 # --------------
 # Output Objects
@@ -448,6 +567,11 @@ class OutputContour(object):
                 points=[point]
             ) for point in pointList
         ]
+        # the flat points, their signature and a dict of their indexes
+        # as long as segments are those built here
+        self._flatPoints = pointList
+        self._flatSignature = None
+        self._flatIndexes = None
 
     def _scalePoint(self, point):
         x, y = point
@@ -463,17 +587,57 @@ class OutputContour(object):
     # Attributes
     # ----------
 
+    def _get_segments(self):
+        return self._segments
+
+    def _set_segments(self, segments):
+        self._segments = segments
+        # segments are only tested again when final is next asked for
+        self._final = None
+        self._flatPoints = None
+        self._flatSignature = None
+        self._flatIndexes = None
+
+    segments = property(_get_segments, _set_segments)
+
     def _get_final(self):
-        # XXX this could be optimized:
-        # store a fixed value after teh contour is finalized
-        # don't do the dymanic searching if that flag is set to True
-        for segment in self.segments:
-            if not segment.final:
-                return False
-        return True
+        # the value is stored until segments are replaced,
+        # segments edited in place must be reassigned to update it
+        if self._final is None:
+            self._final = True
+            for segment in self._segments:
+                if not segment.final:
+                    self._final = False
+                    break
+        return self._final
 
     final = property(_get_final)
 
+    def _getFlatPoints(self):
+        if self._flatPoints is None:
+            outputFlat = []
+            for segment in self.segments:
+                assert segment.segmentType == "flat"
+                outputFlat += segment.points
+            self._flatPoints = outputFlat
+        return self._flatPoints
+
+    def _getFlatSignature(self):
+        if self._flatSignature is None:
+            self._flatSignature = _getFlatSignature(self._getFlatPoints())
+        return self._flatSignature
+
+    def _getFlatIndexes(self):
+        """
+        Return a dict of flat points and the list of their indexes.
+        """
+        if self._flatIndexes is None:
+            flatIndexes = {}
+            for index, point in enumerate(self._getFlatPoints()):
+                flatIndexes.setdefault(point, []).append(index)
+            self._flatIndexes = flatIndexes
+        return self._flatIndexes
+
     # --------------------------
     # Re-Curve and Curve Fitting
     # --------------------------
@@ -483,41 +647,31 @@ class OutputContour(object):
             inputFlat = inputContour.clockwiseFlat
         else:
             inputFlat = inputContour.counterClockwiseFlat
-        outputFlat = []
-        for segment in self.segments:
-            # XXX this could be expensive
-            assert segment.segmentType == "flat"
-            outputFlat += segment.points
-        # test lengths
+        inputSignature = inputContour.getFlatSignature(bool(self.clockwise))
+        outputFlat = self._getFlatPoints()
+        # test lengths and signatures, then points
         haveMatch = False
-        if len(inputFlat) == len(outputFlat):
+        if len(inputFlat) == len(outputFlat) and inputSignature == self._getFlatSignature():
             if inputFlat == outputFlat:
                 haveMatch = True
             else:
-                inputStart = inputFlat[0]
-                if inputStart in outputFlat:
-                    # there should be only one occurance of the point
-                    # but handle it just in case
-                    if outputFlat.count(inputStart) > 1:
-                        startIndexes = [index for index, point in enumerate(outputFlat) if point == inputStart]
-                    else:
-                        startIndexes = [outputFlat.index(inputStart)]
-                    # slice and dice to test possible orders
-                    for startIndex in startIndexes:
-                        test = outputFlat[startIndex:] + outputFlat[:startIndex]
-                        if inputFlat == test:
-                            haveMatch = True
-                            break
+                count = len(outputFlat)
+                # there should be only one occurance of the point
+                # but handle it just in case
+                for startIndex in self._getFlatIndexes().get(inputFlat[0], []):
+                    # compare both parts of the rotated output
+                    if outputFlat[startIndex:] == inputFlat[:count - startIndex] and outputFlat[:startIndex] == inputFlat[count - startIndex:]:
+                        haveMatch = True
+                        break
         if haveMatch:
-            # clear out the flat points
-            self.segments = []
             # replace with the appropriate points from the input
             if self.clockwise:
                 inputSegments = inputContour.clockwiseSegments
             else:
                 inputSegments = inputContour.counterClockwiseSegments
+            segments = []
             for inputSegment in inputSegments:
-                self.segments.append(
+                segments.append(
                     OutputSegment(
                         segmentType=inputSegment.segmentType,
                         points=[
@@ -534,6 +688,11 @@ class OutputContour(object):
                     )
                 )
                 inputSegment.used = True
+            self.segments = segments
+            self._final = True
+            # the input is entirely used, in both directions,
+            # it doesn't need to be indexed for sub segments re-curving
+            inputContour.used = True
             # reset the direction of the final contour
             self.clockwise = inputContour.clockwise
             return True
@@ -975,13 +1134,22 @@ class OutputSegment(object):
         self.final = final
 
 
-class OutputPoint(InputPoint): pass
+class OutputPoint(InputPoint):
+
+    __slots__ = []
 
 
 # -------------
 # Ouput Support
 # -------------
 
+def _getFlatSignature(points):
+    """
+    Return a signature of flat points that doesn't depend on their order,
+    so that rotations of the same contour share it: their count and the sum of their hashes.
+    """
+    return len(points), sum([hash(point) for point in points])
+
 def _getClockwise(points):
     """
     Very quickly get the direction for points.
@@ -1080,15 +1248,17 @@ def _intPoint(pt):
 
 def _checkFlatPoints(points):
     _points = []
+    _seen = set()
     previousX = previousY = None
     for x, y in points:
         if x == previousX:
             continue
         elif y == previousY:
             continue
-        if (x, y) not in _points: 
+        if (x, y) not in _seen: 
             # is it possible that two flat point are on top of eachother???
             _points.append((x, y))
+            _seen.add((x, y))
         previousX, previousY = x, y
     if _points[-1] != points[-1]:
         _points[-1] = points[-1]
@@ -1099,7 +1269,7 @@ The curve flattening code was forked and modified from RoboFab's FilterPen.
 That code was written by Erik van Blokland.
 """
 
-def _flattenSegment(segment, approximateSegmentLength=_approximateSegmentLength):
+def _flattenSegment(segment, approximateSegmentLength=_approximateSegmentLength, tolerance=None):
     """
     Flatten the curve segment int a list of points.
     The first and last points in the segment must be
@@ -1113,10 +1283,13 @@ def _flattenSegment(segment, approximateSegmentLength=_approximateSegmentLength)
     onCurve1, offCurve1, offCurve2, onCurve2 = segment
     if _pointOnLine(onCurve1, onCurve2, offCurve1) and _pointOnLine(onCurve1, onCurve2, offCurve2):
         return [onCurve2]
-    est = _estimateCubicCurveLength(onCurve1, offCurve1, offCurve2, onCurve2) / approximateSegmentLength
     flat = []
     minStep = 0.1564
-    step = 1.0 / est
+    if tolerance is None:
+        est = _estimateCubicCurveLength(onCurve1, offCurve1, offCurve2, onCurve2) / approximateSegmentLength
+        step = 1.0 / est
+    else:
+        step = 1.0 / _toleranceStepCount(_cubicCurvature(onCurve1, offCurve1, offCurve2, onCurve2), tolerance)
     if step > .3:
         step = minStep
     t = step
@@ -1127,6 +1300,119 @@ def _flattenSegment(segment, approximateSegmentLength=_approximateSegmentLength)
     flat.append(onCurve2)
     return flat
 
+def _flattenCubics(cubics, tolerance=None):
+    """
+    Flatten cubic curves into lists of points scaled to Clipper integer coordinates,
+    each list leaving out the curve's first on curve point.
+    Many curves are flattened with numpy in a single pass,
+    which produces the same points as _flattenSegment().
+    """
+    if numpy is None or len(cubics) < _vectorizeThreshold:
+        return [_scalePoints(_flattenSegment(cubic, tolerance=tolerance), scale=clipperScale) for cubic in cubics]
+    return _flattenCubicsNumpy(numpy.array(cubics, dtype=float), tolerance=tolerance)
+
+def _flattenCubicsNumpy(cubics, approximateSegmentLength=_approximateSegmentLength, tolerance=None):
+    """
+    cubics is an array of shape (curveCount, 4, 2).
+    Operations are carried out in the same order as in _flattenSegment()
+    so that float results, and rounded coordinates, are identical.
+    """
+    pt0, pt1, pt2, pt3 = cubics[:, 0], cubics[:, 1], cubics[:, 2], cubics[:, 3]
+    # false curves only keep their end point
+    lineLength = _distanceArray(pt0, pt3)
+    isLine = (numpy.abs(_distanceArray(pt0, pt1) + _distanceArray(pt1, pt3) - lineLength) < epsilon) & \
+             (numpy.abs(_distanceArray(pt0, pt2) + _distanceArray(pt2, pt3) - lineLength) < epsilon)
+    if tolerance is None:
+        # estimate curve lengths from 11 points, as _estimateCubicCurveLength()
+        precision = 10
+        sampleCount = precision + 1
+        t = numpy.tile(numpy.arange(sampleCount) * (1.0 / precision), len(cubics))
+        samples = _getCubicPointsArray(t, *[numpy.repeat(pt, sampleCount, axis=0) for pt in (pt0, pt1, pt2, pt3)])
+        samples = samples.reshape(len(cubics), sampleCount, 2)
+        distances = numpy.sqrt((samples[:, 1:, 0] - samples[:, :-1, 0]) ** 2 + (samples[:, 1:, 1] - samples[:, :-1, 1]) ** 2)
+        # summed one after the other, as in _estimateCubicCurveLength()
+        length = numpy.cumsum(distances, axis=1)[:, -1]
+        with numpy.errstate(divide='ignore'):
+            step = 1.0 / (length / approximateSegmentLength)
+    else:
+        # as _cubicCurvature() and _toleranceStepCount()
+        secondDifferences = numpy.maximum(_normArray(pt0 - 2 * pt1 + pt2), _normArray(pt1 - 2 * pt2 + pt3))
+        step = 1.0 / numpy.maximum(1, numpy.ceil(numpy.sqrt(0.75 * secondDifferences / tolerance)))
+    step = numpy.where(step > .3, 0.1564, step)
+    step = numpy.where(isLine, 1.0, step)
+    # t values are accumulated step by step along each curve
+    stepCount = int(numpy.ceil(1.0 / step.min())) + 1
+    t = numpy.cumsum(numpy.repeat(step[:, None], stepCount, axis=1), axis=1)
+    inCurve = t < 1
+    owners = numpy.nonzero(inCurve)[0]
+    flat = _getCubicPointsArray(t[inCurve], pt0[owners], pt1[owners], pt2[owners], pt3[owners])
+    flat = _roundArray(flat * clipperScale)
+    flat = zip(flat[:, 0].tolist(), flat[:, 1].tolist())
+    ends = _roundArray(pt3 * clipperScale)
+    ends = zip(ends[:, 0].tolist(), ends[:, 1].tolist())
+    counts = inCurve.sum(axis=1).tolist()
+    flattenedCubics = []
+    index = 0
+    for count, end in zip(counts, ends):
+        points = flat[index:index + count]
+        points.append(end)
+        flattenedCubics.append(points)
+        index += count
+    return flattenedCubics
+
+def _distanceArray(pts1, pts2):
+    return numpy.sqrt((pts1[:, 0] - pts2[:, 0]) ** 2 + (pts1[:, 1] - pts2[:, 1]) ** 2)
+
+def _normArray(vectors):
+    return numpy.hypot(vectors[:, 0], vectors[:, 1])
+
+def _getCubicPointsArray(t, pt0, pt1, pt2, pt3):
+    """
+    Vectorized _getCubicPoint(), t being an array of values for curves in arrays of points.
+    """
+    c = (pt1 - pt0) * 3.0
+    b = (pt2 - pt1) * 3.0 - c
+    a = pt3 - pt0 - c - b
+    t = t[:, None]
+    t3 = t ** 3
+    t2 = t * t
+    points = a * t3 + b * t2 + c * t + pt0
+    # exact values at both ends and in the middle
+    ab = 0.5 * (pt0 + pt1)
+    bc = 0.5 * (pt1 + pt2)
+    cd = 0.5 * (pt2 + pt3)
+    middle = 0.5 * (0.5 * (ab + bc) + 0.5 * (bc + cd))
+    points = numpy.where(t == 0, pt0, points)
+    points = numpy.where(t == 1, pt3, points)
+    points = numpy.where(t == 0.5, middle, points)
+    return points
+
+def _roundArray(values):
+    """
+    Round values half away from zero to integers, as round() does.
+    """
+    magnitudes = numpy.abs(values)
+    rounded = numpy.floor(magnitudes)
+    rounded += (magnitudes - rounded) >= 0.5
+    return (numpy.sign(values) * rounded).astype(int)
+
+def _cubicCurvature(pt0, pt1, pt2, pt3):
+    """
+    Return the largest second difference of a cubic's points,
+    the curve's second derivative is at most 6 times this value.
+    """
+    return max(
+        math.hypot(pt0[0] - 2 * pt1[0] + pt2[0], pt0[1] - 2 * pt1[1] + pt2[1]),
+        math.hypot(pt1[0] - 2 * pt2[0] + pt3[0], pt1[1] - 2 * pt2[1] + pt3[1])
+    )
+
+def _toleranceStepCount(curvature, tolerance):
+    """
+    Return the number of equal t steps keeping chords within tolerance of a cubic:
+    a chord over a t interval h deviates from the curve by at most h**2 / 8 times the second derivative.
+    """
+    return max(1, math.ceil(math.sqrt(0.75 * curvature / tolerance)))
+
 def _distance(pt1, pt2):
     return math.sqrt((pt1[0] - pt2[0]) ** 2 + (pt1[1] - pt2[1]) ** 2)
 
@@ -1197,3 +1483,145 @@ def _getQuadPoint(t, pt0, pt1, pt2):
         x = ax * t**2 + bx * t + cx
         y = ay * t**2 + by * t + cy
         return x, y
+
+
+if __name__ == '__main__':
+
+    import unittest
+    from mutatorScale.booleanOperations.booleanGlyph import BooleanContour
+
+    def makeContour(cx, cy, r):
+        k = 0.5523 * r
+        contour = BooleanContour()
+        contour._points = [
+            ('curve', (cx + r, cy), False, None), (None, (cx + r, cy + k), False, None), (None, (cx + k, cy + r), False, None),
+            ('curve', (cx, cy + r), False, None), (None, (cx - k, cy + r), False, None), (None, (cx - r, cy + k), False, None),
+            ('curve', (cx - r, cy), False, None), (None, (cx - r, cy - k), False, None), (None, (cx - k, cy - r), False, None),
+            ('curve', (cx, cy - r), False, None), (None, (cx + k, cy - r), False, None), (None, (cx + r, cy - k), False, None),
+            ]
+        return contour
+
+    def makeNamedContour(points):
+        contour = BooleanContour()
+        contour._points = [(segmentType, pt, False, 'point%s' % index) for index, (segmentType, pt) in enumerate(points)]
+        return contour
+
+    def getSegmentData(segments):
+        return [(segment.segmentType, [point.coordinates for point in segment.points], [point.name for point in segment.points], segment.flat) for segment in segments]
+
+    def getContourData(inputContour):
+        return (
+            getSegmentData(inputContour.segments),
+            getSegmentData(inputContour.reversedSegments),
+            inputContour.clockwiseFlat,
+            inputContour.counterClockwiseFlat,
+            inputContour.getFlatSignature(True),
+            )
+
+    def matchesRotation(inputFlat, outputFlat):
+        # whole contour matching as done before signatures and point indexes
+        if len(inputFlat) != len(outputFlat):
+            return False
+        for startIndex in range(len(outputFlat)):
+            if outputFlat[startIndex:] + outputFlat[:startIndex] == inputFlat:
+                return True
+        return False
+
+    class FlattenTests(unittest.TestCase):
+
+        def setUp(self):
+            flatSegmentsCache.clear()
+
+        def test_flattening_tolerance_is_part_of_the_cache_key(self):
+            contour = makeContour(0, 0, 300)
+            default = InputContour(contour).originalFlat
+            tolerant = InputContour(contour, 1.0).originalFlat
+            self.assertNotEqual(default, tolerant)
+            self.assertEqual(InputContour(contour).originalFlat, default)
+            flatSegmentsCache.clear()
+            self.assertEqual(InputContour(contour, 1.0).originalFlat, tolerant)
+
+        def test_cached_flat_segments_match_fresh_flattening(self):
+            """Test input contours built from cached flat points against contours flattened segment by segment."""
+            contours = [
+                makeContour(0, 0, 300),
+                # a degenerate curve converted to a line, and a quadratic curve
+                makeNamedContour([('line', (0, 0)), (None, (0, 0)), (None, (100, 0)), ('curve', (100, 0)), (None, (150, 50)), (None, (120, 120)), ('qcurve', (100, 200)), ('line', (0, 200))]),
+                ]
+            for flatteningTolerance in [None, 0.5]:
+                for contour in contours:
+                    flatSegmentsCache.clear()
+                    fresh = getContourData(InputContour(contour, flatteningTolerance))
+                    cached = InputContour(contour, flatteningTolerance)
+                    self.assertEqual(getContourData(cached), fresh)
+                    if flatteningTolerance is None:
+                        # segments flattened one by one, as without the cache
+                        pointPen = ContourPointDataPen()
+                        contour.drawPoints(pointPen)
+                        segments = _convertPointsToSegments(pointPen.getData())
+                        self.assertEqual(getSegmentData(cached.segments), getSegmentData(segments))
+
+        def test_cached_flat_segments_keep_point_names(self):
+            contour = makeNamedContour([('line', (0, 0)), ('line', (0, 100)), (None, (30, 130)), (None, (70, 130)), ('curve', (100, 100)), ('line', (100, 0))])
+            InputContour(contour)
+            renamed = BooleanContour()
+            renamed._points = [(segmentType, pt, smooth, 'renamed') for segmentType, pt, smooth, name in contour._points]
+            hits = flatSegmentsCache.hits
+            inputContour = InputContour(renamed)
+            self.assertEqual(flatSegmentsCache.hits, hits + 1)
+            self.assertEqual(set([point.name for segment in inputContour.segments for point in segment.points]), set(['renamed']))
+
+        def test_output_contours_match_rotated_input_contours(self):
+            """Test whole contour matching against comparing every rotation of the flat points."""
+            contour = makeContour(0, 0, 300)
+            flat = InputContour(contour).originalFlat
+            shuffled = flat[1::2] + flat[::2]
+            moved = [flat[0]] + [(x + 1, y) for x, y in flat[1:]]
+            for outputFlat in [flat, flat[5:] + flat[:5], flat[::-1], flat[7::-1] + flat[:7:-1], shuffled, moved, flat[1:]]:
+                inputContour = InputContour(contour)
+                outputContour = OutputContour(list(outputFlat))
+                if outputContour.clockwise:
+                    expected = matchesRotation(inputContour.clockwiseFlat, outputFlat)
+                    inputSegments = inputContour.clockwiseSegments
+                else:
+                    expected = matchesRotation(inputContour.counterClockwiseFlat, outputFlat)
+                    inputSegments = inputContour.counterClockwiseSegments
+                self.assertEqual(outputContour.reCurveFromEntireInputContour(inputContour), expected)
+                self.assertEqual(outputContour.final, expected)
+                self.assertEqual(inputContour.used, expected)
+                if expected:
+                    self.assertEqual(outputContour.clockwise, inputContour.clockwise)
+                    self.assertEqual([[point.coordinates for point in segment.points] for segment in outputContour.segments], [[point.coordinates for point in segment.points] for segment in inputSegments])
+
+        def test_output_contour_final_follows_segments(self):
+            outputContour = OutputContour([(0, 0), (0, 100), (100, 100), (100, 0)])
+            self.assertFalse(outputContour.final)
+            outputContour.segments = [OutputSegment(segmentType='line', points=[OutputPoint(coordinates=(0, 0), segmentType='line')], final=True)]
+            self.assertTrue(outputContour.final)
+            outputContour.segments = outputContour.segments + [OutputSegment(segmentType='flat', points=[(0, 100)])]
+            self.assertFalse(outputContour.final)
+
+        def test_segments_and_points_are_slotted(self):
+            inputContour = InputContour(makeContour(0, 0, 300))
+            outputPoint = OutputPoint(coordinates=(0, 0), segmentType='line')
+            outputSegment = OutputSegment(segmentType='line', points=[outputPoint])
+            for item in [inputContour.segments[0], inputContour.segments[0].points[0], outputPoint, outputSegment]:
+                self.assertFalse(hasattr(item, '__dict__'))
+
+        def test_reversed_flat_points_match_reversed_segments(self):
+            """Test flat points read backwards from segments against those of the lazily built reversed segments."""
+            contours = [
+                makeContour(0, 0, 300),
+                makeNamedContour([('line', (0, 0)), (None, (0, 0)), (None, (100, 0)), ('curve', (100, 0)), (None, (150, 50)), (None, (120, 120)), ('qcurve', (100, 200)), ('line', (0, 200))]),
+                ]
+            for contour in contours:
+                inputContour = InputContour(contour)
+                reversedFlat = inputContour._getFlat(not inputContour.clockwise)
+                self.assertIsNone(inputContour._reversedSegments)
+                flat = []
+                for segment in inputContour.reversedSegments:
+                    flat.extend(segment.flat)
+                self.assertEqual(reversedFlat, flat)
+                self.assertEqual(len(inputContour.reversedSegments), len(inputContour.segments))
+
+    unittest.main()
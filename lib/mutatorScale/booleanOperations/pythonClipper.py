@@ -0,0 +1,431 @@
+"""
+Pure Python polygon clipping, a fallback for the Clipper library
+with the same clipExecute() entry point as the bundled pyClipper module.
+
+Contours have integer coordinates.
+- Edges are split where they cross, crossing points being rounded to integers as Clipper does,
+  until rounding leaves no edge crossing another, and coincident edges are merged,
+  each one keeping the sum of the windings of the edges it stands for.
+- An edge is kept if the result is filled on one side of it only,
+  the fill on either side being found from winding numbers of subject and clip contours.
+- Kept edges are linked into contours, outer contours running counter-clockwise and holes clockwise,
+  collinear points are removed.
+Crossing points are rounded differently from Clipper, so that results only match Clipper's
+to within a unit or so around crossings, which shows on contours a few units wide.
+"""
+
+from math import atan2, pi
+
+
+_fillRules = {
+    "evenOdd": lambda winding: winding % 2 == 1,
+    "noneZero": lambda winding: winding != 0,
+    "positive": lambda winding: winding > 0,
+    "negative": lambda winding: winding < 0,
+}
+
+_operations = {
+    "union": lambda subject, clip: subject or clip,
+    "intersection": lambda subject, clip: subject and clip,
+    "difference": lambda subject, clip: subject and not clip,
+    "xor": lambda subject, clip: subject != clip,
+}
+
+
+def clipExecute(subjectContours, clipContours, operation, subjectFillType="noneZero", clipFillType="noneZero"):
+    """
+    Return the contours resulting from a boolean operation between subject and clip contours,
+    as lists of (x, y) integer points.
+    """
+    operation = _operations[operation]
+    subjectFilled = _fillRules[subjectFillType]
+    clipFilled = _fillRules[clipFillType]
+
+    edges = _getEdges(subjectContours, 0) + _getEdges(clipContours, 1)
+    windings = _mergeEdges(_nodeEdges(edges))
+    edgeList = [(a, b, windingDeltas) for (a, b), windingDeltas in windings.items()]
+    bands = _Bands(edgeList, 1)
+
+    directedEdges = []
+    for chain in _getChains(edgeList):
+        # fills on both sides are the same all along a chain, they're found on one of its edges
+        index = chain[0][0]
+        for edgeIndex, forward in chain:
+            if edgeList[edgeIndex][0][1] != edgeList[edgeIndex][1][1]:
+                index = edgeIndex
+                break
+        a, b, (subjectDelta, clipDelta) = edgeList[index]
+        if a[1] != b[1]:
+            # cast a ray towards -x from the middle of the edge,
+            # windings are those left of the edge, right of it they include the edge's
+            subjectWinding, clipWinding = _getRayWindings(edgeList, bands.get(a[1] + b[1]), index, 1)
+            sign = -1 if b[1] > a[1] else 1
+        else:
+            # cast a ray towards -y from the middle of the horizontal edge,
+            # windings are those below the edge, above it they include the edge's
+            subjectWinding, clipWinding = _getRayWindings(edgeList, range(len(edgeList)), index, 0)
+            sign = 1
+        filledBefore = operation(subjectFilled(subjectWinding), clipFilled(clipWinding))
+        filledAfter = operation(subjectFilled(subjectWinding + sign * subjectDelta), clipFilled(clipWinding + sign * clipDelta))
+        if filledBefore == filledAfter:
+            continue
+        # the result is kept on the left of edges,
+        # left of the edge going from a to b is before it when it goes up, after it otherwise
+        if a[1] < b[1]:
+            filledLeft = filledBefore
+        else:
+            filledLeft = filledAfter
+        if [forward for edgeIndex, forward in chain if edgeIndex == index][0] != filledLeft:
+            chain = [(edgeIndex, not forward) for edgeIndex, forward in reversed(chain)]
+        for edgeIndex, forward in chain:
+            a, b, windingDeltas = edgeList[edgeIndex]
+            if forward:
+                directedEdges.append((a, b))
+            else:
+                directedEdges.append((b, a))
+
+    contours = []
+    for contour in _linkEdges(directedEdges):
+        contour = _removeCollinearPoints(contour)
+        if len(contour) > 2:
+            contours.append(contour)
+    return contours
+
+
+# -----
+# Edges
+# -----
+
+def _getEdges(contours, kind):
+    """Return the edges of contours as (start, end, kind) tuples, leaving out repeated points."""
+    edges = []
+    for contour in contours:
+        points = []
+        for x, y in contour:
+            point = int(x), int(y)
+            if not points or points[-1] != point:
+                points.append(point)
+        while len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        if len(points) < 3:
+            continue
+        previous = points[-1]
+        for point in points:
+            edges.append((previous, point, kind))
+            previous = point
+    return edges
+
+
+def _roundDivision(numerator, denominator):
+    """Round numerator / denominator to the nearest integer, halves away from zero."""
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    if numerator < 0:
+        return -((-numerator * 2 + denominator) // (denominator * 2))
+    return (numerator * 2 + denominator) // (denominator * 2)
+
+
+def _cross(ox, oy, ax, ay, bx, by):
+    return (ax - ox) * (by - oy) - (ay - oy) * (bx - ox)
+
+
+def _getIntersections((p1, q1, kind1), (p2, q2, kind2)):
+    """Return the points where two edges meet, crossing points rounded to integers."""
+    (x1, y1), (x2, y2) = p1, q1
+    (x3, y3), (x4, y4) = p2, q2
+    denominator = (x2 - x1) * (y4 - y3) - (y2 - y1) * (x4 - x3)
+    if denominator == 0:
+        # parallel edges only meet if collinear, at end points lying on the other edge
+        if _cross(x1, y1, x2, y2, x3, y3) != 0:
+            return []
+        points = []
+        for (x, y), (ax, ay), (bx, by) in [(p2, p1, q1), (q2, p1, q1), (p1, p2, q2), (q1, p2, q2)]:
+            if 0 < (x - ax) * (bx - ax) + (y - ay) * (by - ay) < (bx - ax) ** 2 + (by - ay) ** 2:
+                points.append((x, y))
+        return points
+    t = (x3 - x1) * (y4 - y3) - (y3 - y1) * (x4 - x3)
+    u = (x3 - x1) * (y2 - y1) - (y3 - y1) * (x2 - x1)
+    if denominator < 0:
+        denominator, t, u = -denominator, -t, -u
+    if not (0 <= t <= denominator and 0 <= u <= denominator):
+        return []
+    return [(_roundDivision(x1 * denominator + (x2 - x1) * t, denominator), _roundDivision(y1 * denominator + (y2 - y1) * t, denominator))]
+
+
+def _nodeEdges(edges):
+    """
+    Split edges where they meet until no edge crosses another or passes through its end points.
+    Rounding crossing points moves the pieces of split edges slightly, so that they may cross edges they didn't cross before,
+    windings are only consistent once no such crossing is left.
+    """
+    while True:
+        edges, isSplit = _splitEdges(edges)
+        if not isSplit:
+            return edges
+
+
+def _splitEdges(edges):
+    """
+    Split edges at the points where they meet other edges.
+    Return the split edges and whether any edge was split.
+    """
+    splits = [[] for edge in edges]
+    # sweep along x, only comparing edges whose x ranges overlap
+    boxes = [(min(p[0], q[0]), min(p[1], q[1]), max(p[0], q[0]), max(p[1], q[1])) for p, q, kind in edges]
+    order = sorted(range(len(edges)), key=lambda index: boxes[index][0])
+    active = []
+    for index in order:
+        xMin, yMin, xMax, yMax = boxes[index]
+        active = [other for other in active if boxes[other][2] >= xMin]
+        for other in active:
+            if boxes[other][1] > yMax or boxes[other][3] < yMin:
+                continue
+            for point in _getIntersections(edges[index], edges[other]):
+                splits[index].append(point)
+                splits[other].append(point)
+        active.append(index)
+
+    splitEdges = []
+    isSplit = False
+    for (p, q, kind), points in zip(edges, splits):
+        points = [point for point in points if point != p and point != q]
+        if not points:
+            splitEdges.append((p, q, kind))
+            continue
+        isSplit = True
+        dx, dy = q[0] - p[0], q[1] - p[1]
+        points = sorted(set(points), key=lambda point: (point[0] - p[0]) * dx + (point[1] - p[1]) * dy)
+        previous = p
+        for point in points + [q]:
+            splitEdges.append((previous, point, kind))
+            previous = point
+    return splitEdges, isSplit
+
+
+def _mergeEdges(edges):
+    """
+    Return a dict of edges as (a, b) point pairs, a being the lowest point, and the windings they add to the left
+    of subject and clip contours going from a to b. Edges cancelling each other out are left out.
+    """
+    windings = {}
+    for p, q, kind in edges:
+        if p == q:
+            continue
+        if p < q:
+            key, delta = (p, q), 1
+        else:
+            key, delta = (q, p), -1
+        windingDeltas = windings.get(key)
+        if windingDeltas is None:
+            windingDeltas = windings[key] = [0, 0]
+        windingDeltas[kind] += delta
+    return dict([(edge, deltas) for edge, deltas in windings.items() if deltas != [0, 0]])
+
+
+def _getChains(edges):
+    """
+    Return chains of edges, given as (a, b, windingDeltas) tuples, meeting no other edge at the points joining them,
+    as lists of (edgeIndex, forward) tuples, forward being True if the chain goes from a to b along the edge.
+    """
+    pointEdges = {}
+    for index, (a, b, windingDeltas) in enumerate(edges):
+        pointEdges.setdefault(a, []).append(index)
+        pointEdges.setdefault(b, []).append(index)
+
+    def follow(index, point):
+        # return edges following an edge at one of its points, oriented away from it
+        chain = []
+        while len(pointEdges[point]) == 2:
+            first, second = pointEdges[point]
+            index = second if first == index else first
+            if visited[index]:
+                break
+            visited[index] = True
+            a, b, windingDeltas = edges[index]
+            chain.append((index, a == point))
+            point = b if a == point else a
+        return chain
+
+    visited = [False] * len(edges)
+    chains = []
+    for index, (a, b, windingDeltas) in enumerate(edges):
+        if visited[index]:
+            continue
+        visited[index] = True
+        after = follow(index, b)
+        before = follow(index, a)
+        chain = [(edgeIndex, not forward) for edgeIndex, forward in reversed(before)] + [(index, True)] + after
+        chains.append(chain)
+    return chains
+
+
+class _Bands(object):
+
+    """Edges indexed by bands of coordinates along an axis, to find those a ray along the other axis may cross."""
+
+    def __init__(self, edges, axis):
+        self.axis = axis
+        self.bands = {}
+        if not edges:
+            return
+        values = [point[axis] for a, b, windingDeltas in edges for point in (a, b)]
+        self.low = min(values)
+        self.size = max(1, (max(values) - self.low) // max(1, int(len(edges) ** .5)) + 1)
+        for index, (a, b, windingDeltas) in enumerate(edges):
+            if a[axis] == b[axis]:
+                continue
+            for band in range(self._getBand(min(a[axis], b[axis])), self._getBand(max(a[axis], b[axis])) + 1):
+                self.bands.setdefault(band, []).append(index)
+
+    def _getBand(self, value):
+        return int((value - self.low) // self.size)
+
+    def get(self, doubledValue):
+        """Return indexes of edges that may cross a ray at doubledValue / 2 along the axis."""
+        return self.bands.get(self._getBand(doubledValue / 2.0), [])
+
+
+def _getRayWindings(edges, candidates, index, axis):
+    """
+    Return subject and clip windings at the middle of an edge, not counting the edge itself,
+    from candidate edges a ray crosses towards -x if axis is 1, towards -y if axis is 0.
+    Coordinates are doubled to keep the middle of the edge on integers.
+    """
+    other = 1 - axis
+    a, b, windingDeltas = edges[index]
+    middle = a[axis] + b[axis]
+    position = a[other] + b[other]
+    subjectWinding = clipWinding = 0
+    for candidate in candidates:
+        if candidate == index:
+            continue
+        c, d, (subjectDelta, clipDelta) = edges[candidate]
+        c0, d0 = c[axis] * 2, d[axis] * 2
+        # half open range along the axis so rays crossing vertices are only counted once
+        if not (c0 <= middle < d0 or d0 <= middle < c0):
+            continue
+        # compare the crossing position with the middle of the edge, along the ray
+        span = d0 - c0
+        crossing = c[other] * 2 * span + (middle - c0) * (d[other] - c[other]) * 2
+        if span > 0:
+            isBefore = crossing < position * span
+        else:
+            isBefore = crossing > position * span
+        if not isBefore:
+            continue
+        # towards -x, edges going down wind counter-clockwise, towards -y edges going right do
+        if axis == 1:
+            sign = -1 if d[1] > c[1] else 1
+        else:
+            sign = 1 if d[0] > c[0] else -1
+        subjectWinding += sign * subjectDelta
+        clipWinding += sign * clipDelta
+    return subjectWinding, clipWinding
+
+
+# --------
+# Contours
+# --------
+
+def _linkEdges(directedEdges):
+    """
+    Link directed edges into closed contours.
+    Where several edges leave a point, the one turning the most to the left is followed,
+    so contours touching at a point are kept apart.
+    """
+    outgoing = {}
+    for start, end in directedEdges:
+        outgoing.setdefault(start, []).append(end)
+    contours = []
+    for start, end in directedEdges:
+        if end not in outgoing.get(start, []):
+            continue
+        outgoing[start].remove(end)
+        contour = [start]
+        previous, current = start, end
+        while current != start:
+            contour.append(current)
+            candidates = outgoing.get(current)
+            if not candidates:
+                break
+            if len(candidates) == 1:
+                following = candidates[0]
+            else:
+                backAngle = atan2(previous[1] - current[1], previous[0] - current[0])
+                following = min(candidates, key=lambda point: (backAngle - atan2(point[1] - current[1], point[0] - current[0])) % (2 * pi) or 2 * pi)
+            candidates.remove(following)
+            previous, current = current, following
+        else:
+            contours.append(contour)
+    return contours
+
+
+def _removeCollinearPoints(contour):
+    """Remove points lying on the line of their neighbours, and repeated points."""
+    changed = True
+    while changed and len(contour) > 2:
+        changed = False
+        points = []
+        count = len(contour)
+        for index, point in enumerate(contour):
+            previous = points[-1] if points else contour[index - 1]
+            following = contour[(index + 1) % count]
+            if point == previous or _cross(previous[0], previous[1], point[0], point[1], following[0], following[1]) == 0:
+                changed = True
+                continue
+            points.append(point)
+        contour = points
+    return contour
+
+
+if __name__ == '__main__':
+
+    import random
+    import unittest
+
+    try:
+        import pyclipper
+    except ImportError:
+        pyclipper = None
+
+    def getArea(contours):
+        return sum([sum([contour[i - 1][0] * contour[i][1] - contour[i][0] * contour[i - 1][1] for i in range(len(contour))]) for contour in contours]) / 2.0
+
+    def makeContours(random, count, size):
+        return [[(random.randint(0, size), random.randint(0, size)) for i in range(random.randint(3, 7))] for j in range(count)]
+
+    class PythonClipperTests(unittest.TestCase):
+
+        def test_squares(self):
+            subject = [[(0, 0), (0, 100), (100, 100), (100, 0)]]
+            clip = [[(50, 50), (50, 150), (150, 150), (150, 50)]]
+            self.assertEqual([getArea(clipExecute(subject, clip, operation)) for operation in ["union", "difference", "intersection", "xor"]],
+                [17500, 7500, 2500, 15000])
+
+        def test_winding_after_rounding(self):
+            # rounding crossing points of these self-intersecting contours makes split edges cross others
+            subject = [
+                [(341, 615), (782, 378), (571, 223), (81, 266), (891, 565), (925, 458), (277, 787)],
+                [(12, 671), (91, 115), (885, 40), (239, 989), (421, 115), (167, 241), (744, 102)],
+                [(378, 971), (910, 294), (253, 477), (100, 652), (39, 10), (983, 295), (597, 450)],
+                ]
+            self.assertAlmostEqual(getArea(clipExecute(subject, [], "union", "negative", "negative")), 51381, delta=100)
+
+        @unittest.skipIf(pyclipper is None, "pyclipper is not installed")
+        def test_matches_pyclipper(self):
+            import clipperBackends
+            reference = clipperBackends.PyclipperBackend()
+            generator = random.Random(1)
+            # large enough for crossing points rounded either way to make little difference
+            size = 100000
+            for operation in ["union", "difference", "intersection", "xor"]:
+                for subjectFillType in ["evenOdd", "noneZero", "positive", "negative"]:
+                    for clipFillType in ["evenOdd", "noneZero", "positive", "negative"]:
+                        for i in range(10):
+                            subject = makeContours(generator, 3, size)
+                            clip = makeContours(generator, 2, size)
+                            expected = getArea(reference.clipExecute(subject, clip, operation, subjectFillType, clipFillType))
+                            result = getArea(clipExecute(subject, clip, operation, subjectFillType, clipFillType))
+                            self.assertTrue(abs(result - expected) <= size * 10, (operation, subjectFillType, clipFillType, subject, clip))
+
+    unittest.main()
@@ -1,11 +1,251 @@
 #coding=utf-8
 from __future__ import division
 
+import weakref
+
 from mutatorScale.objects.mathGlyph import MathGlyph
-from mutatorScale.utilities.fontUtils import makeListFontName, getRefStems, getSlantAngle
+from mutatorScale.utilities.fontUtils import FontAnalysis, makeListFontName, getRefStems, getSlantAngle
+from mutatorScale.utilities.cacheUtils import LRUCache
+from mutatorScale.utilities.boundsUtils import getMathGlyphBounds
+from mutatorScale.utilities.hashUtils import getGlyphHash
+from mutatorScale.utilities.stemUtils import getSampledRefStems
 
 from fontTools.pens.boundsPen import BoundsPen
 
+class LazyGlyphSet(object):
+    """
+    Read-only mapping of glyph names to the glyphs of a font (Robofab, Defcon or GlifFont).
+    Glyph names are read from the font’s glyph name list and glyphs are only fetched
+    when first asked for, so memory and startup scale with the glyphs actually used.
+    If keepGlyphs is False, glyphs are not retained once they have been returned.
+    """
+    def __init__(self, font, keepGlyphs=True):
+        self._font = font
+        self._glyphNames = set(font.keys())
+        self._glyphs = {}
+        self.keepGlyphs = keepGlyphs
+
+    def __repr__(self):
+        return '<{className} {loaded}/{total} glyphs loaded>'.format(className=self.__class__.__name__, loaded=len(self._glyphs), total=len(self._glyphNames))
+
+    def __getitem__(self, glyphName):
+        if glyphName in self._glyphs:
+            return self._glyphs[glyphName]
+        if glyphName not in self._glyphNames:
+            raise KeyError(glyphName)
+        glyph = self._font[glyphName]
+        if self.keepGlyphs:
+            self._glyphs[glyphName] = glyph
+        return glyph
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphNames
+
+    def __iter__(self):
+        return iter(self._glyphNames)
+
+    def __len__(self):
+        return len(self._glyphNames)
+
+    def keys(self):
+        return list(self._glyphNames)
+
+    def get(self, glyphName, default=None):
+        if glyphName in self._glyphNames:
+            return self[glyphName]
+        return default
+
+    def getLoadedGlyphNames(self):
+        return self._glyphs.keys()
+
+    def dropGlyphs(self, glyphNames=None):
+        """Release loaded glyphs, all of them if no glyphNames are provided."""
+        if glyphNames is None:
+            self._glyphs.clear()
+        else:
+            for glyphName in glyphNames:
+                self._glyphs.pop(glyphName, None)
+
+class MasterData(object):
+    """
+    Scale independent data of a master font: glyph set, metrics, names, slant angle and reference stems.
+    Slant angle and stems are only measured when first asked for, through a FontAnalysis
+    so that glyphs are frozen once for all measurements.
+    MasterData objects are handed out by the masterRegistry and shared by all ScaleFonts wrapping the same font.
+
+    Glyph edits are tracked with a version number per glyph, which ScaleFonts use to key their scaled glyphs,
+    and counted in version, which increases with every change to the font.
+    Fonts posting Defcon notifications (Defcon fonts or fonts wrapping one) report changes themselves,
+    other fonts are checked against content hashes recorded when glyphs are scaled, see checkForChanges().
+    Fonts with a true readOnly attribute are not tracked at all.
+    Measured stems are kept until glyphs they were measured on change.
+    close() stops observing the font once the MasterData is no longer used.
+    """
+    def __init__(self, font, keepGlyphs=True):
+        self.font = font
+        self.glyphSet = LazyGlyphSet(font, keepGlyphs)
+        self.glyphBounds = {}
+        self.heights = { heightName:getattr(font.info, heightName) for heightName in ['capHeight','ascender','xHeight','descender'] }
+        self.name = makeListFontName(font)
+        self.familyName, self.styleName = font.info.familyName, font.info.styleName
+        self.analysis = FontAnalysis(font)
+        self._referenceGlyphNames = set(['I', 'H'])
+        self.glyphVersions = {}
+        self.version = 0
+        self._glyphHashes = {}
+        self._refStems = {}
+        self._users = 0
+        self._dispatcher = None
+        self._observing = self._observeFont(font)
+        self._tracking = not self._observing and not getattr(font, 'readOnly', False)
+
+    def __repr__(self):
+        return '<{className} {fontName}>'.format(className=self.__class__.__name__, fontName=self.name)
+
+    def getItalicAngle(self):
+        self._trackReferenceGlyphs()
+        return -getSlantAngle(self.font, True, self.analysis)
+
+    def getRefStems(self, slantedSection=False, stemSample=None):
+        """
+        Return reference stems measured on single cuts of I and H,
+        or on stem histograms of a sample of glyphs if a stemSample list of glyph names is provided.
+        """
+        key = slantedSection, tuple(stemSample) if stemSample is not None else None
+        if key in self._refStems:
+            return self._refStems[key]
+        if stemSample is not None:
+            self._referenceGlyphNames.update(stemSample)
+        self._trackReferenceGlyphs()
+        if stemSample is not None:
+            stems = getSampledRefStems(self.font, stemSample, slantedSection, analysis=self.analysis)
+        else:
+            stems = getRefStems(self.font, slantedSection, self.analysis)
+        self._refStems[key] = stems
+        return stems
+
+    def _trackReferenceGlyphs(self):
+        if not self._tracking:
+            return
+        for glyphName in self._referenceGlyphNames:
+            if glyphName in self.glyphSet:
+                self.trackGlyph(glyphName)
+
+    def _observeFont(self, font):
+        """Subscribe to glyph change notifications, return False if the font doesn’t post any."""
+        if hasattr(font, 'naked'):
+            font = font.naked()
+        dispatcher = getattr(font, 'dispatcher', None)
+        if dispatcher is None:
+            return False
+        dispatcher.addObserver(self, '_glyphChangedNotification', 'Glyph.Changed')
+        self._dispatcher = dispatcher
+        return True
+
+    def close(self):
+        """Stop observing glyph changes of the font."""
+        if self._observing:
+            self._dispatcher.removeObserver(self, 'Glyph.Changed')
+            self._dispatcher = None
+            self._observing = False
+
+    def _glyphChangedNotification(self, notification):
+        self.invalidateGlyphs([notification.object.name])
+
+    def getGlyphVersion(self, glyphName):
+        return self.glyphVersions.get(glyphName, 0)
+
+    def trackGlyph(self, glyphName):
+        """Record a glyph’s content hash if changes to this font are detected by hashing."""
+        if self._tracking and glyphName not in self._glyphHashes:
+            self._glyphHashes[glyphName] = getGlyphHash(self.glyphSet[glyphName])
+
+    def checkForChanges(self):
+        """
+        Compare tracked glyphs to their recorded content hashes,
+        invalidate the ones that changed and return their names.
+        """
+        changedGlyphNames = []
+        for glyphName, glyphHash in self._glyphHashes.items():
+            if glyphName not in self.font or getGlyphHash(self.font[glyphName]) != glyphHash:
+                changedGlyphNames.append(glyphName)
+        if changedGlyphNames:
+            self.invalidateGlyphs(changedGlyphNames)
+        return changedGlyphNames
+
+    def invalidateGlyphs(self, glyphNames):
+        """
+        Mark glyphs as changed: their version is increased and data derived from them is dropped,
+        slant angle and stems are only measured again if glyphs they were measured on changed.
+        """
+        glyphNames = set(glyphNames)
+        self.version += 1
+        for glyphName in glyphNames:
+            self.glyphVersions[glyphName] = self.glyphVersions.get(glyphName, 0) + 1
+            self._glyphHashes.pop(glyphName, None)
+            self.glyphBounds.pop(glyphName, None)
+        self.glyphSet.dropGlyphs(glyphNames)
+        # bounds of composites may depend on the changed glyphs
+        for glyphName in self.glyphBounds.keys():
+            if len(self.glyphSet[glyphName].components):
+                del self.glyphBounds[glyphName]
+        # so may stems measured on composites
+        referenceGlyphNames = [glyphName for glyphName in self._referenceGlyphNames if glyphName in self.glyphSet]
+        if glyphNames & self._referenceGlyphNames or any([len(self.glyphSet[glyphName].components) for glyphName in referenceGlyphNames]):
+            self._refStems.clear()
+        self.analysis.invalidateGlyphs(glyphNames)
+
+class MasterRegistry(object):
+    """
+    Process-wide registry of MasterData, keyed by font identity.
+    Entries are weakly referenced, they live as long as a ScaleFont uses them,
+    so engines built over the same fonts share glyph sets and measurements.
+    MasterData stop observing their font once all ScaleFonts using them are closed, see release().
+
+    The content version of a font is derived from its changes: MasterData.version increases with every edit
+    reported by notifications or found by checkForChanges(), and shared data is updated in place glyph by glyph,
+    so all users of an entry follow edits to the font without a new entry being made.
+    The optional version argument of get() is a caller tag on top of it, for fonts whose changes can't be tracked
+    (read only fonts replaced in place): ScaleFonts created with different tags get separate MasterData.
+    """
+    def __init__(self):
+        self._entries = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, font, version=None, keepGlyphs=True):
+        """
+        Return the MasterData for a font and version tag, creating it if no ScaleFont currently uses it.
+        Each call must be matched by a release() once the MasterData is no longer used.
+        """
+        key = (id(font), version, keepGlyphs)
+        masterData = self._entries.get(key)
+        if masterData is None:
+            masterData = MasterData(font, keepGlyphs)
+            self._entries[key] = masterData
+        masterData._users += 1
+        return masterData
+
+    def release(self, masterData):
+        """Mark a MasterData returned by get() as no longer used, the last release closes it."""
+        masterData._users -= 1
+        if masterData._users > 0:
+            return
+        for key, value in self._entries.items():
+            if value is masterData:
+                self._entries.pop(key, None)
+        masterData.close()
+
+    def discard(self, font):
+        """Stop handing out existing MasterData for a font, ScaleFonts created afterwards get fresh data."""
+        fontId = id(font)
+        for key in self._entries.keys():
+            if key[0] == fontId:
+                self._entries.pop(key, None)
+
+masterRegistry = MasterRegistry()
+
 class ScaleFont(object):
     """
     A ScaleFont takes a font object (Robofab or Defcon) and a scale setting,
@@ -17,13 +257,32 @@ class ScaleFont(object):
     Or:
         smallFont = ScaleFont(font)
         smallFont.setScale((1.05, 490, 'capHeight'))
+
+    Source glyphs are only loaded from the font when first used,
+    with keepGlyphs=False they are not retained after use.
+
+    Scaled glyphs are kept in a bounded LRU cache keyed by (glyphName, scale),
+    of which cacheSize sets the capacity (0 disables caching).
+    Callers always receive copies, so editing them leaves the cache untouched.
+
+    If italicAngle is provided, it is used as is instead of measuring the font’s slant.
+    Cached scaled glyphs are also keyed by slant angle and glyph version, edits to a glyph
+    only make its own scaled versions stale.
+
+    Scale independent data is obtained from the masterRegistry and shared with other ScaleFonts
+    wrapping the same font with the same version tag, each ScaleFont only holds its own scale and scaled glyphs.
+    Edits to the font are followed by the shared data, see MasterRegistry for what version tags are for.
     """
-    def __init__(self, font, scale=None):
-        self.glyphSet = {glyph.name:glyph for glyph in font}
+    def __init__(self, font, scale=None, keepGlyphs=True, cacheSize=128, italicAngle=None, version=None):
+        self.masterData = masterRegistry.get(font, version, keepGlyphs)
+        self.glyphSet = self.masterData.glyphSet
+        self._scaledGlyphs = LRUCache(cacheSize)
+        self._glyphBounds = self.masterData.glyphBounds
         self.scale = scale
-        self.heights = { heightName:getattr(font.info, heightName) for heightName in ['capHeight','ascender','xHeight','descender'] }
-        self.name = makeListFontName(font)
-        self.italicAngle = -getSlantAngle(font, True)
+        self.heights = self.masterData.heights
+        self.name = self.masterData.name
+        self.familyName, self.styleName = self.masterData.familyName, self.masterData.styleName
+        self._italicAngle = italicAngle
 
         if scale is not None:
             self.setScale(scale)
@@ -40,6 +299,26 @@ class ScaleFont(object):
     def keys(self):
         return self.glyphSet.keys()
 
+    def _get_italicAngle(self):
+        if self._italicAngle is not None:
+            return self._italicAngle
+        return self.masterData.getItalicAngle()
+
+    def _set_italicAngle(self, italicAngle):
+        self._italicAngle = italicAngle
+
+    italicAngle = property(_get_italicAngle, _set_italicAngle, doc="Slant angle of the font, measured unless it was set.")
+
+    def checkForChanges(self):
+        """Detect edits to glyphs of the font, return the names of the glyphs that changed."""
+        return self.masterData.checkForChanges()
+
+    def close(self):
+        """Release the master data, the ScaleFont must not be used afterwards."""
+        if self.masterData is not None:
+            masterRegistry.release(self.masterData)
+            self.masterData = None
+
     def getXScale(self):
         if self.scale is not None:
             return self.scale[0]
@@ -63,7 +342,7 @@ class ScaleFont(object):
             – referenceHeight can be either a string or float/int.
         """
         if len(scale) == 2:
-            self.scale = scale
+            self.scale = tuple(scale)
 
         elif len(scale) == 3:
             x, targetHeight, referenceHeight = scale
@@ -107,21 +386,44 @@ class ScaleFont(object):
         return
 
     def _getGlyphBounds(self, glyphName):
-        glyph = self.glyphSet[glyphName]
-        pen = BoundsPen(self.glyphSet)
-        glyph.draw(pen)
-        return pen.bounds
+        if glyphName not in self._glyphBounds:
+            glyph = self.glyphSet[glyphName]
+            if isinstance(glyph, MathGlyph):
+                bounds = getMathGlyphBounds(glyph, self.glyphSet)
+            else:
+                pen = BoundsPen(self.glyphSet)
+                glyph.draw(pen)
+                bounds = pen.bounds
+            self._glyphBounds[glyphName] = bounds
+        return self._glyphBounds[glyphName]
 
     def getGlyph(self, glyphName):
         """Return a scaled glyph as a MathGlyph instance."""
         if glyphName in self.glyphSet:
-            glyph = self.glyphSet[glyphName]
             scale = self.scale
-            scaledGlyph = self._scaleGlyph(glyph, scale)
-            return scaledGlyph
+            key = (glyphName, scale, self.italicAngle, self.masterData.getGlyphVersion(glyphName))
+            scaledGlyph = self._scaledGlyphs.get(key)
+            if scaledGlyph is None:
+                self.masterData.trackGlyph(glyphName)
+                glyph = self.glyphSet[glyphName]
+                scaledGlyph = self._scaleGlyph(glyph, scale)
+                self._scaledGlyphs[key] = scaledGlyph
+            return scaledGlyph.copy()
         else:
             return KeyError
 
+    def setCacheSize(self, cacheSize):
+        """Set the maximum number of scaled glyphs kept in cache, 0 disables caching."""
+        self._scaledGlyphs.setCapacity(cacheSize)
+
+    def getCacheInfo(self):
+        """Return a dict reporting hits, misses, hit rate, size and capacity of the scaled glyph cache."""
+        return self._scaledGlyphs.getStats()
+
+    def clearCache(self):
+        self._scaledGlyphs.clear()
+        self._glyphBounds.clear()
+
     def extractGlyph(self, glyphName, glyph):
         scaledGlyph = self.getGlyph(glyphName)
         for attribute in ['name','unicodes','width']:
@@ -155,21 +457,27 @@ class ScaleFont(object):
         return glyph
 
 class MutatorScaleFont(ScaleFont):
-    """ Subclass extending a ScaleFont and adding reference stem values to be used inside a MutatorScaleEngine."""
+    """
+    Subclass extending a ScaleFont and adding reference stem values to be used inside a MutatorScaleEngine.
+    Unless provided, stems are measured on I and H, or on stem histograms of the glyphs in stemSample if it is set.
+    """
 
-    def __init__(self, font, scale=(1, 1), vstem=None, hstem=None, stemsWithSlantedSection=False):
-        super(MutatorScaleFont, self).__init__(font, scale)
+    def __init__(self, font, scale=(1, 1), vstem=None, hstem=None, stemsWithSlantedSection=False, keepGlyphs=True, cacheSize=128, italicAngle=None, version=None, stemSample=None):
+        super(MutatorScaleFont, self).__init__(font, scale, keepGlyphs, cacheSize, italicAngle, version)
         self._refVstem, self._refHstem = None, None
+        self._measuredStems = False
+        self._stemsVersion = 0
         self.stemsWithSlantedSection = stemsWithSlantedSection
+        self.stemSample = stemSample
         self.processDimensions(font, vstem, hstem)
 
     def __repr__(self):
-        return '<{className} {fontName} v:{vstem} h:{hstem}>'.format(className=self.__class__.__name__, fontName=self.name, vstem=self._refVstem, hstem=self._refHstem)
+        return '<{className} {fontName} v:{vstem} h:{hstem}>'.format(className=self.__class__.__name__, fontName=self.name, vstem=self.vstem, hstem=self.hstem)
 
     def processDimensions(self, font, vstem, hstem):
         if vstem is None and hstem is None:
-            refVstem, refHstem = getRefStems(font, self.stemsWithSlantedSection)
-            self._refVstem, self._refHstem = refVstem, refHstem
+            # measured stems are read from master data, so they follow edits to the glyphs they’re measured on
+            self._measuredStems = True
         elif hstem is None:
             self._refVstem = vstem
             self._refHstem = vstem
@@ -181,24 +489,41 @@ class MutatorScaleFont(ScaleFont):
     def getStems(self):
         return self.vstem, self.hstem
 
+    def getStemsVersion(self):
+        """Return a value that changes whenever stems may have changed, through edits to the font or set stems."""
+        return self.masterData.version, self._stemsVersion
+
     def setStems(self, stems):
         vstem, hstem = stems
         self.vstem = vstem
         self.hstem = hstem
 
+    def _fixStems(self):
+        if self._measuredStems:
+            self._refVstem, self._refHstem = self.masterData.getRefStems(self.stemsWithSlantedSection, self.stemSample)
+            self._measuredStems = False
+
     @property
     def vstem(self):
+        if self._measuredStems:
+            return self.masterData.getRefStems(self.stemsWithSlantedSection, self.stemSample)[0]
         return self._refVstem
     @vstem.setter
     def vstem(self, stem):
+        self._fixStems()
         self._refVstem = stem
+        self._stemsVersion += 1
 
     @property
     def hstem(self):
+        if self._measuredStems:
+            return self.masterData.getRefStems(self.stemsWithSlantedSection, self.stemSample)[1]
         return self._refHstem
     @hstem.setter
     def hstem(self, stem):
+        self._fixStems()
         self._refHstem = stem
+        self._stemsVersion += 1
 
 if __name__ == '__main__':
 
@@ -261,6 +586,81 @@ if __name__ == '__main__':
                     testFont.extractGlyph(glyphName, scaledGlyph)
                     self.assertIsInstance(scaledGlyph, RGlyph)
 
+        def test_glyphs_are_loaded_on_demand(self):
+            """Test that only requested glyphs are loaded in a ScaleFont’s glyph set."""
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            font = Font(os.path.join(libFolder, u'testFonts/two-axes/regular-low-contrast.ufo'))
+            scaleFont = ScaleFont(font, (0.5, 0.4))
+            self.assertEqual(sorted(scaleFont.keys()), sorted(font.keys()))
+            scaleFont.getGlyph('H')
+            self.assertEqual(scaleFont.glyphSet.getLoadedGlyphNames(), ['H'])
+            scaleFont = ScaleFont(font, (0.5, 0.4), keepGlyphs=False)
+            scaleFont.getGlyph('H')
+            self.assertEqual(scaleFont.glyphSet.getLoadedGlyphNames(), [])
+
+        def test_scaled_glyphs_are_cached(self):
+            """Test that repeated requests are served from cache and return independent copies."""
+            self.smallFont.clearCache()
+            first = self.smallFont.getGlyph('H')
+            first.skewX(10)
+            first.contours[0][0] = ('curve', (0, 0), False, None)
+            second = self.smallFont.getGlyph('H')
+            self.assertNotEqual(first.contours, second.contours)
+            self.assertEqual(self.smallFont.getCacheInfo()['hits'], 1)
+            self.smallFont.setScale((0.6, 0.6))
+            self.smallFont.getGlyph('H')
+            self.assertEqual(self.smallFont.getCacheInfo()['misses'], 2)
+
+        def test_master_data_is_shared(self):
+            """Test that ScaleFonts wrapping the same font share glyph sets and measurements, but not scales."""
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            font = Font(os.path.join(libFolder, u'testFonts/two-axes/regular-low-contrast.ufo'))
+            first = MutatorScaleFont(font, (0.5, 0.4))
+            second = MutatorScaleFont(font, (0.8, 0.8))
+            self.assertIs(first.masterData, second.masterData)
+            self.assertIs(first.glyphSet, second.glyphSet)
+            self.assertEqual(first.getStems(), second.getStems())
+            self.assertNotEqual(first.getScale(), second.getScale())
+            other = MutatorScaleFont(font, (0.5, 0.4), version=2)
+            self.assertIsNot(first.masterData, other.masterData)
+            entries = len(masterRegistry)
+            del first, second
+            self.assertEqual(len(masterRegistry), entries - 1)
+
+        def test_master_data_follows_font_version(self):
+            """Test that edits to a font keep its MasterData shared and increase its version."""
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            font = Font(os.path.join(libFolder, u'testFonts/two-axes/regular-low-contrast.ufo'))
+            first = MutatorScaleFont(font, (0.5, 0.4))
+            version = first.masterData.version
+            font['A'].width += 10
+            second = MutatorScaleFont(font, (0.8, 0.8))
+            self.assertIs(first.masterData, second.masterData)
+            self.assertEqual(second.masterData.version, version + 1)
+            masterData = first.masterData
+            first.close()
+            self.assertTrue(font.dispatcher.hasObserver(masterData, 'Glyph.Changed', None))
+            second.close()
+            self.assertFalse(font.dispatcher.hasObserver(masterData, 'Glyph.Changed', None))
+
+        def test_edited_glyphs_are_invalidated(self):
+            """Test that editing a master glyph only invalidates that glyph, and stems follow edits to I."""
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            font = Font(os.path.join(libFolder, u'testFonts/two-axes/regular-low-contrast.ufo'))
+            scaleFont = MutatorScaleFont(font, (0.5, 0.4))
+            vstem, hstem = scaleFont.getStems()
+            scaledA, scaledH = scaleFont.getGlyph('A'), scaleFont.getGlyph('H')
+            font['A'].width += 10
+            self.assertEqual(scaleFont.getGlyph('A').width, scaledA.width + 5)
+            self.assertEqual(scaleFont.getGlyph('H').contours, scaledH.contours)
+            self.assertEqual(scaleFont.getCacheInfo()['hits'], 1)
+            for contour in font['I']:
+                for point in contour:
+                    if point.x > font['I'].width / 2:
+                        point.x += 10
+            font['I'].dirty = True
+            self.assertEqual(scaleFont.getStems(), (vstem + 10, hstem))
+
         def test_set_stems(self):
             """Test setting stems on a MutatorScaleFont."""
             self.stemedSmallFont.setStems((100, 40))
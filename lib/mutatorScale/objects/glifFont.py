@@ -0,0 +1,96 @@
+#coding=utf-8
+from __future__ import division
+
+import os
+import weakref
+
+from mutatorScale.utilities.glifUtils import readGlif, readGlyphContents, readFontInfo
+
+_infoAttributes = ['familyName', 'styleName', 'unitsPerEm', 'capHeight', 'ascender', 'xHeight', 'descender', 'italicAngle']
+
+class GlifFontInfo(object):
+    """Font info attributes read from a UFO’s fontinfo.plist, undefined values are None."""
+
+    def __init__(self, info=None):
+        for attribute in _infoAttributes:
+            setattr(self, attribute, None)
+        if info is not None:
+            for attribute, value in info.items():
+                setattr(self, attribute, value)
+
+class GlifFont(object):
+    """
+    A read-only font object reading glyphs straight from a UFO’s .glif files into MathGlyphs,
+    without building intermediate Robofab or Defcon glyph objects.
+    Glyphs are parsed on first access only.
+
+    It can stand in for a Robofab or Defcon font wherever a master font is expected:
+        masters = [GlifFont(path) for path in paths]
+        scaler = MutatorScaleEngine(masters)
+    """
+
+    readOnly = True
+
+    def __init__(self, path):
+        self.path = path
+        self.info = GlifFontInfo(readFontInfo(path))
+        self._glyphPaths = readGlyphContents(path)
+        self._glyphs = {}
+
+    def __repr__(self):
+        return '<{className} {path}>'.format(className=self.__class__.__name__, path=os.path.basename(self.path))
+
+    def __len__(self):
+        return len(self._glyphPaths)
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphPaths
+
+    def __iter__(self):
+        for glyphName in self.keys():
+            yield self[glyphName]
+
+    def __getitem__(self, glyphName):
+        if glyphName not in self._glyphs:
+            glyph = readGlif(self._glyphPaths[glyphName], glyphName)
+            glyph.getParent = weakref.ref(self)
+            self._glyphs[glyphName] = glyph
+        return self._glyphs[glyphName]
+
+    def keys(self):
+        return self._glyphPaths.keys()
+
+
+if __name__ == '__main__':
+
+    import unittest
+    from defcon import Font
+    from mutatorScale.objects.mathGlyph import MathGlyph
+
+    class GlifFontTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            singleFontPath = u'testFonts/two-axes/regular-low-contrast.ufo'
+            self.fontPath = os.path.join(libFolder, singleFontPath)
+
+        def test_glif_glyphs_match_MathGlyph_from_defcon(self):
+            """Test that GLIF parsing produces the same data as a MathGlyph built from a Defcon glyph."""
+            glifFont = GlifFont(self.fontPath)
+            defconFont = Font(self.fontPath)
+            self.assertEqual(sorted(glifFont.keys()), sorted(defconFont.keys()))
+            for glyphName in glifFont.keys():
+                glifGlyph = glifFont[glyphName]
+                mathGlyph = MathGlyph(defconFont[glyphName])
+                self.assertEqual(glifGlyph.contours, mathGlyph.contours)
+                self.assertEqual(glifGlyph.components, mathGlyph.components)
+                self.assertEqual(glifGlyph.anchors, mathGlyph.anchors)
+                self.assertEqual(glifGlyph.width, mathGlyph.width)
+                self.assertEqual(glifGlyph.unicodes, mathGlyph.unicodes)
+
+        def test_font_info(self):
+            glifFont = GlifFont(self.fontPath)
+            self.assertEqual(glifFont.info.capHeight, 750)
+            self.assertEqual(glifFont.info.styleName, 'Regular')
+
+    unittest.main()
@@ -0,0 +1,158 @@
+#coding=utf-8
+from __future__ import division
+
+import weakref
+from multiprocessing import Pool
+
+from mutatorScale.utilities.fontUtils import FontAnalysis, getRefStems, getSlantAngle
+from mutatorScale.utilities.stemUtils import getSampledRefStems
+
+'''
+Analysis of MutatorScaleFont masters in worker processes.
+Slant angle and reference stems are measured on copies of the glyphs they depend on,
+sent to workers as plain picklable data. Workers return the measurements of a FontAnalysis,
+which are added to each master’s own analysis, so masters find them cached and nothing is measured twice.
+'''
+
+class AnalysisGlyph(object):
+    """
+    A minimal read-only glyph drawing the point data collected from a master glyph as is,
+    so that it’s measured the same way as the glyph it was collected from.
+    """
+
+    def __init__(self, name, width, contours, components):
+        self.name = name
+        self.width = width
+        self.contours = contours
+        self.components = components
+
+    def drawPoints(self, pointPen):
+        for contour in self.contours:
+            pointPen.beginPath()
+            for segmentType, pt, smooth, name in contour:
+                pointPen.addPoint(pt, segmentType=segmentType, smooth=smooth, name=name)
+            pointPen.endPath()
+        for baseGlyphName, transformation in self.components:
+            pointPen.addComponent(baseGlyphName, transformation)
+
+    def draw(self, pen):
+        from robofab.pens.adapterPens import PointToSegmentPen
+        self.drawPoints(PointToSegmentPen(pen))
+
+
+class AnalysisFont(object):
+    """A minimal read-only font of AnalysisGlyphs rebuilt from the glyph data of an analysis input."""
+
+    readOnly = True
+
+    def __init__(self, glyphData):
+        self._glyphs = {}
+        for glyphName, (width, contours, components) in glyphData.items():
+            glyph = AnalysisGlyph(glyphName, width, contours, components)
+            glyph.getParent = weakref.ref(self)
+            self._glyphs[glyphName] = glyph
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphs
+
+    def __getitem__(self, glyphName):
+        return self._glyphs[glyphName]
+
+    def keys(self):
+        return self._glyphs.keys()
+
+
+def getAnalysisInput(master):
+    """Return picklable data describing what needs measuring on a MutatorScaleFont and the glyphs it’s measured on."""
+    analysis = master.masterData.analysis
+    measureStems = master._measuredStems
+    glyphNames = ['I']
+    if measureStems:
+        glyphNames += list(master.stemSample) if master.stemSample is not None else ['H']
+    glyphData = {}
+    for glyphName in analysis.getDependencies(glyphNames):
+        contours, components = analysis.getOutline(glyphName)
+        glyphData[glyphName] = analysis.font[glyphName].width, contours, components
+    return {
+        'glyphs': glyphData,
+        'measureStems': measureStems,
+        'slantedSection': master.stemsWithSlantedSection,
+        'stemSample': master.stemSample,
+        }
+
+
+def analyzeMaster(analysisInput):
+    """Measure slant angle and, if needed, reference stems on analysis input data, return the measurements made."""
+    font = AnalysisFont(analysisInput['glyphs'])
+    analysis = FontAnalysis(font)
+    getSlantAngle(font, True, analysis)
+    if analysisInput['measureStems']:
+        stemSample = analysisInput['stemSample']
+        if stemSample is not None:
+            getSampledRefStems(font, stemSample, analysisInput['slantedSection'], analysis=analysis)
+        else:
+            getRefStems(font, analysisInput['slantedSection'], analysis)
+    return analysis.getMeasurements()
+
+
+def analyzeMasters(masters, workers=None):
+    """
+    Measure MutatorScaleFont masters concurrently in a pool of worker processes.
+    Masters whose slant angle and stems are set are left out.
+    With fewer than two workers or masters, nothing is done here and masters are measured on first use as usual.
+    """
+    masters = [master for master in masters if master._measuredStems or master._italicAngle is None]
+    if workers is None or workers < 2 or len(masters) < 2:
+        return
+    analysisInputs = [getAnalysisInput(master) for master in masters]
+    pool = Pool(min(workers, len(masters)))
+    try:
+        results = pool.map(analyzeMaster, analysisInputs)
+    finally:
+        pool.close()
+        pool.join()
+    for master, measurements in zip(masters, results):
+        master.masterData.analysis.addMeasurements(measurements)
+
+
+if __name__ == '__main__':
+
+    import os
+    import unittest
+    from defcon import Font
+    from mutatorScale.objects.fonts import MutatorScaleFont
+
+    class MasterAnalysisTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            fontPath = os.path.join(libFolder, 'testFonts/two-axes/regular-low-contrast.ufo')
+            self.font = Font(fontPath)
+
+        def assertMeasuredAlike(self, font, stemSample=None):
+            master = MutatorScaleFont(font, stemSample=stemSample)
+            measurements = analyzeMaster(getAnalysisInput(master))
+            # measured on the master font, as masters are when not analyzed in workers
+            master.italicAngle
+            master.getStems()
+            masterMeasurements = master.masterData.analysis.getMeasurements()
+            self.assertEqual(sorted(masterMeasurements.keys()), sorted(measurements.keys()))
+            for key, (value, dependencies) in masterMeasurements.items():
+                self.assertEqual(value, measurements[key][0])
+
+        def test_worker_measures_like_master(self):
+            """Test that measurements made on analysis input data match those made on the master font."""
+            self.assertMeasuredAlike(self.font)
+            self.assertMeasuredAlike(self.font, ['I', 'H', 'n', 'o'])
+
+        def test_worker_measures_component_glyphs_like_master(self):
+            """Test that a composite I, with a skewed component, is measured the same way in workers."""
+            stem = self.font.newGlyph('_stem')
+            self.font['I'].drawPoints(stem.getPointPen())
+            glyph = self.font['I']
+            glyph.clearContours()
+            glyph.getPointPen().addComponent('_stem', (1, 0, 0.2, 1, 10, 0))
+            self.assertMeasuredAlike(self.font)
+            self.assertMeasuredAlike(self.font, ['I', 'H', 'n', 'o'])
+
+    unittest.main()
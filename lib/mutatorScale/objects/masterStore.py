@@ -0,0 +1,318 @@
+#coding=utf-8
+from __future__ import division
+
+import os
+import json
+import mmap
+import struct
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mutatorScale.objects.mathGlyph import MathGlyph
+from mutatorScale.objects.glifFont import GlifFontInfo
+
+'''
+Binary store of a MutatorScaleEngine’s masters.
+
+A store file holds, for each master: metrics, measured stems and slant angle,
+and for each glyph: width, unicodes, component references, anchors, contour structure
+and point coordinates. Coordinates of all glyphs are packed in a single float64 block
+which is memory-mapped when the store is reopened, so that processes reading the same store
+share page-cached data. A glyph’s coordinates are only copied out of the mapped block
+into Python values when the glyph is first accessed.
+Glyph, component, anchor and point names read back as str if they are ASCII, as unicode otherwise.
+
+File layout:
+    magic (4 bytes) | version (uint32) | header length (uint64) | JSON header | padding | float64 coordinates
+'''
+
+_magic = b'MSMS'
+_version = 1
+_prefixFormat = '<4sIQ'
+_prefixSize = struct.calcsize(_prefixFormat)
+_coordinateSize = 8
+
+# point types encoded as one character per point, upper case for smooth points
+_segmentTypeCodes = {None: 'o', 'move': 'm', 'line': 'l', 'curve': 'c', 'qcurve': 'q'}
+_segmentTypes = {code: segmentType for segmentType, code in _segmentTypeCodes.items()}
+
+
+def _decodeName(name):
+    # JSON returns unicode strings, names are read back as str where possible
+    if name is None:
+        return None
+    try:
+        return str(name)
+    except UnicodeEncodeError:
+        return name
+
+
+def _encodeGlyph(glyph, coordinates):
+    """Return the header entry of a MathGlyph and append its point coordinates to coordinates."""
+    offset = len(coordinates) // 2
+    structure = []
+    pointNames = {}
+    pointIndex = 0
+    for contour in glyph.getContourData():
+        codes = []
+        for segmentType, (x, y), smooth, name in contour:
+            code = _segmentTypeCodes[segmentType]
+            codes.append(code.upper() if smooth else code)
+            coordinates.append(x)
+            coordinates.append(y)
+            if name is not None:
+                pointNames[str(pointIndex)] = name
+            pointIndex += 1
+        structure.append(''.join(codes))
+    entry = {
+        'width': glyph.width,
+        'unicodes': list(glyph.unicodes or []),
+        'offset': offset,
+        'contours': structure,
+        'components': [[baseGlyphName, list(transformation)] for baseGlyphName, transformation in glyph.components],
+        'anchors': [[x, y, name] for (x, y), name in glyph.anchors],
+    }
+    if pointNames:
+        entry['pointNames'] = pointNames
+    return entry
+
+
+def writeMasterStore(masters, path):
+    """
+    Write MutatorScaleFont masters to a binary store at path.
+    Source glyphs are stored, not scaled ones, along with each master’s stems and slant angle.
+    """
+    coordinates = []
+    header = {'masters': []}
+    for master in masters:
+        glyphs = {}
+        for glyphName in master.keys():
+            glyph = master.glyphSet[glyphName]
+            if not isinstance(glyph, MathGlyph):
+                glyph = MathGlyph(glyph)
+            glyphs[glyphName] = _encodeGlyph(glyph, coordinates)
+        header['masters'].append({
+            'familyName': master.familyName,
+            'styleName': master.styleName,
+            'heights': master.heights,
+            'italicAngle': master.italicAngle,
+            'vstem': master.vstem,
+            'hstem': master.hstem,
+            'glyphs': glyphs,
+        })
+    headerData = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    dataOffset = _prefixSize + len(headerData)
+    padding = -dataOffset % _coordinateSize
+
+    with open(path, 'wb') as storeFile:
+        storeFile.write(struct.pack(_prefixFormat, _magic, _version, len(headerData)))
+        storeFile.write(headerData)
+        storeFile.write(b'\0' * padding)
+        if numpy is not None:
+            storeFile.write(numpy.asarray(coordinates, dtype='<f8').tostring())
+        else:
+            storeFile.write(struct.pack('<%sd' % len(coordinates), *coordinates))
+
+
+class MasterStore(object):
+    """
+    A binary master store reopened with mmap.
+    Iterating over a store yields one StoredFont per master, in the order they were written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self._file.close()
+            raise
+        magic, version, headerLength = struct.unpack_from(_prefixFormat, self._map, 0)
+        if magic != _magic:
+            self.close()
+            raise ValueError('{path} is not a master store'.format(path=path))
+        if version != _version:
+            self.close()
+            raise ValueError('{path} is a version {version} master store, version {expectedVersion} is expected'.format(path=path, version=version, expectedVersion=_version))
+        header = json.loads(self._map[_prefixSize:_prefixSize + headerLength].decode('utf-8'))
+        dataOffset = _prefixSize + headerLength
+        self._dataOffset = dataOffset + (-dataOffset % _coordinateSize)
+        self._coordinates = None
+        if numpy is not None:
+            # view on the mapped file, values are copied by getCoordinates() only
+            self._coordinates = numpy.frombuffer(self._map, dtype='<f8', offset=self._dataOffset)
+        self.fonts = [StoredFont(self, masterData) for masterData in header['masters']]
+
+    def __repr__(self):
+        return '<{className} {path} {count} masters>'.format(className=self.__class__.__name__, path=os.path.basename(self.path), count=len(self.fonts))
+
+    def __len__(self):
+        return len(self.fonts)
+
+    def __iter__(self):
+        for font in self.fonts:
+            yield font
+
+    def getCoordinates(self, offset, pointCount):
+        """Return a flat list of x, y values for pointCount points starting at point offset, copied from the mapped file."""
+        if self._coordinates is not None:
+            return self._coordinates[offset * 2:(offset + pointCount) * 2].tolist()
+        return list(struct.unpack_from('<%sd' % (pointCount * 2), self._map, self._dataOffset + offset * 2 * _coordinateSize))
+
+    def close(self):
+        self._coordinates = None
+        self._map.close()
+        self._file.close()
+
+
+class StoredFont(object):
+    """
+    A read-only font object decoding glyphs from a MasterStore into MathGlyphs on first access.
+    It can stand in for a master font, stored stems and slant angle make measuring unnecessary.
+    """
+
+    readOnly = True
+
+    def __init__(self, store, masterData):
+        self._store = store
+        self.info = GlifFontInfo({
+            'familyName': masterData['familyName'],
+            'styleName': masterData['styleName'],
+            })
+        for heightName, value in masterData['heights'].items():
+            setattr(self.info, heightName, value)
+        self.italicAngle = masterData['italicAngle']
+        self.vstem = masterData['vstem']
+        self.hstem = masterData['hstem']
+        self._glyphData = dict([(_decodeName(glyphName), entry) for glyphName, entry in masterData['glyphs'].items()])
+        self._glyphs = {}
+
+    def __repr__(self):
+        return '<{className} {familyName} {styleName}>'.format(className=self.__class__.__name__, familyName=self.info.familyName, styleName=self.info.styleName)
+
+    def __len__(self):
+        return len(self._glyphData)
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphData
+
+    def __iter__(self):
+        for glyphName in self.keys():
+            yield self[glyphName]
+
+    def __getitem__(self, glyphName):
+        if glyphName not in self._glyphs:
+            glyph = self._decodeGlyph(glyphName, self._glyphData[glyphName])
+            glyph.getParent = weakref.ref(self)
+            self._glyphs[glyphName] = glyph
+        return self._glyphs[glyphName]
+
+    def keys(self):
+        return self._glyphData.keys()
+
+    def getStems(self):
+        return self.vstem, self.hstem
+
+    def _decodeGlyph(self, glyphName, entry):
+        structure = entry['contours']
+        pointCount = sum([len(codes) for codes in structure])
+        values = self._store.getCoordinates(entry['offset'], pointCount)
+        pointNames = entry.get('pointNames', {})
+        contours = []
+        pointIndex = 0
+        for codes in structure:
+            contour = []
+            for code in codes:
+                pt = values[pointIndex * 2], values[pointIndex * 2 + 1]
+                contour.append((_segmentTypes[code.lower()], pt, code.isupper(), _decodeName(pointNames.get(str(pointIndex)))))
+                pointIndex += 1
+            contours.append(contour)
+
+        glyph = MathGlyph(None)
+        glyph.contours = contours
+        glyph.components = [(_decodeName(baseGlyphName), tuple(transformation)) for baseGlyphName, transformation in entry['components']]
+        glyph.anchors = [((x, y), _decodeName(name)) for x, y, name in entry['anchors']]
+        glyph.name = glyphName
+        glyph.unicodes = entry['unicodes']
+        glyph.width = entry['width']
+        return glyph
+
+
+if __name__ == '__main__':
+
+    import unittest
+    import glob
+    import tempfile
+    from defcon import Font
+    from mutatorScale.objects.scaler import MutatorScaleEngine
+
+    class MasterStoreTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            fontsPath = os.path.join(libFolder, 'testFonts/isotropic-anisotropic')
+            self.fontPaths = glob.glob(os.path.join(fontsPath, '*.ufo'))
+            fonts = [Font(fontPath) for fontPath in self.fontPaths]
+            self.scaler = MutatorScaleEngine(fonts)
+            self.storePath = tempfile.mktemp(suffix='.masters')
+
+        def tearDown(self):
+            if os.path.exists(self.storePath):
+                os.remove(self.storePath)
+
+        def test_stored_masters_scale_like_source_masters(self):
+            """Test that an engine reopened from a store produces the same scaled glyphs."""
+            self.scaler.saveMasters(self.storePath)
+            storedScaler = MutatorScaleEngine()
+            storedScaler.addMastersFromStore(self.storePath)
+            self.assertEqual(sorted(storedScaler.masters.keys()), sorted(self.scaler.masters.keys()))
+            for name, master in self.scaler.masters.items():
+                storedMaster = storedScaler[name]
+                self.assertEqual(storedMaster.getStems(), master.getStems())
+                self.assertEqual(storedMaster.italicAngle, master.italicAngle)
+            for scaler in [self.scaler, storedScaler]:
+                scaler.set({'scale': (0.8, 0.7)})
+            for glyphName in ['H', 'O', 'a', 'Aacute']:
+                glyph = self.scaler.getScaledGlyph(glyphName, (60, 40))
+                storedGlyph = storedScaler.getScaledGlyph(glyphName, (60, 40))
+                self.assertEqual([[(point.x, point.y) for point in contour.points] for contour in glyph], [[(point.x, point.y) for point in contour.points] for contour in storedGlyph])
+                self.assertEqual(glyph.width, storedGlyph.width)
+
+        def test_names_and_unicodes_are_stored(self):
+            """Test that glyphs without unicodes and with non-ASCII names are stored, names keeping their type."""
+            mathGlyph = MathGlyph(None)
+            mathGlyph.unicodes = None
+            self.assertEqual(_encodeGlyph(mathGlyph, [])['unicodes'], [])
+            font = Font(self.fontPaths[0])
+            glyph = font.newGlyph(u'H.caf\xe9')
+            glyph.width = 100
+            glyph.getPen().addComponent('H', (1, 0, 0, 1, 0, 0))
+            MutatorScaleEngine([font]).saveMasters(self.storePath)
+            store = MasterStore(self.storePath)
+            storedFont = store.fonts[0]
+            storedGlyph = storedFont[u'H.caf\xe9']
+            self.assertEqual(storedGlyph.name, u'H.caf\xe9')
+            self.assertEqual(storedGlyph.unicodes, [])
+            self.assertEqual(storedGlyph.components, [('H', (1, 0, 0, 1, 0, 0))])
+            self.assertIsInstance(storedGlyph.components[0][0], str)
+            self.assertIsInstance(storedFont['H'].name, str)
+            store.close()
+
+        def test_wrong_magic_or_version_is_reported(self):
+            self.scaler.saveMasters(self.storePath)
+            with open(self.storePath, 'r+b') as storeFile:
+                storeFile.seek(4)
+                storeFile.write(struct.pack('<I', 7))
+            with self.assertRaisesRegexp(ValueError, 'version 7 master store, version 1 is expected'):
+                MasterStore(self.storePath)
+            with open(self.storePath, 'r+b') as storeFile:
+                storeFile.write(b'XXXX')
+            with self.assertRaisesRegexp(ValueError, 'is not a master store'):
+                MasterStore(self.storePath)
+
+    unittest.main()
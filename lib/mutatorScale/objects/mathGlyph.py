@@ -3,6 +3,7 @@ from robofab.world import RGlyph
 from robofab.pens.pointPen import BasePointToSegmentPen, AbstractPointPen
 from robofab.objects.objectsBase import addPt, subPt, mulPt, BaseGlyph
 from math import radians, tan, cos, sin, pi
+from mutatorScale.utilities.boundsUtils import calcContoursBounds
 
 '''
 Custom implementation of a MathGlyph with skewing.
@@ -10,6 +11,10 @@ Original MathGlyph in FontMath, by Tal Leming: https://github.com/typesupply/fon
 See license (MIT), here: https://github.com/typesupply/fontMath/blob/master/License.txt
 '''
 
+# memoized anchor/component matching plans, keyed by pairs of name structures
+_matchingPlans = {}
+_maxMatchingPlans = 4096
+
 def divPt(pt, scalar):
     if not isinstance(scalar, tuple):
         f1 = scalar
@@ -19,6 +24,36 @@ def divPt(pt, scalar):
     return pt[0] / f1, pt[1] / f2
 
 
+def _getMatchingPlan(selfNames, otherNames):
+    """
+    Return a tuple of (selfIndex, otherIndex, name) items pairing
+    anchors or components of two glyphs by name. When a name occurs
+    several times, items are paired in order of appearance and
+    surplus items are dropped. Plans only depend on the name
+    structures, so they are computed once per pair of structures.
+    """
+    key = (selfNames, otherNames)
+    plan = _matchingPlans.get(key)
+    if plan is None:
+        otherIndexes = {}
+        for index, name in enumerate(otherNames):
+            otherIndexes.setdefault(name, []).append(index)
+        usedCounts = {}
+        plan = []
+        for selfIndex, name in enumerate(selfNames):
+            if name in otherIndexes:
+                count = usedCounts.get(name, 0)
+                candidates = otherIndexes[name]
+                if count < len(candidates):
+                    plan.append((selfIndex, candidates[count], name))
+                    usedCounts[name] = count + 1
+        plan = tuple(plan)
+        if len(_matchingPlans) >= _maxMatchingPlans:
+            _matchingPlans.clear()
+        _matchingPlans[key] = plan
+    return plan
+
+
 class MathGlyphPen(AbstractPointPen):
 
     """
@@ -94,6 +129,11 @@ class MathGlyphPen(AbstractPointPen):
     def addComponent(self, baseGlyphName, transformation):
         self.components.append((baseGlyphName, transformation))
 
+    def addContourData(self, points):
+        """Add a contour given as a list of (segmentType, pt, smooth, name) tuples."""
+        self._points = list(points)
+        self._flushContour()
+
 
 class FilterRedundantPointPen(AbstractPointPen):
 
@@ -202,10 +242,21 @@ class MathGlyph(object):
 
     If a MathGlyph is created by another glyph that is not another MathGlyph instance,
     a weakref that points to the original glyph is maintained.
+
+    Copies made from another MathGlyph share contours, components, anchors and lib
+    with their source. Shared data is only copied when it is accessed through the
+    public attributes, which may be edited in place. Math operations read the
+    shared data directly and always build new coordinate lists.
+    getContourData() reads contours without copying them or dropping the memoized box.
     """
 
     def __init__(self, glyph):
         self._structure = None
+        self._bounds = None
+        self._sharedContours = False
+        self._sharedComponents = False
+        self._sharedAnchors = False
+        self._sharedLib = False
         if glyph is None:
             self.contours = []
             self.components = []
@@ -217,6 +268,17 @@ class MathGlyph(object):
             self.width = None
             self.note = None
             self.generationCount = 0
+        elif isinstance(glyph, MathGlyph):
+            # share data with the source glyph
+            # this is the result of a MathGlyph.copy()
+            glyph._shareIterables(self)
+            glyph._shareLib(self)
+            #
+            self.name = glyph.name
+            self.unicodes = glyph.unicodes
+            self.width = glyph.width
+            self.note = glyph.note
+            self.generationCount = glyph.generationCount + 1
         else:
             p = MathGlyphPen()
             glyph.drawPoints(p)
@@ -231,17 +293,11 @@ class MathGlyph(object):
             self.note = glyph.note
             #
             for k, v in glyph.lib.items():
-                self.lib[k] = v
+                self._lib[k] = v
             #
             # set a weakref for the glyph
-            # ONLY if it is not a MathGlyph.
-            # this could happen as a result
-            # of a MathGlyph.copy()
-            if not isinstance(glyph, MathGlyph):
-                self.getRef = weakref.ref(glyph)
-                self.generationCount = 0
-            else:
-                self.generationCount = glyph.generationCount + 1
+            self.getRef = weakref.ref(glyph)
+            self.generationCount = 0
 
     def getRef(self):
         """
@@ -252,28 +308,123 @@ class MathGlyph(object):
         # overriden by weakref.ref if present
         return None
 
+    def getParent(self):
+        """
+        return the font self was read from.
+        this will return None unless self was
+        read from a GlifFont.
+        """
+        # overriden by weakref.ref if present
+        return None
+
+    def _get_contours(self):
+        if self._sharedContours:
+            self._contours = [list(contour) for contour in self._contours]
+            self._sharedContours = False
+        # contours may be edited in place once handed out, getContourData() reads them without this
+        self._structure = None
+        self._bounds = None
+        return self._contours
+
+    def getContourData(self):
+        """
+        Return contours as they are stored, possibly shared with copies of self, for reading only.
+        Unlike the contours attribute, this doesn't copy shared contours nor reset the memoized box.
+        """
+        return self._contours
+
+    def _set_contours(self, contours):
+        self._contours = contours
+        self._sharedContours = False
+        self._structure = None
+        self._bounds = None
+
+    contours = property(_get_contours, _set_contours)
+
+    def _get_components(self):
+        if self._sharedComponents:
+            self._components = list(self._components)
+            self._sharedComponents = False
+        # components may be edited in place once handed out
+        self._structure = None
+        return self._components
+
+    def _set_components(self, components):
+        self._components = components
+        self._sharedComponents = False
+        self._structure = None
+
+    components = property(_get_components, _set_components)
+
+    def _get_anchors(self):
+        if self._sharedAnchors:
+            self._anchors = list(self._anchors)
+            self._sharedAnchors = False
+        # anchors may be edited in place once handed out
+        self._structure = None
+        return self._anchors
+
+    def _set_anchors(self, anchors):
+        self._anchors = anchors
+        self._sharedAnchors = False
+        self._structure = None
+
+    anchors = property(_get_anchors, _set_anchors)
+
+    def _get_lib(self):
+        if self._sharedLib:
+            self._lib = dict(self._lib)
+            self._sharedLib = False
+        return self._lib
+
+    def _set_lib(self, lib):
+        self._lib = lib
+        self._sharedLib = False
+
+    lib = property(_get_lib, _set_lib)
+
+    def _shareIterables(self, other):
+        # hand contours, components and anchors over to other without copying them,
+        # points are immutable tuples so only the containing lists need copy-on-write.
+        other._contours = self._contours
+        other._components = self._components
+        other._anchors = self._anchors
+        other._structure = self._structure
+        other._bounds = self._bounds
+        self._sharedContours = other._sharedContours = True
+        self._sharedComponents = other._sharedComponents = True
+        self._sharedAnchors = other._sharedAnchors = True
+
+    def _shareLib(self, other):
+        other._lib = self._lib
+        self._sharedLib = other._sharedLib = True
+
     def _get_structure(self):
+        # the structure is cached until contours, components or anchors are reassigned or handed out for editing,
+        # internal edits of self._contours, self._components or self._anchors must reset self._structure
         if self._structure is not None:
             return self._structure
-        contourStructure = []
-        for contour in self.contours:
-            contourStructure.append([segmentType for segmentType, pt, smooth, name in contour])
-        componentStructure = [baseName for baseName, transformation in self.components]
-        anchorStructure = [name for pt, name in self.anchors]
-        return contourStructure, componentStructure, anchorStructure
+        contourStructure = tuple([tuple([segmentType for segmentType, pt, smooth, name in contour]) for contour in self._contours])
+        componentStructure = tuple([baseName for baseName, transformation in self._components])
+        anchorStructure = tuple([name for pt, name in self._anchors])
+        self._structure = contourStructure, componentStructure, anchorStructure
+        return self._structure
 
-    structure = property(_get_structure, doc="returns a tuple of (contour structure, component structure, anchor structure)")
+    structure = property(_get_structure, doc="returns a hashable tuple of (contour structure, component structure, anchor structure)")
 
     def _get_box(self):
-        from fontTools.pens.boundsPen import BoundsPen
-        bP = BoundsPen(None)
-        self.draw(bP)
-        return bP.bounds
+        # computed from contour data and memoized until contours are edited
+        if self._bounds is None:
+            self._bounds = calcContoursBounds(self._contours)
+        return self._bounds
 
     box = property(_get_box, doc="Bounding rect for self. Returns None is glyph is empty. This DOES NOT measure components.")
 
     def copy(self):
-        """return a new MathGlyph containing all data in self"""
+        """
+        return a new MathGlyph containing all data in self.
+        data is shared with self until either glyph edits it.
+        """
         return MathGlyph(self)
 
     def copyWithoutIterables(self):
@@ -293,151 +444,114 @@ class MathGlyph(object):
         n.width = self.width
         n.note = self.note
         #
-        for k, v in self.lib.items():
-            n.lib[k] = v
+        self._shareLib(n)
         return n
 
     def _anchorCompare(self, other):
         # gather compatible anchors
         #
         # adapted from robofab.objects.objectsBase.RGlyph._anchorCompare
-        selfAnchors = {}
-        for pt, name in self.anchors:
-            if not selfAnchors.has_key(name):
-                selfAnchors[name] = []
-            selfAnchors[name].append(pt)
-        otherAnchors = {}
-        for pt, name in other.anchors:
-            if not otherAnchors.has_key(name):
-                otherAnchors[name] = []
-            otherAnchors[name].append(pt)
-        compatAnchors = set(selfAnchors.keys()) & set(otherAnchors.keys())
         finalSelfAnchors = {}
         finalOtherAnchors = {}
-        for name in compatAnchors:
-            if not finalSelfAnchors.has_key(name):
-                finalSelfAnchors[name] = []
-            if not finalOtherAnchors.has_key(name):
-                finalOtherAnchors[name] = []
-            selfList = selfAnchors[name]
-            otherList = otherAnchors[name]
-            selfCount = len(selfList)
-            otherCount = len(otherList)
-            if selfCount != otherCount:
-                r = range(min(selfCount, otherCount))
-            else:
-                r = range(selfCount)
-            for i in r:
-                finalSelfAnchors[name].append(selfList[i])
-                finalOtherAnchors[name].append(otherList[i])
+        plan = _getMatchingPlan(self.structure[2], other.structure[2])
+        for selfIndex, otherIndex, name in plan:
+            finalSelfAnchors.setdefault(name, []).append(self._anchors[selfIndex][0])
+            finalOtherAnchors.setdefault(name, []).append(other._anchors[otherIndex][0])
         return finalSelfAnchors, finalOtherAnchors
 
     def _componentCompare(self, other):
         # gather compatible compoenents
         #
-        selfComponents = {}
-        for baseName, transformation in self.components:
-            if not selfComponents.has_key(baseName):
-                selfComponents[baseName] = []
-            selfComponents[baseName].append(transformation)
-        otherComponents = {}
-        for baseName, transformation in other.components:
-            if not otherComponents.has_key(baseName):
-                otherComponents[baseName] = []
-            otherComponents[baseName].append(transformation)
-        compatComponents = set(selfComponents.keys()) & set(otherComponents.keys())
         finalSelfComponents = {}
         finalOtherComponents = {}
-        for baseName in compatComponents:
-            if not finalSelfComponents.has_key(baseName):
-                finalSelfComponents[baseName] = []
-            if not finalOtherComponents.has_key(baseName):
-                finalOtherComponents[baseName] = []
-            selfList = selfComponents[baseName]
-            otherList = otherComponents[baseName]
-            selfCount = len(selfList)
-            otherCount = len(otherList)
-            if selfCount != otherCount:
-                r = range(min(selfCount, otherCount))
-            else:
-                r = range(selfCount)
-            for i in r:
-                finalSelfComponents[baseName].append(selfList[i])
-                finalOtherComponents[baseName].append(otherList[i])
+        plan = _getMatchingPlan(self.structure[1], other.structure[1])
+        for selfIndex, otherIndex, baseName in plan:
+            finalSelfComponents.setdefault(baseName, []).append(self._components[selfIndex][1])
+            finalOtherComponents.setdefault(baseName, []).append(other._components[otherIndex][1])
         return finalSelfComponents, finalOtherComponents
 
     def _processMathOne(self, copiedGlyph, otherGlyph, funct):
         # glyph processing that recalculates glyph values based on another glyph
         # used by: __add__, __sub__
         #
+        selfContourStructure, selfComponentStructure, selfAnchorStructure = self.structure
         # contours
-        copiedGlyph.contours = []
-        if len(self.contours) > 0:
-            for contourIndex in range(len(self.contours)):
-                copiedGlyph.contours.append([])
-                selfContour = self.contours[contourIndex]
-                otherContour = otherGlyph.contours[contourIndex]
+        contours = []
+        if len(self._contours) > 0:
+            for contourIndex in range(len(self._contours)):
+                contours.append([])
+                selfContour = self._contours[contourIndex]
+                otherContour = otherGlyph._contours[contourIndex]
                 for pointIndex in range(len(selfContour)):
                     segType, pt, smooth, name = selfContour[pointIndex]
                     newX, newY = funct(selfContour[pointIndex][1], otherContour[pointIndex][1])
-                    copiedGlyph.contours[-1].append((segType, (newX, newY), smooth, name))
+                    contours[-1].append((segType, (newX, newY), smooth, name))
+        copiedGlyph.contours = contours
         # anchors
-        copiedGlyph.anchors = []
-        if len(self.anchors) > 0:
-            selfAnchors, otherAnchors = self._anchorCompare(otherGlyph)
-            anchorNames = selfAnchors.keys()
-            for anchorName in anchorNames:
-                selfAnchorList = selfAnchors[anchorName]
-                otherAnchorList = otherAnchors[anchorName]
-                for i in range(len(selfAnchorList)):
-                    selfAnchor = selfAnchorList[i]
-                    otherAnchor = otherAnchorList[i]
-                    newAnchor = funct(selfAnchor, otherAnchor)
-                    copiedGlyph.anchors.append((newAnchor, anchorName))
+        anchors = []
+        anchorPlan = ()
+        if len(self._anchors) > 0:
+            anchorPlan = _getMatchingPlan(selfAnchorStructure, otherGlyph.structure[2])
+            otherAnchors = otherGlyph._anchors
+            for selfIndex, otherIndex, anchorName in anchorPlan:
+                newAnchor = funct(self._anchors[selfIndex][0], otherAnchors[otherIndex][0])
+                anchors.append((newAnchor, anchorName))
+        copiedGlyph.anchors = anchors
         # components
-        copiedGlyph.components = []
-        if len(self.components) > 0:
-            selfComponents, otherComponents = self._componentCompare(otherGlyph)
-            componentNames = selfComponents.keys()
-            for componentName in componentNames:
-                selfComponentList = selfComponents[componentName]
-                otherComponentList = otherComponents[componentName]
-                for i in range(len(selfComponentList)):
-                    # transformation breakdown: xScale, xyScale, yxScale, yScale, xOffset, yOffset
-                    selfXScale, selfXYScale, selfYXScale, selfYScale, selfXOffset, selfYOffset = selfComponentList[i]
-                    otherXScale, otherXYScale, otherYXScale, otherYScale, otherXOffset, otherYOffset = otherComponentList[i]
-                    newXScale, newXYScale = funct((selfXScale, selfXYScale), (otherXScale, otherXYScale))
-                    newYXScale, newYScale = funct((selfYXScale, selfYScale), (otherYXScale, otherYScale))
-                    newXOffset, newYOffset = funct((selfXOffset, selfYOffset), (otherXOffset, otherYOffset))
-                    copiedGlyph.components.append((componentName, (newXScale, newXYScale, newYXScale, newYScale, newXOffset, newYOffset)))
+        components = []
+        componentPlan = ()
+        if len(self._components) > 0:
+            componentPlan = _getMatchingPlan(selfComponentStructure, otherGlyph.structure[1])
+            otherComponents = otherGlyph._components
+            for selfIndex, otherIndex, componentName in componentPlan:
+                # transformation breakdown: xScale, xyScale, yxScale, yScale, xOffset, yOffset
+                selfXScale, selfXYScale, selfYXScale, selfYScale, selfXOffset, selfYOffset = self._components[selfIndex][1]
+                otherXScale, otherXYScale, otherYXScale, otherYScale, otherXOffset, otherYOffset = otherComponents[otherIndex][1]
+                newXScale, newXYScale = funct((selfXScale, selfXYScale), (otherXScale, otherXYScale))
+                newYXScale, newYScale = funct((selfYXScale, selfYScale), (otherYXScale, otherYScale))
+                newXOffset, newYOffset = funct((selfXOffset, selfYOffset), (otherXOffset, otherYOffset))
+                components.append((componentName, (newXScale, newXYScale, newYXScale, newYScale, newXOffset, newYOffset)))
+        copiedGlyph.components = components
+        # the resulting structure is known from the matching plans
+        copiedGlyph._structure = (
+            selfContourStructure,
+            tuple([componentName for selfIndex, otherIndex, componentName in componentPlan]),
+            tuple([anchorName for selfIndex, otherIndex, anchorName in anchorPlan])
+        )
 
     def _processMathTwo(self, copiedGlyph, factor, funct):
         # glyph processing that recalculates glyph values based on a factor
         # used by: __mul__, __div__
         #
+        structure = self.structure
         # contours
-        copiedGlyph.contours = []
-        if len(self.contours) > 0:
-            for selfContour in self.contours:
-                copiedGlyph.contours.append([])
+        contours = []
+        if len(self._contours) > 0:
+            for selfContour in self._contours:
+                contours.append([])
                 for segType, pt, smooth, name in selfContour:
                     newX, newY = funct(pt, factor)
-                    copiedGlyph.contours[-1].append((segType, (newX, newY), smooth, name))
+                    contours[-1].append((segType, (newX, newY), smooth, name))
+        copiedGlyph.contours = contours
         # anchors
-        copiedGlyph.anchors = []
-        if len(self.anchors) > 0:
-            for pt, anchorName in self.anchors:
+        anchors = []
+        if len(self._anchors) > 0:
+            for pt, anchorName in self._anchors:
                 newPt = funct(pt, factor)
-                copiedGlyph.anchors.append((newPt, anchorName))
+                anchors.append((newPt, anchorName))
+        copiedGlyph.anchors = anchors
         # components
-        copiedGlyph.components = []
-        if len(self.components) > 0:
-            for baseName, transformation in self.components:
+        components = []
+        if len(self._components) > 0:
+            for baseName, transformation in self._components:
                 xScale, xyScale, yxScale, yScale, xOffset, yOffset = transformation
                 newXOffset, newYOffset = funct((xOffset, yOffset), factor)
                 newXScale, newYScale = funct((xScale, yScale), factor)
                 newXYScale, newYXScale = funct((xyScale, yxScale), factor)
-                copiedGlyph.components.append((baseName, (newXScale, newXYScale, newYXScale, newYScale, newXOffset, newYOffset)))
+                components.append((baseName, (newXScale, newXYScale, newYXScale, newYScale, newXOffset, newYOffset)))
+        copiedGlyph.components = components
+        # scaling by a factor leaves the structure untouched
+        copiedGlyph._structure = structure
 
     def __repr__(self):
         return "<MathGlyph %s>" % self.name
@@ -452,13 +566,13 @@ class MathGlyph(object):
             flag = True
         if self.note != other.note:
             flag = True
-        if self.lib != other.lib:
+        if self._lib != other._lib:
             flag = True
-        if self.contours != other.contours:
+        if self._contours != other._contours:
             flag = True
-        if self.components != other.components:
+        if self._components != other._components:
             flag = True
-        if self.anchors != other.anchors:
+        if self._anchors != other._anchors:
             flag = True
         return flag
 
@@ -496,14 +610,14 @@ class MathGlyph(object):
 
     def drawPoints(self, pointPen):
         """draw self using pointPen"""
-        for contour in self.contours:
+        for contour in self._contours:
             pointPen.beginPath()
             for segmentType, pt, smooth, name in contour:
                 pointPen.addPoint(pt=pt, segmentType=segmentType, smooth=smooth, name=name)
             pointPen.endPath()
-        for baseName, transformation in self.components:
+        for baseName, transformation in self._components:
             pointPen.addComponent(baseName, transformation)
-        for pt, name in self.anchors:
+        for pt, name in self._anchors:
             pointPen.beginPath()
             pointPen.addPoint(pt=pt, segmentType="move", smooth=False, name=name)
             pointPen.endPath()
@@ -536,7 +650,7 @@ class MathGlyph(object):
         glyph.width = self.width
         glyph.note = self.note
         #
-        for k, v in self.lib.items():
+        for k, v in self._lib.items():
             glyph.lib[k] = v
         return glyph
 
@@ -566,28 +680,154 @@ class MathGlyph(object):
 
     def skewX(self, a):
         a = radians(a)
+        skew = self._skewXByAngle
+        # build new coordinate lists rather than editing in place,
+        # data shared with copies of self is left untouched.
+        self._contours = [[(segment, (skew(x, y, a), y), smooth, name) for segment, (x, y), smooth, name in contour] for contour in self._contours]
+        self._components = [(baseGlyph, (xx, yx, xy, yy, skew(x, y, a), y)) for baseGlyph, (xx, yx, xy, yy, x, y) in self._components]
+        self._anchors = [((skew(x, y, a), y), name) for (x, y), name in self._anchors]
+        self._sharedContours = self._sharedComponents = self._sharedAnchors = False
+        self._bounds = None
 
-        contours = self.contours
-        anchors = self.anchors
-        components = self.components
-
-        for contour in contours:
-            for i, (segment, (x, y), smooth, name) in enumerate(contour):
-                x = self._skewXByAngle(x, y, a)
-                contour[i] = (segment, (x, y), smooth, name)
+    def _skewXByAngle(self, x, y, angle):
+        return x + (y * tan(angle))
 
-        for j, (baseGlyph, matrix) in enumerate(components):
-            xx, yx, xy, yy, x, y = matrix
-            x = self._skewXByAngle(x, y, a)
-            components[j] = (baseGlyph, (xx, yx, xy, yy, x, y))
+if __name__ == '__main__':
 
-        for k, ((x, y), name) in enumerate(anchors):
-            x = self._skewXByAngle(x, y, a)
-            anchors[k] = ((x, y), name)
+    import unittest
 
-        self.contours = contours
-        self.anchors = anchors
-        self.components = components
+    def makeGlyph():
+        glyph = MathGlyph(None)
+        glyph.contours = [[('curve', (0, 0), False, None), ('curve', (0, 100), False, None), ('curve', (100, 100), False, None)]]
+        glyph.components = [('A', (1, 0, 0, 1, 0, 0))]
+        glyph.anchors = [((50, 100), 'top')]
+        glyph.lib = {'key': 1}
+        glyph.width = 100
+        return glyph
 
-    def _skewXByAngle(self, x, y, angle):
-        return x + (y * tan(angle))
\ No newline at end of file
+    def compareByName(selfItems, otherItems):
+        # name matching as done before plans were memoized
+        selfGroups = {}
+        for value, name in selfItems:
+            selfGroups.setdefault(name, []).append(value)
+        otherGroups = {}
+        for value, name in otherItems:
+            otherGroups.setdefault(name, []).append(value)
+        finalSelf = {}
+        finalOther = {}
+        for name in set(selfGroups.keys()) & set(otherGroups.keys()):
+            count = min(len(selfGroups[name]), len(otherGroups[name]))
+            finalSelf[name] = selfGroups[name][:count]
+            finalOther[name] = otherGroups[name][:count]
+        return finalSelf, finalOther
+
+    class MathGlyphTests(unittest.TestCase):
+
+        def test_copies_share_data_until_edited(self):
+            glyph = makeGlyph()
+            copy = glyph.copy()
+            self.assertIs(copy.getContourData(), glyph.getContourData())
+            copy.contours[0][0] = ('curve', (-10, 0), False, None)
+            copy.components.append(('B', (1, 0, 0, 1, 0, 0)))
+            copy.anchors[0] = ((0, 0), 'top')
+            copy.lib['key'] = 2
+            self.assertEqual(glyph.contours[0][0], ('curve', (0, 0), False, None))
+            self.assertEqual(glyph.components, [('A', (1, 0, 0, 1, 0, 0))])
+            self.assertEqual(glyph.anchors, [((50, 100), 'top')])
+            self.assertEqual(glyph.lib, {'key': 1})
+
+        def test_reading_contour_data_keeps_memoized_box(self):
+            glyph = makeGlyph()
+            copy = glyph.copy()
+            self.assertEqual(copy.box, (0, 0, 100, 100))
+            copy.getContourData()
+            self.assertIsNotNone(copy._bounds)
+            self.assertIs(copy.getContourData(), glyph.getContourData())
+
+        def test_box_follows_edits(self):
+            glyph = makeGlyph()
+            self.assertEqual(glyph.box, (0, 0, 100, 100))
+            glyph.contours[0].append(('curve', (200, 50), False, None))
+            self.assertEqual(glyph.box, (0, 0, 200, 100))
+            glyph.contours = [[('curve', (10, 10), False, None), ('curve', (20, 30), False, None)]]
+            self.assertEqual(glyph.box, (10, 10, 20, 30))
+            glyph.skewX(45)
+            xMin, yMin, xMax, yMax = glyph.box
+            self.assertAlmostEqual(xMax, 50)
+
+        def test_draw_keeps_data_and_extracted_glyph_matches_source(self):
+            from robofab.pens.adapterPens import PointToSegmentPen
+            from mutatorScale.pens.utilityPens import CollectSegmentsPen
+            source = RGlyph()
+            pen = source.getPen()
+            pen.moveTo((0, 0))
+            pen.lineTo((0, 100))
+            pen.curveTo((20, 120), (80, 120), (100, 100))
+            pen.lineTo((100, 0))
+            pen.closePath()
+            glyph = MathGlyph(source)
+            self.assertEqual([segmentType for segmentType, pt, smooth, name in glyph.contours[0]].count('line'), 0)
+            # draw() draws the curves made from lines as they are stored
+            segmentsPen = CollectSegmentsPen(None)
+            glyph.draw(segmentsPen)
+            pointsSegmentsPen = CollectSegmentsPen(None)
+            glyph.drawPoints(PointToSegmentPen(pointsSegmentsPen))
+            self.assertEqual(segmentsPen.getSegments(), pointsSegmentsPen.getSegments())
+            # extractGlyph() turns them back into lines
+            segments = []
+            for drawnGlyph in [source, glyph.extractGlyph(RGlyph())]:
+                segmentsPen = CollectSegmentsPen(None)
+                drawnGlyph.draw(segmentsPen)
+                segments.append(segmentsPen.getSegments())
+            self.assertEqual(segments[1], segments[0])
+
+        def test_math_leaves_shared_data_untouched(self):
+            glyph = makeGlyph()
+            copy = glyph.copy()
+            result = copy * 2
+            copy.skewX(10)
+            self.assertEqual(glyph.contours[0][2], ('curve', (100, 100), False, None))
+            self.assertEqual(result.contours[0][2][1], (200, 200))
+
+        def test_matching_plans_survive_eviction(self):
+            global _maxMatchingPlans
+            glyph = makeGlyph()
+            glyph.components = [('A', (1, 0, 0, 1, 0, 0)), ('B', (1, 0, 0, 1, 10, 0)), ('A', (1, 0, 0, 1, 20, 0))]
+            glyph.anchors = [((0, 0), 'top'), ((10, 0), 'bottom'), ((20, 0), 'top'), ((30, 0), 'top')]
+            other = makeGlyph()
+            other.components = [('B', (2, 0, 0, 2, 0, 0)), ('A', (2, 0, 0, 2, 5, 0)), ('C', (1, 0, 0, 1, 0, 0))]
+            other.anchors = [((5, 5), 'top'), ((15, 5), 'top'), ((25, 5), 'right')]
+            expected = (
+                compareByName([(transformation, baseName) for baseName, transformation in glyph.components], [(transformation, baseName) for baseName, transformation in other.components]),
+                compareByName(glyph.anchors, other.anchors),
+                )
+            maxMatchingPlans = _maxMatchingPlans
+            try:
+                # plans computed then memoized, and plans evicted each time another one is memoized
+                for maximum in [maxMatchingPlans, 1]:
+                    _maxMatchingPlans = maximum
+                    _matchingPlans.clear()
+                    for i in range(2):
+                        self.assertEqual((glyph._componentCompare(other), glyph._anchorCompare(other)), expected)
+                        self.assertLessEqual(len(_matchingPlans), maximum)
+            finally:
+                _maxMatchingPlans = maxMatchingPlans
+                _matchingPlans.clear()
+
+        def test_structure_follows_in_place_edits(self):
+            glyph = makeGlyph()
+            other = makeGlyph()
+            self.assertEqual(glyph.structure, other.structure)
+            glyph.components.append(('B', (1, 0, 0, 1, 10, 0)))
+            other.components.insert(0, ('B', (1, 0, 0, 1, 20, 0)))
+            glyph.anchors.append(((0, 0), 'bottom'))
+            other.anchors.insert(0, ((10, 10), 'bottom'))
+            self.assertEqual(glyph.structure[1:], (('A', 'B'), ('top', 'bottom')))
+            self.assertEqual(other.structure[1:], (('B', 'A'), ('bottom', 'top')))
+            result = glyph - other
+            self.assertEqual(sorted(result.components), [('A', (0, 0, 0, 0, 0, 0)), ('B', (0, 0, 0, 0, -10, 0))])
+            self.assertEqual(sorted(result.anchors), [((-10, -10), 'bottom'), ((0, 0), 'top')])
+            glyph.contours[0][0] = ('line', (0, 0), False, None)
+            self.assertEqual(glyph.structure[0], (('line', 'curve', 'curve'),))
+
+    unittest.main()
@@ -7,6 +7,8 @@ from mutatorMath.objects.mutator import buildMutator
 
 from mutatorScale.objects.fonts import MutatorScaleFont
 from mutatorScale.objects.errorGlyph import ErrorGlyph
+from mutatorScale.objects.masterStore import MasterStore, writeMasterStore
+from mutatorScale.objects.masterAnalysis import analyzeMasters
 from mutatorScale.utilities.fontUtils import makeListFontName, joinFontName
 from mutatorScale.utilities.numbersUtils import mapValue
 
@@ -20,7 +22,8 @@ class MutatorScaleEngine:
     by interpolating accordingly and to the best possible result with available masters.
 
     Each master in a MutatorScaleEngine is an instance of a MutatorScaleFont for which stem values are defined.
-    If not specifically provided, these stem values are measured on capital letters I and H for vertical and horizontal stems respectively.
+    If not specifically provided, these stem values are measured on capital letters I and H for vertical and horizontal stems respectively,
+    or, if a stemSample list of glyph names is given, on stem histograms built from many scanlines across these glyphs.
     The stem values obtained are only meant to be reference value and do not reflect the stem values of all glyphs but only of I and H.
     While scaling, if you ask for a scaled glyph with stem values (80, 60), you’re effectively asking for a scaledGlyph interpolated
     as to have the vertical stem of a I equal to 80 and the horizontal stem of a H equal to 60. It is not akin to ask that these stem values
@@ -46,14 +49,15 @@ class MutatorScaleEngine:
 
     errorGlyph = ErrorGlyph()
 
-    def __init__(self, masterFonts=[], stemsWithSlantedSection=False):
+    def __init__(self, masterFonts=[], stemsWithSlantedSection=False, stemSample=None):
         self.masters = {}
         self._currentScale = None
         self._workingStems = None
+        self._masterStemsVersions = None
         self.stemsWithSlantedSection = stemsWithSlantedSection
+        self.stemSample = stemSample
         self._availableGlyphs = []
-        for font in masterFonts:
-            self.addMaster(font)
+        self.addMasters(masterFonts)
         self.mutatorErrors = []
 
     def __repr__(self):
@@ -139,6 +143,24 @@ class MutatorScaleEngine:
 
     def update(self):
         self._determineWorkingStems()
+        self._masterStemsVersions = self._getMasterStemsVersions()
+
+    def _getMasterStemsVersions(self):
+        return [master.getStemsVersion() for master in self.masters.values()]
+
+    def checkForChanges(self):
+        """
+        Detect edits to master glyphs of fonts that don’t post change notifications,
+        only the scaled glyphs of changed glyphs are invalidated and stems are measured again if I or H changed.
+        Return a dict of changed glyph names by master name.
+        """
+        changes = {}
+        for name, master in self.masters.items():
+            changedGlyphNames = master.checkForChanges()
+            if changedGlyphNames:
+                changes[name] = changedGlyphNames
+        self.update()
+        return changes
 
     def _parseStemsInput(self, stems):
         if stems is None:
@@ -149,20 +171,38 @@ class MutatorScaleEngine:
 
         return vstem, hstem
 
-    def _makeMaster(self, font, vstem, hstem):
+    def _makeMaster(self, font, vstem, hstem, italicAngle=None):
         """Return a MutatorScaleFont."""
         name = makeListFontName(font)
-        master = MutatorScaleFont(font, vstem=vstem, hstem=hstem, stemsWithSlantedSection=self.stemsWithSlantedSection)
+        master = MutatorScaleFont(font, vstem=vstem, hstem=hstem, stemsWithSlantedSection=self.stemsWithSlantedSection, italicAngle=italicAngle, stemSample=self.stemSample)
         return name, master
 
-    def addMaster(self, font, stems=None):
+    def addMaster(self, font, stems=None, italicAngle=None):
         """Add a MutatorScaleFont to masters."""
+        self._addMaster(font, stems, italicAngle)
+        self.update()
+
+    def addMasters(self, fonts, workers=None, stems=None, italicAngles=None):
+        """
+        Add several fonts to masters, working stems are only determined once all of them are added.
+        stems and italicAngles are optional lists of values for each font, None items being measured.
+        If workers is 2 or more, masters’ slant angles and stems are measured concurrently in a pool of processes.
+        """
+        fonts = list(fonts)
+        if stems is None:
+            stems = [None] * len(fonts)
+        if italicAngles is None:
+            italicAngles = [None] * len(fonts)
+        masters = [self._addMaster(font, fontStems, italicAngle) for font, fontStems, italicAngle in zip(fonts, stems, italicAngles)]
+        analyzeMasters(masters, workers)
+        self.update()
 
+    def _addMaster(self, font, stems=None, italicAngle=None):
         vstem, hstem = self._parseStemsInput(stems)
-        if (vstem is None) and ('I' not in font):
+        if (vstem is None) and (self.stemSample is None) and ('I' not in font):
             vstem = len(self.masters) * 100
 
-        name, master = self._makeMaster(font, vstem, hstem)
+        name, master = self._makeMaster(font, vstem, hstem, italicAngle)
 
         if not len(self._availableGlyphs):
             self._availableGlyphs = master.keys()
@@ -172,14 +212,32 @@ class MutatorScaleEngine:
         if self._currentScale is not None:
             master.setScale(self._currentScale)
 
+        if name in self.masters:
+            self.masters[name].close()
         self.masters[name] = master
-        self.update()
+        return master
+
+    def saveMasters(self, path):
+        """Write all masters, with their measured stems and slant angle, to a binary master store."""
+        writeMasterStore(self.masters.values(), path)
+
+    def addMastersFromStore(self, path):
+        """
+        Add masters from a binary master store written by saveMasters().
+        The store is memory-mapped and glyphs are decoded on demand,
+        stored stems and slant angles are used without measuring again.
+        """
+        store = MasterStore(path)
+        fonts = list(store)
+        stems = [font.getStems() if font.vstem is not None else None for font in fonts]
+        self.addMasters(fonts, stems=stems, italicAngles=[font.italicAngle for font in fonts])
+        return store
 
     def removeMaster(self, font):
         """Remove a MutatorScaleFont from masters."""
         name = makeListFontName(font)
         if self.masters.has_key(name):
-            self.masters.pop(name, 0)
+            self.masters.pop(name).close()
         self.update()
 
     def getScaledGlyph(self, glyphName, stemTarget, slantCorrection=True, attributes=None):
@@ -198,6 +256,11 @@ class MutatorScaleEngine:
         will result in an scaled glyph which will retain specified stem widths.
         """
 
+        if self._getMasterStemsVersions() != self._masterStemsVersions:
+            # stems were edited or masters changed since the last update
+            self.update()
+            workingStems = self._workingStems
+
         if len(masters) > 1 and workingStems is not None:
 
             medianYscale = 1
@@ -498,6 +561,36 @@ if __name__ == '__main__':
             scaler.removeMaster(fontToRemove)
             self.assertEqual(len(scaler), 3)
 
+        def test_removing_master_stops_observing_font(self):
+            scaler = self.scalers[0]
+            font = self.loadedFonts[0]
+            masterData = scaler.getMaster(font).masterData
+            self.assertTrue(font.dispatcher.hasObserver(masterData, 'Glyph.Changed', None))
+            scaler.removeMaster(font)
+            self.assertFalse(font.dispatcher.hasObserver(masterData, 'Glyph.Changed', None))
+
+        def test_stems_are_measured_once_per_font_version(self):
+            from mutatorScale.objects import fonts as fontsModule
+            measuredFonts = []
+            getRefStems = fontsModule.getRefStems
+            def countingGetRefStems(font, *args, **kwargs):
+                measuredFonts.append(font)
+                return getRefStems(font, *args, **kwargs)
+            fontsModule.getRefStems = countingGetRefStems
+            try:
+                scaler = self.scalers[0]
+                font = self.loadedFonts[0]
+                for glyphName in ['H', 'A', 'O']:
+                    scaler.getScaledGlyph(glyphName, (100, 40))
+                self.assertEqual(measuredFonts, [])
+                glyph = font['I']
+                glyph.width += 10
+                scaler.getScaledGlyph('H', (100, 40))
+                scaler.getScaledGlyph('A', (100, 40))
+                self.assertEqual(measuredFonts, [font])
+            finally:
+                fontsModule.getRefStems = getRefStems
+
         def test_scaler_uses_hstem_as_main_value_from_single_values(self):
             scaler = MutatorScaleEngine()
             font1 = self.loadedFonts[2]
@@ -516,4 +609,27 @@ if __name__ == '__main__':
             g = scaler.getScaledGlyph('A', 45)
             self.assertNotEqual(g.name, '_error_')
 
+        def test_scaler_measures_stems_on_glyph_sample(self):
+            fonts = self.loadedFonts[:4]
+            scaler = MutatorScaleEngine(fonts, stemSample=['I', 'H', 'l', 'n', 'o', 'O'])
+            referenceScaler = MutatorScaleEngine(fonts)
+            for name, master in scaler.masters.items():
+                self.assertEqual(master.getStems(), referenceScaler[name].getStems())
+
+        def test_adding_masters_analyzed_in_worker_processes(self):
+            from mutatorScale.objects.fonts import masterRegistry
+            fonts = self.loadedFonts[:4]
+            referenceScaler = MutatorScaleEngine(fonts)
+            for stemSample in [None, ['I', 'H', 'n', 'o']]:
+                # measure again rather than share the reference scaler’s master data
+                for font in fonts:
+                    masterRegistry.discard(font)
+                scaler = MutatorScaleEngine(stemSample=stemSample)
+                scaler.addMasters(fonts, workers=2)
+                self.assertEqual(len(scaler), 4)
+                self.assertEqual(scaler.getCurrentStemBase(), referenceScaler.getCurrentStemBase())
+                for name, master in scaler.masters.items():
+                    self.assertEqual(master.getStems(), referenceScaler[name].getStems())
+                    self.assertEqual(master.italicAngle, referenceScaler[name].italicAngle)
+
     unittest.main()
\ No newline at end of file
@@ -62,4 +62,23 @@ class CollectSegmentsPen(BasePen):
         self.contours.append(self.segments)
 
     def getSegments(self):
-        return self.contours
\ No newline at end of file
+        return self.contours
+class CollectOutlinePointPen(AbstractPointPen):
+
+    """Collect contours as lists of (segmentType, pt, smooth, name) tuples and components as (baseGlyphName, transformation) tuples."""
+
+    def __init__(self):
+        self.contours = []
+        self.components = []
+
+    def beginPath(self):
+        self._points = []
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, **kwargs):
+        self._points.append((segmentType, pt, smooth, name))
+
+    def endPath(self):
+        self.contours.append(self._points)
+
+    def addComponent(self, baseGlyphName, transformation):
+        self.components.append((baseGlyphName, tuple(transformation)))
@@ -0,0 +1,321 @@
+#coding=utf-8
+from __future__ import division
+
+from fontTools.misc.bezierTools import calcCubicBounds
+from fontTools.misc.arrayTools import pointInRect, unionRect
+from fontTools.pens.basePen import decomposeQuadraticSegment, decomposeSuperBezierSegment
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.pens.transformPen import TransformPen
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+Bounds computed straight from MathGlyph coordinate data, without drawing through a pen.
+Cubic extrema are solved for all segments at once with numpy when it is available,
+otherwise, and for glyphs with few segments, segment by segment in pure Python.
+'''
+
+epsilon = 1e-9
+
+# below this number of curve segments, numpy’s overhead outweighs vectorization
+_vectorizeThreshold = 16
+
+_identity = (1, 0, 0, 1, 0, 0)
+
+
+def _transformPoint(transformation, (x, y)):
+    xx, xy, yx, yy, dx, dy = transformation
+    return xx * x + yx * y + dx, xy * x + yy * y + dy
+
+
+def _composeTransformations(t1, t2):
+    """Return the transformation applying t1 then t2."""
+    xx1, xy1, yx1, yy1, dx1, dy1 = t1
+    xx2, xy2, yx2, yy2, dx2, dy2 = t2
+    return (
+        xx1 * xx2 + xy1 * yx2,
+        xx1 * xy2 + xy1 * yy2,
+        yx1 * xx2 + yy1 * yx2,
+        yx1 * xy2 + yy1 * yy2,
+        dx1 * xx2 + dy1 * yx2 + dx2,
+        dx1 * xy2 + dy1 * yy2 + dy2
+    )
+
+
+def _elevateQuadratic(pt0, pt1, pt2):
+    return (
+        pt0,
+        (pt0[0] + 2 * (pt1[0] - pt0[0]) / 3, pt0[1] + 2 * (pt1[1] - pt0[1]) / 3),
+        (pt2[0] + 2 * (pt1[0] - pt2[0]) / 3, pt2[1] + 2 * (pt1[1] - pt2[1]) / 3),
+        pt2
+    )
+
+
+def getContourSegments(contours):
+    """
+    Collect on curve points and cubic segments from MathGlyph contour data.
+    Quadratic segments are converted to cubics, line segments only contribute their on curve points.
+    Returns a tuple: (onCurvePoints, cubicSegments).
+    """
+    onCurves = []
+    cubics = []
+    for contour in contours:
+        if not contour:
+            continue
+        firstOnCurve = None
+        for index, (segmentType, pt, smooth, name) in enumerate(contour):
+            if segmentType is not None:
+                firstOnCurve = index
+                break
+        if firstOnCurve is None:
+            # quadratic contour without on curve points
+            offCurves = [pt for segmentType, pt, smooth, name in contour]
+            impliedOnCurve = ((offCurves[-1][0] + offCurves[0][0]) / 2, (offCurves[-1][1] + offCurves[0][1]) / 2)
+            previous = impliedOnCurve
+            for pt1, pt2 in decomposeQuadraticSegment(offCurves + [impliedOnCurve]):
+                cubics.append(_elevateQuadratic(previous, pt1, pt2))
+                previous = pt2
+            onCurves.append(impliedOnCurve)
+            continue
+        points = contour[firstOnCurve:] + contour[:firstOnCurve]
+        previous = points[0][1]
+        onCurves.append(previous)
+        if points[0][0] != 'move':
+            # closed contour, the first point ends the last segment
+            points = points + points[:1]
+        offCurves = []
+        for segmentType, pt, smooth, name in points[1:]:
+            if segmentType is None:
+                offCurves.append(pt)
+                continue
+            if offCurves:
+                if segmentType == 'curve':
+                    if len(offCurves) == 2:
+                        cubics.append((previous, offCurves[0], offCurves[1], pt))
+                    else:
+                        segmentStart = previous
+                        for pt1, pt2, pt3 in decomposeSuperBezierSegment(offCurves + [pt]):
+                            cubics.append((segmentStart, pt1, pt2, pt3))
+                            segmentStart = pt3
+                elif segmentType == 'qcurve':
+                    segmentStart = previous
+                    for pt1, pt2 in decomposeQuadraticSegment(offCurves + [pt]):
+                        cubics.append(_elevateQuadratic(segmentStart, pt1, pt2))
+                        segmentStart = pt2
+            onCurves.append(pt)
+            previous = pt
+            offCurves = []
+    return onCurves, cubics
+
+
+def _pointsBounds(points):
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _cubicsBoundsPython(cubics, bounds):
+    for pt1, pt2, pt3, pt4 in cubics:
+        # only curves with off curves outside the known bounds can extend them
+        if not pointInRect(pt2, bounds) or not pointInRect(pt3, bounds):
+            bounds = unionRect(bounds, calcCubicBounds(pt1, pt2, pt3, pt4))
+    return bounds
+
+
+def _cubicsExtremaNumpy(cubics):
+    """
+    Return arrays of minimum and maximum (x, y) values of each cubic segment.
+    cubics is an array of shape (segmentCount, 4, 2).
+    """
+    p0, p1, p2, p3 = cubics[:, 0], cubics[:, 1], cubics[:, 2], cubics[:, 3]
+    # the derivative divided by 3 is a*t**2 + b*t + c
+    a = p3 - 3 * p2 + 3 * p1 - p0
+    b = 2 * (p2 - 2 * p1 + p0)
+    c = p1 - p0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        linear = numpy.abs(a) < epsilon
+        discriminant = b * b - 4 * a * c
+        root = numpy.sqrt(numpy.where(discriminant >= 0, discriminant, numpy.nan))
+        t1 = numpy.where(linear, -c / b, (-b + root) / (2 * a))
+        t2 = numpy.where(linear, numpy.nan, (-b - root) / (2 * a))
+        # roots of both coordinates are evaluated on both coordinates, as in fontTools’ calcCubicBounds
+        t = numpy.concatenate([t1, t2], axis=1)
+        t = numpy.where((t > 0) & (t < 1), t, 0)[:, None, :]
+    mt = 1 - t
+    values = (mt ** 3 * p0[:, :, None] + 3 * mt * mt * t * p1[:, :, None]
+              + 3 * mt * t * t * p2[:, :, None] + t ** 3 * p3[:, :, None])
+    minimums = numpy.minimum(values.min(axis=2), numpy.minimum(p0, p3))
+    maximums = numpy.maximum(values.max(axis=2), numpy.maximum(p0, p3))
+    return minimums, maximums
+
+
+def _toBounds(values):
+    xMin, yMin, xMax, yMax = values
+    return tuple([int(value) if int(value) == value else float(value) for value in (xMin, yMin, xMax, yMax)])
+
+
+def calcContoursBounds(contours):
+    """Return the bounds of MathGlyph contour data, None if there are no points."""
+    onCurves, cubics = getContourSegments(contours)
+    if not onCurves:
+        return None
+    bounds = _pointsBounds(onCurves)
+    if not cubics:
+        return bounds
+    if numpy is not None and len(cubics) >= _vectorizeThreshold:
+        minimums, maximums = _cubicsExtremaNumpy(numpy.array(cubics, dtype=float))
+        xMin, yMin = minimums.min(axis=0)
+        xMax, yMax = maximums.max(axis=0)
+        return _toBounds(unionRect(bounds, (xMin, yMin, xMax, yMax)))
+    return _cubicsBoundsPython(cubics, bounds)
+
+
+def calcBoundsForGlyphs(glyphs):
+    """
+    Return a list of contour bounds for many MathGlyphs at once,
+    all curve segments are solved in a single vectorized pass when numpy is available.
+    Results are memoized on each glyph until its contours are edited.
+    """
+    results = [glyph._bounds for glyph in glyphs]
+    pending = [index for index, glyph in enumerate(glyphs) if glyph._bounds is None]
+    if numpy is None:
+        for index in pending:
+            results[index] = glyphs[index].box
+        return results
+    allCubics = []
+    cubicOwners = []
+    for index in pending:
+        onCurves, cubics = getContourSegments(glyphs[index]._contours)
+        if onCurves:
+            results[index] = _pointsBounds(onCurves)
+        allCubics.extend(cubics)
+        cubicOwners.extend([index] * len(cubics))
+    if allCubics:
+        minimums, maximums = _cubicsExtremaNumpy(numpy.array(allCubics, dtype=float))
+        owners = numpy.array(cubicOwners)
+        glyphMinimums = numpy.full((len(glyphs), 2), numpy.inf)
+        glyphMaximums = numpy.full((len(glyphs), 2), -numpy.inf)
+        numpy.minimum.at(glyphMinimums, owners, minimums)
+        numpy.maximum.at(glyphMaximums, owners, maximums)
+        for index in set(cubicOwners):
+            xMin, yMin = glyphMinimums[index]
+            xMax, yMax = glyphMaximums[index]
+            results[index] = _toBounds(unionRect(results[index], (xMin, yMin, xMax, yMax)))
+    for index in pending:
+        glyphs[index]._bounds = results[index]
+    return results
+
+
+def _transformBounds(bounds, transformation):
+    xMin, yMin, xMax, yMax = bounds
+    corners = [_transformPoint(transformation, pt) for pt in [(xMin, yMin), (xMin, yMax), (xMax, yMin), (xMax, yMax)]]
+    return _pointsBounds(corners)
+
+
+def getMathGlyphBounds(glyph, glyphSet=None, transformation=None):
+    """
+    Return the bounds of a MathGlyph, components included if a glyphSet is provided.
+    Contour bounds are memoized on the glyph, components are resolved recursively.
+    """
+    from mutatorScale.objects.mathGlyph import MathGlyph
+
+    if transformation is None or transformation == _identity:
+        bounds = glyph.box
+    elif transformation[1] == transformation[2] == 0:
+        # scale and offset only, transforming the bounds is exact
+        bounds = glyph.box
+        if bounds is not None:
+            bounds = _transformBounds(bounds, transformation)
+    else:
+        contours = [[(segmentType, _transformPoint(transformation, pt), smooth, name) for segmentType, pt, smooth, name in contour] for contour in glyph._contours]
+        bounds = calcContoursBounds(contours)
+
+    if glyphSet is not None:
+        for baseGlyphName, componentTransformation in glyph._components:
+            if baseGlyphName not in glyphSet:
+                continue
+            baseGlyph = glyphSet[baseGlyphName]
+            if transformation is not None:
+                componentTransformation = _composeTransformations(componentTransformation, transformation)
+            if isinstance(baseGlyph, MathGlyph):
+                componentBounds = getMathGlyphBounds(baseGlyph, glyphSet, componentTransformation)
+            else:
+                pen = BoundsPen(glyphSet)
+                baseGlyph.draw(TransformPen(pen, componentTransformation))
+                componentBounds = pen.bounds
+            if componentBounds is None:
+                continue
+            if bounds is None:
+                bounds = componentBounds
+            else:
+                bounds = unionRect(bounds, componentBounds)
+    return bounds
+
+
+if __name__ == '__main__':
+
+    import os
+    import unittest
+    from defcon import Font
+    from robofab.pens.adapterPens import PointToSegmentPen
+    from mutatorScale.objects.mathGlyph import MathGlyph
+
+    def roundBounds(bounds):
+        return tuple([round(value, 6) for value in bounds]) if bounds is not None else None
+
+    def drawnBounds(contours):
+        pen = BoundsPen(None)
+        pointPen = PointToSegmentPen(pen)
+        for contour in contours:
+            pointPen.beginPath()
+            for segmentType, pt, smooth, name in contour:
+                pointPen.addPoint(pt, segmentType=segmentType, smooth=smooth, name=name)
+            pointPen.endPath()
+        return pen.bounds
+
+    class BoundsTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            self.font = Font(os.path.join(libFolder, 'testFonts/two-axes/regular-italic-low-contrast.ufo'))
+
+        def test_contour_bounds_match_bounds_pen(self):
+            """Test bounds computed segment by segment and vectorized against BoundsPen, on both sides of the numpy threshold."""
+            global _vectorizeThreshold
+            vectorizeThreshold = _vectorizeThreshold
+            contoursList = [MathGlyph(glyph).contours for glyph in self.font]
+            contoursList += [
+                [[('qcurve', (0, 0), False, None), (None, (50, 120), False, None), (None, (150, -40), False, None), ('qcurve', (200, 0), False, None), (None, (100, -100), False, None)]],
+                [[(None, (0, 0), False, None), (None, (100, 150), False, None), (None, (200, 0), False, None), (None, (100, -50), False, None)]],
+                [[('move', (0, 0), False, None), (None, (-30, 80), False, None), (None, (130, 80), False, None), ('curve', (100, 0), False, None)]],
+                ]
+            try:
+                for threshold in [0, vectorizeThreshold, float('inf')]:
+                    _vectorizeThreshold = threshold
+                    for contours in contoursList:
+                        self.assertEqual(roundBounds(calcContoursBounds(contours)), roundBounds(drawnBounds(contours)))
+            finally:
+                _vectorizeThreshold = vectorizeThreshold
+
+        def test_glyph_bounds_match_bounds_pen(self):
+            """Test bounds of many glyphs at once, and of glyphs with transformed components, against BoundsPen."""
+            glyphs = [glyph for glyph in self.font if len(glyph) or len(glyph.components)]
+            mathGlyphs = [MathGlyph(glyph) for glyph in glyphs]
+            for glyph, bounds in zip(glyphs, calcBoundsForGlyphs(mathGlyphs)):
+                self.assertEqual(roundBounds(bounds), roundBounds(drawnBounds(MathGlyph(glyph).contours)))
+            composite = self.font.newGlyph('_composite')
+            composite.getPointPen().addComponent('O', (1, 0.1, 0.3, 1, 10, 20))
+            nested = self.font.newGlyph('_nested')
+            nested.getPointPen().addComponent('_composite', (0.5, 0, 0, 2, 0, 0))
+            nested.getPointPen().addComponent('H', (1, 0, 0.2, 1, 300, 0))
+            mathGlyphSet = dict([(glyph.name, MathGlyph(glyph)) for glyph in self.font])
+            for glyph in glyphs + [composite, nested]:
+                pen = BoundsPen(self.font)
+                glyph.draw(pen)
+                self.assertEqual(roundBounds(getMathGlyphBounds(MathGlyph(glyph), self.font)), roundBounds(pen.bounds))
+                self.assertEqual(roundBounds(getMathGlyphBounds(mathGlyphSet[glyph.name], mathGlyphSet)), roundBounds(pen.bounds))
+
+    unittest.main()
@@ -0,0 +1,154 @@
+#coding=utf-8
+from __future__ import division
+
+import os
+import json
+import hashlib
+
+from robofab.world import RFont
+
+from mutatorScale.utilities.hashUtils import getGlyphHash
+
+'''
+Incremental building of scaled fonts.
+A manifest written next to the output UFO records, for each output glyph, what it was built from:
+hashes of the contributing master glyphs, master scales, stems and slant angles, the stem target and the manifest version.
+On the next build, only glyphs whose inputs differ are scaled again and rewritten.
+'''
+
+# version of the manifest format and of the scaling it records,
+# to be increased whenever changes to scaling may alter scaled glyphs, so that they are all built again
+_manifestVersion = 1
+
+
+def getManifestPath(outputPath):
+    """Return the path of the build manifest of an output UFO: path/to/font.ufo -> path/to/font.manifest.json"""
+    return os.path.splitext(outputPath.rstrip(os.sep))[0] + '.manifest.json'
+
+
+def readManifest(manifestPath):
+    """Return the glyph entries of a build manifest, empty if there is none or if it was written by another version."""
+    if not os.path.exists(manifestPath):
+        return {}
+    with open(manifestPath, 'r') as manifestFile:
+        manifest = json.load(manifestFile)
+    if manifest.get('version') != _manifestVersion:
+        return {}
+    return manifest.get('glyphs', {})
+
+
+def writeManifest(manifestPath, entries):
+    with open(manifestPath, 'w') as manifestFile:
+        json.dump({'version': _manifestVersion, 'glyphs': entries}, manifestFile, indent=1, sort_keys=True)
+
+
+def getGlyphInputs(scaler, glyphName, stemTarget):
+    """Return a manifest entry describing everything a scaled glyph depends on, its 'key' summarizing it all."""
+    masters = {}
+    for masterName, master in scaler.masters.items():
+        glyphHash = getGlyphHash(master.glyphSet[glyphName]) if glyphName in master else None
+        masters[masterName] = {
+            'glyph': glyphHash,
+            'scale': master.getScale(),
+            'stems': master.getStems(),
+            'italicAngle': master.italicAngle,
+            }
+    entry = {
+        'masters': masters,
+        'scale': scaler._currentScale,
+        'stems': stemTarget,
+        'workingStems': scaler.getCurrentStemBase(),
+        }
+    # round trip through JSON so keys computed now match those read back from a manifest
+    entry = json.loads(json.dumps(entry))
+    entry['key'] = hashlib.sha1(json.dumps([_manifestVersion, entry], sort_keys=True)).hexdigest()
+    return entry
+
+
+def buildScaledFont(scaler, outputPath, glyphNames, stemTarget, manifestPath=None, force=False):
+    """
+    Write scaled glyphs to the UFO at outputPath, creating it if it doesn’t exist,
+    and record their inputs in a manifest next to it.
+    Glyphs already in the output font with unchanged inputs are left untouched, unless force is True.
+    Glyphs that failed to interpolate are written but not recorded, so they are retried on the next build.
+    Return the list of glyph names that were built.
+    """
+    if manifestPath is None:
+        manifestPath = getManifestPath(outputPath)
+    if os.path.exists(outputPath):
+        outputFont = RFont(outputPath)
+        entries = readManifest(manifestPath)
+    else:
+        outputFont = RFont()
+        entries = {}
+
+    builtGlyphNames = []
+    for glyphName in glyphNames:
+        if not scaler.hasGlyph(glyphName):
+            continue
+        inputs = getGlyphInputs(scaler, glyphName, stemTarget)
+        previous = entries.get(glyphName)
+        if not force and previous is not None and previous['key'] == inputs['key'] and glyphName in outputFont:
+            continue
+        glyph = scaler.getScaledGlyph(glyphName, stemTarget)
+        outputFont.insertGlyph(glyph, glyphName)
+        if glyph.name == '_error_':
+            entries.pop(glyphName, None)
+        else:
+            entries[glyphName] = inputs
+        builtGlyphNames.append(glyphName)
+
+    if builtGlyphNames or not os.path.exists(outputPath):
+        if os.path.exists(outputPath):
+            outputFont.save()
+        else:
+            outputFont.save(outputPath)
+        writeManifest(manifestPath, entries)
+    return builtGlyphNames
+
+
+if __name__ == '__main__':
+
+    import shutil
+    import tempfile
+    import unittest
+    from defcon import Font
+    from mutatorScale.objects.scaler import MutatorScaleEngine
+
+    class BuildTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            fontsPath = os.path.join(libFolder, 'testFonts/two-axes')
+            self.fonts = [Font(os.path.join(fontsPath, fileName)) for fileName in ['regular-low-contrast.ufo', 'bold-low-contrast.ufo']]
+            self.scaler = MutatorScaleEngine(self.fonts)
+            self.scaler.set({'scale': (0.85, 0.8)})
+            self.folder = tempfile.mkdtemp()
+            self.outputPath = os.path.join(self.folder, 'scaled.ufo')
+
+        def tearDown(self):
+            shutil.rmtree(self.folder)
+
+        def test_only_changed_glyphs_are_rebuilt(self):
+            """Test that a second build only rebuilds glyphs whose inputs changed."""
+            glyphNames = ['A', 'H', 'O', 'B']
+            self.assertEqual(buildScaledFont(self.scaler, self.outputPath, glyphNames, (95, 75)), glyphNames)
+            self.assertTrue(os.path.exists(getManifestPath(self.outputPath)))
+            self.assertEqual(buildScaledFont(self.scaler, self.outputPath, glyphNames, (95, 75)), [])
+            self.fonts[1]['O'].width += 10
+            self.assertEqual(buildScaledFont(self.scaler, self.outputPath, glyphNames, (95, 75)), ['O'])
+            self.assertEqual(buildScaledFont(self.scaler, self.outputPath, glyphNames, (90, 75)), glyphNames)
+            self.assertEqual(sorted(RFont(self.outputPath).keys()), sorted(glyphNames))
+
+        def test_manifests_of_another_version_are_ignored(self):
+            glyphNames = ['H', 'O']
+            buildScaledFont(self.scaler, self.outputPath, glyphNames, (95, 75))
+            manifestPath = getManifestPath(self.outputPath)
+            entries = readManifest(manifestPath)
+            self.assertEqual(sorted(entries.keys()), glyphNames)
+            with open(manifestPath, 'w') as manifestFile:
+                json.dump({'version': _manifestVersion + 1, 'glyphs': entries}, manifestFile)
+            self.assertEqual(readManifest(manifestPath), {})
+            self.assertEqual(buildScaledFont(self.scaler, self.outputPath, glyphNames, (95, 75)), glyphNames)
+
+    unittest.main()
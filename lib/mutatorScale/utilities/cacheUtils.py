@@ -0,0 +1,79 @@
+#coding=utf-8
+from __future__ import division
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    Bounded mapping discarding least recently used items once capacity is reached.
+    Hits and misses are counted on get() for reporting.
+    A capacity of 0 disables caching, None makes the cache unbounded.
+    """
+    def __init__(self, capacity=128):
+        self._items = OrderedDict()
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<{className} {size}/{capacity}>'.format(className=self.__class__.__name__, size=len(self), capacity=self.capacity)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def keys(self):
+        return self._items.keys()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # re-insert as most recently used
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.capacity == 0:
+            return
+        self._items.pop(key, None)
+        self._items[key] = value
+        self._trim()
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+    def setCapacity(self, capacity):
+        self.capacity = capacity
+        self._trim()
+
+    def _trim(self):
+        if self.capacity is None:
+            return
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def getStats(self):
+        """Return a dict reporting hits, misses, hit rate, size and capacity."""
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / requests if requests else 0,
+            'size': len(self._items),
+            'capacity': self.capacity
+        }
@@ -7,11 +7,13 @@ from robofab.world import RGlyph
 import fontTools
 import fontTools.misc.bezierTools as bezierTools
 import fontTools.misc.arrayTools as arrayTools
-import fontTools.misc.transform as transform
 from fontTools.pens.boundsPen import BoundsPen
 
 from mutatorScale.booleanOperations.booleanGlyph import BooleanGlyph
-from mutatorScale.pens.utilityPens import CollectSegmentsPen
+from mutatorScale.booleanOperations.booleanOperationManager import _mayIntersectItself
+from mutatorScale.objects.mathGlyph import MathGlyph
+from mutatorScale.utilities.boundsUtils import getMathGlyphBounds, _composeTransformations, _transformPoint
+from mutatorScale.pens.utilityPens import CollectSegmentsPen, CollectOutlinePointPen
 
 
 
@@ -34,26 +36,131 @@ def joinFontName(familyName, styleName):
     return '{familyName} {separator} {styleName}'.format(familyName=familyName, separator=separator, styleName=styleName)
 
 
-def getRefStems(font, slantedSection=False):
+class FontAnalysis(object):
+    """
+    Cache of a font’s frozen glyphs and of the measurements made on them,
+    so that measuring slant and stems freezes each glyph only once.
+    Components are decomposed from cached outlines of their base glyphs, with transformations
+    composed through any depth of nesting.
+    Cached results are kept until a glyph they depend on, directly or through components, is invalidated.
+
+    Functions measuring fonts accept an analysis to share, without one they use a transient one.
+    """
+    def __init__(self, font):
+        self.font = font
+        self._outlines = {}
+        self._flattenedComponents = {}
+        self._frozenGlyphs = {}
+        self._measurements = {}
+
+    def getDependencies(self, glyphNames):
+        """Return glyph names along with the names of all base glyphs they use, at any depth."""
+        dependencies = set()
+        pending = [glyphName for glyphName in glyphNames if glyphName in self.font]
+        while pending:
+            glyphName = pending.pop()
+            if glyphName in dependencies:
+                continue
+            dependencies.add(glyphName)
+            for component in self.font[glyphName].components:
+                baseGlyphName = component[0] if isinstance(component, tuple) else component.baseGlyph
+                if baseGlyphName in self.font:
+                    pending.append(baseGlyphName)
+        return dependencies
+
+    def getOutline(self, glyphName):
+        """Return a glyph’s own contours and components as (contours, components)."""
+        if glyphName not in self._outlines:
+            pen = CollectOutlinePointPen()
+            self.font[glyphName].drawPoints(pen)
+            self._outlines[glyphName] = (pen.contours, pen.components), set([glyphName])
+        return self._outlines[glyphName][0]
+
+    def getFlattenedComponents(self, glyphName):
+        """
+        Return a list of (glyphName, transformation) items, the contours of which make up the glyph fully decomposed:
+        the glyph itself first, then base glyphs at any depth of nesting, with their transformations composed.
+        """
+        if glyphName not in self._flattenedComponents:
+            flattened = self._flattenComponents(glyphName, (1, 0, 0, 1, 0, 0), set())
+            self._flattenedComponents[glyphName] = flattened, self.getDependencies([glyphName])
+        return self._flattenedComponents[glyphName][0]
+
+    def _flattenComponents(self, glyphName, transformation, ancestors):
+        flattened = [(glyphName, transformation)]
+        contours, components = self.getOutline(glyphName)
+        # guard against components referencing their own composite
+        ancestors = ancestors | set([glyphName])
+        for baseGlyphName, componentTransformation in components:
+            if baseGlyphName in self.font and baseGlyphName not in ancestors:
+                flattened += self._flattenComponents(baseGlyphName, _composeTransformations(componentTransformation, transformation), ancestors)
+        return flattened
+
+    def getDecomposedContours(self, glyphName, transformation=(1, 0, 0, 1, 0, 0)):
+        """Return the contours of a glyph with all components decomposed, transformed by transformation."""
+        decomposedContours = []
+        for baseGlyphName, baseTransformation in self.getFlattenedComponents(glyphName):
+            composedTransformation = _composeTransformations(baseTransformation, transformation)
+            for contour in self.getOutline(baseGlyphName)[0]:
+                decomposedContours.append([(segmentType, _transformPoint(composedTransformation, pt), smooth, name) for segmentType, pt, smooth, name in contour])
+        return decomposedContours
+
+    def getFrozenGlyph(self, glyphName):
+        """Return a shared frozen copy of a glyph, callers should copy it before editing it."""
+        if glyphName not in self._frozenGlyphs:
+            glyph = freezeGlyph(self.font[glyphName], self)
+            self._frozenGlyphs[glyphName] = glyph, self.getDependencies([glyphName])
+        return self._frozenGlyphs[glyphName][0]
+
+    def getMeasurement(self, key, glyphNames, function, *args):
+        """Return function(*args), computed once until one of glyphNames is invalidated."""
+        if key not in self._measurements:
+            self._measurements[key] = function(*args), self.getDependencies(glyphNames)
+        return self._measurements[key][0]
+
+    def getMeasurements(self):
+        """Return cached measurements as a picklable dict of key: (value, dependencies)."""
+        return dict(self._measurements)
+
+    def addMeasurements(self, measurements):
+        """Add measurements made by another FontAnalysis of the same font, in a worker process for instance."""
+        for key, entry in measurements.items():
+            self._measurements.setdefault(key, entry)
+
+    def invalidateGlyphs(self, glyphNames):
+        glyphNames = set(glyphNames)
+        for cache in [self._outlines, self._flattenedComponents, self._frozenGlyphs, self._measurements]:
+            for key, (value, dependencies) in cache.items():
+                if dependencies & glyphNames:
+                    del cache[key]
+
+
+def getRefStems(font, slantedSection=False, analysis=None):
     """
     Looks for stem values to serve as reference for a font in an interpolation scheme,
     only one typical value is returned for both horizontal and vertical stems.
     The method intersets the thick stem of a capital I and thin stem of a capital H.
     """
+    if analysis is None:
+        analysis = FontAnalysis(font)
+    return list(analysis.getMeasurement(('refStems', slantedSection), ['I', 'H'], _measureRefStems, font, slantedSection, analysis))
+
+
+def _measureRefStems(font, slantedSection, analysis):
     stems = []
-    angle = getSlantAngle(font, True)
+    angle = getSlantAngle(font, True, analysis)
 
     for i, glyphName in enumerate(['I','H']):
 
         if glyphName in font:
 
-            baseGlyph = font[glyphName]
-
             # removing overlap
-            glyph = freezeGlyph(baseGlyph)
+            glyph = analysis.getFrozenGlyph(glyphName)
             width = glyph.width
 
-            glyph.skew(-angle)
+            if angle:
+                glyph = glyph.copy()
+                glyph.skew(-angle)
 
             xMin, yMin, xMax, yMax = getGlyphBox(glyph)
             xCenter = width / 2
@@ -84,16 +191,21 @@ def getRefStems(font, slantedSection=False):
     return stems
 
 
-def getSlantAngle(font, returnDegrees=False):
+def getSlantAngle(font, returnDegrees=False, analysis=None):
     """Returns the probable slant/italic angle of a font measuring the slant of a capital I."""
+    if analysis is None:
+        analysis = FontAnalysis(font)
+    return analysis.getMeasurement(('slantAngle', returnDegrees), ['I'], _measureSlantAngle, font, returnDegrees, analysis)
+
 
+def _measureSlantAngle(font, returnDegrees, analysis):
     if 'I' in font:
         testGlyph = font['I']
         xMin, yMin, xMax, yMax = getGlyphBox(testGlyph)
         hCenter = (yMax - yMin) / 2
         delta = 10
         intersections = []
-        glyph = freezeGlyph(testGlyph)
+        glyph = analysis.getFrozenGlyph('I')
 
         for i in range(2):
             horizontal = hCenter + (i * delta)
@@ -110,15 +222,20 @@ def getSlantAngle(font, returnDegrees=False):
     return 0
 
 
-def freezeGlyph(glyph):
-    """Return a copy of a glyph, with components decomposed and all overlap removed."""
+def freezeGlyph(glyph, analysis=None):
+    """
+    Return a copy of a glyph, with components decomposed and all overlap removed.
+    Components are decomposed from the cached outlines of analysis, a FontAnalysis, if one is provided.
+    """
 
     toRFGlyph = RGlyph()
     toRFpen = toRFGlyph.getPen()
     glyph.draw(toRFpen)
 
     if len(glyph.components):
-        decomposedComponents = extractComposites(glyph)
+        # components drawn by the glyph are replaced by their decomposed outlines
+        toRFGlyph.clearComponents()
+        decomposedComponents = extractComposites(glyph, analysis)
         decomposedComponents.draw(toRFpen)
 
     singleContourGlyph = RGlyph()
@@ -129,19 +246,28 @@ def freezeGlyph(glyph):
     if len(toRFGlyph.contours) > 1:
 
         try:
-            booleanGlyphs = []
-
+            collectPen = CollectOutlinePointPen()
             for c in toRFGlyph.contours:
                 if len(c) > 1:
-                    b = BooleanGlyph()
-                    pen = b.getPen()
-                    c.draw(pen)
-                    booleanGlyphs.append(b)
-
-            finalBooleanGlyph = reduce(lambda g1, g2: g1 | g2, booleanGlyphs)
-            finalBooleanGlyph.drawPoints(pointPen)
+                    c.drawPoints(collectPen)
+            overlapping, isolated = _splitOverlappingContours(collectPen.contours)
+
+            # all contours that may overlap are merged in a single union,
+            # their point data is handed to the boolean glyph as is
+            if overlapping:
+                booleanGlyph = BooleanGlyph()
+                for points in overlapping:
+                    booleanGlyph.appendContourData(points)
+                booleanGlyph.removeOverlap().drawPoints(pointPen)
+
+            for points in isolated:
+                pointPen.beginPath()
+                for segmentType, pt, smooth, name in points:
+                    pointPen.addPoint(pt, segmentType=segmentType, smooth=smooth, name=name)
+                pointPen.endPath()
 
         except:
+            singleContourGlyph.clear()
             toRFGlyph.drawPoints(pointPen)
     else:
         toRFGlyph.drawPoints(pointPen)
@@ -149,63 +275,129 @@ def freezeGlyph(glyph):
     return singleContourGlyph
 
 
-def extractComposites(glyph):
-    """Return a new glyph with outline copies of each composite from the source glyph."""
+def _splitOverlappingContours(contours):
+    """
+    Return contours, given as lists of (segmentType, pt, smooth, name) tuples, that may overlap another contour
+    or themselves, and contours standing on their own.
+    Boxes are those of control points, which contain the curves.
+    """
+    boxes = [arrayTools.calcBounds([pt for segmentType, pt, smooth, name in points]) for points in contours]
+    overlaps = [_mayIntersectItself(points) for points in contours]
+    for i, box in enumerate(boxes):
+        for j in range(i + 1, len(boxes)):
+            if arrayTools.sectRect(box, boxes[j])[0]:
+                overlaps[i] = overlaps[j] = True
+    overlapping = [contour for contour, overlap in zip(contours, overlaps) if overlap]
+    isolated = [contour for contour, overlap in zip(contours, overlaps) if not overlap]
+    return overlapping, isolated
+
+
+def extractComposites(glyph, analysis=None):
+    """
+    Return a new glyph with outline copies of each composite from the source glyph,
+    nested components are decomposed as well.
+    """
 
     decomposedComposites = RGlyph()
 
     if len(glyph.components):
         font = glyph.getParent()
+        if analysis is None:
+            analysis = FontAnalysis(font)
+        pointPen = decomposedComposites.getPointPen()
 
         for comp in reversed(glyph.components):
 
-            # obtain source data
-            baseGlyphName = comp.baseGlyph
-            baseGlyph = font[baseGlyphName]
-            t = transform.Transform(*comp.transformation)
-
-            # create a temporary glyph on which to draw the decomposed composite
-            single_decomposedComposite = RGlyph()
-            decompPen = single_decomposedComposite.getPen()
-            baseGlyph.draw(decompPen)
-            single_decomposedComposite.transform(t)
+            # MathGlyph components are (baseGlyphName, transformation) tuples
+            if isinstance(comp, tuple):
+                baseGlyphName, transformation = comp
+            else:
+                baseGlyphName, transformation = comp.baseGlyph, comp.transformation
 
-            # add single composite to the returned glyph
-            decomposedComposites.appendGlyph(single_decomposedComposite)
+            for contour in analysis.getDecomposedContours(baseGlyphName, tuple(transformation)):
+                pointPen.beginPath()
+                for segmentType, pt, smooth, name in contour:
+                    pointPen.addPoint(pt, segmentType, smooth, name)
+                pointPen.endPath()
 
     return decomposedComposites
 
 
-def intersect(glyph, where, isHorizontal):
-    """
-    Intersect a glyph with a horizontal or vertical line.
-    Intersect each segment of a glyph using fontTools bezierTools.splitCubic and splitLine methods.
-    """
+def getSegments(glyph):
+    """Return a glyph’s outline as lists of line (2 points) and cubic (4 points) segments per contour."""
     pen = CollectSegmentsPen(glyph.getParent())
     glyph.draw(pen)
-    nakedGlyph = pen.getSegments()
-    glyphIntersections = []
-
-    for i, contour in enumerate(nakedGlyph):
+    return pen.getSegments()
 
-        for segment in contour:
 
-            length = len(segment)
+def _intersectSegment(segment, where, axis):
+    """
+    Return sorted (t, point) intersections of a line or cubic segment with a line at position where on axis,
+    for parameters in [0, 1) so that points shared by consecutive segments are only found once.
+    """
+    if len(segment) == 2:
+        (x1, y1), (x2, y2) = segment
+        a = (x2 - x1, y2 - y1)[axis]
+        if a == 0:
+            return []
+        t = (where - (x1, y1)[axis]) / a
+        if not 0 <= t < 1:
+            return []
+        pt = [x1 + (x2 - x1) * t, y1 + (y2 - y1) * t]
+        pt[axis] = where
+        return [(t, tuple(pt))]
+
+    (ax, ay), (bx, by), (cx, cy), (dx, dy) = bezierTools.calcCubicParameters(*segment)
+    a, b, c, d = ((ax, ay), (bx, by), (cx, cy), (dx, dy))
+    roots = bezierTools.solveCubic(a[axis], b[axis], c[axis], d[axis] - where)
+    intersections = []
+    for t in sorted(set([root for root in roots if 0 <= root < 1])):
+        pt = [((ax * t + bx) * t + cx) * t + dx, ((ay * t + by) * t + cy) * t + dy]
+        pt[axis] = where
+        intersections.append((t, tuple(pt)))
+    return intersections
+
+
+def intersectScanlines(glyph, positions, isHorizontal, segments=None):
+    """
+    Intersect a glyph with several horizontal or vertical lines at once.
+    Segments are collected once and rejected by the extent of their points before any root solving,
+    cubic segments are solved analytically.
 
-            if length == 2:
-                pt1, pt2 = segment
-                returnedSegments = splitLine(pt1, pt2, where, int(isHorizontal))
-            elif length == 4:
-                pt1, pt2, pt3, pt4 = segment
-                returnedSegments = bezierTools.splitCubic(pt1, pt2, pt3, pt4, where, int(isHorizontal))
+    Return a list with, for each position, a list of exact intersections as (point, contourIndex, segmentIndex, t),
+    in outline order. Pre-collected segments, as returned by getSegments(), can be passed to skip drawing the glyph.
+    """
+    if segments is None:
+        segments = getSegments(glyph)
+    axis = int(isHorizontal)
+    positions = list(positions)
+    results = [[] for position in positions]
+    for contourIndex, contour in enumerate(segments):
+        for segmentIndex, segment in enumerate(contour):
+            values = [pt[axis] for pt in segment]
+            low, high = min(values), max(values)
+            for positionIndex, where in enumerate(positions):
+                if where < low or where > high:
+                    continue
+                for t, pt in _intersectSegment(segment, where, axis):
+                    results[positionIndex].append((pt, contourIndex, segmentIndex, t))
+    return results
 
-            if len(returnedSegments) > 1:
-                intersectionPoints = findDuplicatePoints(returnedSegments)
-                if len(intersectionPoints):
-                    box = calcBounds(segment)
-                    intersectionPoints = [point for point in intersectionPoints if arrayTools.pointInRect(point, box)]
-                    glyphIntersections.extend(intersectionPoints)
 
+def intersect(glyph, where, isHorizontal):
+    """
+    Intersect a glyph with a horizontal or vertical line.
+    Return intersection points rounded to 4 decimals, see intersectScanlines() for exact results.
+    """
+    glyphIntersections = []
+    previous = None
+    for pt, contourIndex, segmentIndex, t in intersectScanlines(glyph, [where], isHorizontal)[0]:
+        pt = round(pt[0], 4), round(pt[1], 4)
+        # double roots of a segment round to a single point
+        if (pt, contourIndex, segmentIndex) == previous:
+            continue
+        previous = (pt, contourIndex, segmentIndex)
+        glyphIntersections.append(pt)
     return glyphIntersections
 
 
@@ -242,6 +434,8 @@ def findDuplicatePoints(segments):
 
 
 def getGlyphBox(glyph):
+    if isinstance(glyph, MathGlyph):
+        return getMathGlyphBounds(glyph, glyph.getParent())
     pen = BoundsPen(glyph.getParent())
     glyph.draw(pen)
     return pen.bounds
@@ -298,6 +492,7 @@ if __name__ == '__main__':
     import os
     import unittest
     from defcon import Font
+    from mutatorScale.booleanOperations.booleanGlyph import booleanResultsCache
 
     class FontUtilsTests(unittest.TestCase):
 
@@ -325,6 +520,63 @@ if __name__ == '__main__':
             intersections = intersect(glyph, xCenter, False)
             self.assertEqual(intersections, [(426.5, 356.0), (426.5, 396.0)])
 
+        def test_freezing_again_reuses_overlap_removal(self):
+            booleanResultsCache.clear()
+            glyph = freezeGlyph(self.font['H'])
+            hits = booleanResultsCache.hits
+            glyph2 = freezeGlyph(self.font['H'])
+            self.assertEqual(booleanResultsCache.hits, hits + 1)
+            self.assertEqual([[(point.x, point.y, point.type) for point in contour.points] for contour in glyph2], [[(point.x, point.y, point.type) for point in contour.points] for contour in glyph])
+
+        def test_freezing_removes_overlap_of_lone_self_intersecting_contour(self):
+            glyph = RGlyph()
+            pen = glyph.getPen()
+            # a bow tie, apart from a square
+            for points in [[(0, 0), (100, 100), (100, 0), (0, 100)], [(200, 0), (200, 100), (300, 100), (300, 0)]]:
+                pen.moveTo(points[0])
+                for point in points[1:]:
+                    pen.lineTo(point)
+                pen.closePath()
+            frozenGlyph = freezeGlyph(glyph)
+            self.assertEqual(sorted([len(contour) for contour in frozenGlyph]), [3, 3, 4])
+
+        def test_boolean_glyph_reads_math_glyph_data(self):
+            mathGlyph = MathGlyph(self.font['H'])
+            mathGlyph.lib['key'] = [1]
+            booleanGlyph = BooleanGlyph(mathGlyph)
+            self.assertEqual([contour._points for contour in booleanGlyph.contours], mathGlyph.contours)
+            self.assertEqual(booleanGlyph.lib, mathGlyph.lib)
+            self.assertIsNot(booleanGlyph.lib['key'], mathGlyph.lib['key'])
+            self.assertEqual(len(booleanGlyph.removeOverlap()), len(BooleanGlyph(self.font['H']).removeOverlap()))
+
+        def test_intersect_several_scanlines(self):
+            glyph = self.font['I']
+            yCenter = self.font.info.capHeight / 2
+            lines = intersectScanlines(glyph, [yCenter, yCenter + 10, -1000], True)
+            self.assertEqual([[pt for pt, contourIndex, segmentIndex, t in intersections] for intersections in lines], [[(234.0, 375.0), (134.0, 375.0)], [(234.0, 385.0), (134.0, 385.0)], []])
+
+        def test_analysis_freezes_glyphs_once(self):
+            analysis = FontAnalysis(self.font)
+            stems = getRefStems(self.font, analysis=analysis)
+            frozenGlyph = analysis.getFrozenGlyph('I')
+            getSlantAngle(self.font, analysis=analysis)
+            self.assertIs(analysis.getFrozenGlyph('I'), frozenGlyph)
+            self.assertEqual(stems, getRefStems(self.font))
+            analysis.invalidateGlyphs(['H'])
+            self.assertIs(analysis.getFrozenGlyph('I'), frozenGlyph)
+            analysis.invalidateGlyphs(['I'])
+            self.assertIsNot(analysis.getFrozenGlyph('I'), frozenGlyph)
+
+        def test_extract_nested_composites(self):
+            """Test that components of components are decomposed with composed transformations."""
+            inner = self.font.newGlyph('_inner')
+            inner.getPointPen().addComponent('I', (1, 0, 0, 1, 100, 0))
+            outer = self.font.newGlyph('_outer')
+            outer.getPointPen().addComponent('_inner', (2, 0, 0, 1, 0, 50))
+            decomposed = extractComposites(outer)
+            expected = [[(2 * x + 200, y + 50) for x, y in [(point.x, point.y) for point in contour]] for contour in self.font['I']]
+            self.assertEqual([[(point.x, point.y) for point in contour.points] for contour in decomposed], expected)
+
         def test_getRefStems(self):
             stems = getRefStems(self.font)
 
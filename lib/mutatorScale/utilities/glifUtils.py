@@ -0,0 +1,101 @@
+#coding=utf-8
+from __future__ import division
+
+import os
+import plistlib
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from mutatorScale.objects.mathGlyph import MathGlyph, MathGlyphPen
+
+'''
+Direct GLIF parsing into MathGlyph data.
+Only what scaling needs is read: outline, components, anchors, width and unicodes,
+glyph libs and notes are skipped and no intermediate glyph object is built.
+'''
+
+_componentAttributes = [('xScale', 1), ('xyScale', 0), ('yxScale', 0), ('yScale', 1), ('xOffset', 0), ('yOffset', 0)]
+
+
+def _number(value):
+    """Convert a GLIF number string to an int if possible, a float otherwise."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def readGlif(glif, glyphName=None):
+    """
+    Return a MathGlyph built from a .glif file.
+    glif can be a path, a file object or the GLIF data as a string.
+    """
+    if hasattr(glif, 'read'):
+        root = ElementTree.parse(glif).getroot()
+    elif glif.lstrip().startswith('<'):
+        root = ElementTree.fromstring(glif)
+    else:
+        root = ElementTree.parse(glif).getroot()
+
+    pen = MathGlyphPen()
+    width = 0
+    unicodes = []
+
+    for element in root:
+        tag = element.tag
+        if tag == 'outline':
+            for outlineElement in element:
+                if outlineElement.tag == 'contour':
+                    pen.beginPath()
+                    for point in outlineElement:
+                        if point.tag != 'point':
+                            continue
+                        attrib = point.attrib
+                        segmentType = attrib.get('type')
+                        if segmentType == 'offcurve':
+                            segmentType = None
+                        pen.addPoint(
+                            (_number(attrib['x']), _number(attrib['y'])),
+                            segmentType,
+                            attrib.get('smooth') == 'yes',
+                            attrib.get('name')
+                            )
+                    pen.endPath()
+                elif outlineElement.tag == 'component':
+                    attrib = outlineElement.attrib
+                    transformation = tuple([_number(attrib[key]) if key in attrib else default for key, default in _componentAttributes])
+                    pen.addComponent(attrib['base'], transformation)
+        elif tag == 'advance':
+            width = _number(element.attrib.get('width', 0))
+        elif tag == 'unicode':
+            unicodes.append(int(element.attrib['hex'], 16))
+        elif tag == 'anchor':
+            attrib = element.attrib
+            pen.anchors.append(((_number(attrib['x']), _number(attrib['y'])), attrib.get('name')))
+
+    glyph = MathGlyph(None)
+    glyph.contours = pen.contours
+    glyph.components = pen.components
+    glyph.anchors = pen.anchors
+    glyph.name = glyphName if glyphName is not None else root.attrib.get('name')
+    glyph.unicodes = unicodes
+    glyph.width = width
+    return glyph
+
+
+def readGlyphContents(ufoPath, layerDirectory='glyphs'):
+    """Return the glyphName to .glif file path mapping of a UFO layer."""
+    glyphsPath = os.path.join(ufoPath, layerDirectory)
+    contents = plistlib.readPlist(os.path.join(glyphsPath, 'contents.plist'))
+    return {glyphName: os.path.join(glyphsPath, fileName) for glyphName, fileName in contents.items()}
+
+
+def readFontInfo(ufoPath):
+    """Return the content of a UFO’s fontinfo.plist as a dict, empty if there is none."""
+    infoPath = os.path.join(ufoPath, 'fontinfo.plist')
+    if os.path.exists(infoPath):
+        return plistlib.readPlist(infoPath)
+    return {}
@@ -0,0 +1,21 @@
+#coding=utf-8
+from __future__ import division
+
+import hashlib
+
+from mutatorScale.objects.mathGlyph import MathGlyph
+
+'''
+Content hashes of glyphs, stable across processes,
+for change detection on fonts that do not post change notifications.
+'''
+
+def getGlyphHash(glyph):
+    """
+    Return a hex digest of a glyph’s outline, components, anchors, width and unicodes.
+    Glyphs other than MathGlyphs are converted to a MathGlyph first.
+    """
+    if not isinstance(glyph, MathGlyph):
+        glyph = MathGlyph(glyph)
+    data = (glyph.getContourData(), glyph.components, glyph.anchors, glyph.width, glyph.unicodes)
+    return hashlib.sha1(repr(data)).hexdigest()
@@ -0,0 +1,139 @@
+#coding=utf-8
+from __future__ import division
+
+from multiprocessing import Pool
+
+from fontTools.misc.arrayTools import calcBounds
+
+from mutatorScale.booleanOperations.booleanGlyph import BooleanContour, manager
+from mutatorScale.booleanOperations.booleanOperationManager import _getOverlapClusters, _mayIntersectItself
+from mutatorScale.pens.utilityPens import CollectOutlinePointPen
+
+'''
+Overlap removal over a whole font.
+Glyph outlines are read once as plain point data and glyphs whose contours can’t overlap,
+judging by their control bounds, are left out. The others are merged with a single union each,
+possibly in worker processes, and their contours are only replaced once all of them are done.
+Components, anchors and open contours are left untouched.
+'''
+
+def _isClosed(points):
+    return len(points) > 1 and points[0][0] != 'move'
+
+
+def mayOverlap(contours):
+    """
+    Return True if closed contours, given as lists of (segmentType, pt, smooth, name) tuples, may overlap
+    each other or themselves, that is if control bounds of two contours, or of non-adjacent segments of one contour, touch.
+    """
+    contours = [points for points in contours if _isClosed(points)]
+    boxes = [calcBounds([pt for segmentType, pt, smooth, name in points]) for points in contours]
+    for cluster in _getOverlapClusters(boxes):
+        if len(cluster) > 1 or _mayIntersectItself(contours[cluster[0]]):
+            return True
+    return False
+
+
+def removeOutlineOverlap(contours):
+    """
+    Return the union of closed contours given as lists of (segmentType, pt, smooth, name) tuples, in the same form.
+    Return None if the operation failed.
+    """
+    booleanContours = []
+    for points in contours:
+        contour = BooleanContour()
+        contour._points = points
+        booleanContours.append(contour)
+    pen = CollectOutlinePointPen()
+    try:
+        manager.union(booleanContours, pen)
+    except Exception:
+        return None
+    return pen.contours
+
+
+def removeOverlaps(font, glyphNames=None, workers=None):
+    """
+    Remove overlaps of all glyphs of a font, or of glyphNames only.
+    With two workers or more, overlaps are removed in a pool of worker processes.
+    Glyphs for which the operation fails are left as they are.
+    Return the list of glyph names whose contours were replaced.
+    """
+    if glyphNames is None:
+        glyphNames = font.keys()
+
+    outlines = []
+    for glyphName in glyphNames:
+        if glyphName not in font:
+            continue
+        pen = CollectOutlinePointPen()
+        font[glyphName].drawPoints(pen)
+        closedContours = [points for points in pen.contours if _isClosed(points)]
+        if mayOverlap(closedContours):
+            outlines.append((glyphName, pen.contours, closedContours))
+
+    if workers is not None and workers >= 2 and len(outlines) >= 2:
+        pool = Pool(min(workers, len(outlines)))
+        try:
+            results = pool.map(removeOutlineOverlap, [points for glyphName, contours, points in outlines])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [removeOutlineOverlap(points) for glyphName, contours, points in outlines]
+
+    changedGlyphNames = []
+    for (glyphName, contours, closedContours), result in zip(outlines, results):
+        if result is None:
+            continue
+        glyph = font[glyphName]
+        glyph.clearContours()
+        pointPen = glyph.getPointPen()
+        for points in result + [points for points in contours if not _isClosed(points)]:
+            pointPen.beginPath()
+            for segmentType, pt, smooth, name in points:
+                pointPen.addPoint(pt, segmentType=segmentType, smooth=smooth, name=name)
+            pointPen.endPath()
+        changedGlyphNames.append(glyphName)
+    return changedGlyphNames
+
+
+if __name__ == '__main__':
+
+    import os
+    import unittest
+    from defcon import Font
+
+    class OverlapTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            self.font = Font(os.path.join(libFolder, 'testFonts/two-axes/regular-low-contrast.ufo'))
+            glyph = self.font.newGlyph('overlap')
+            pen = glyph.getPen()
+            for xMin, yMin, xMax, yMax in [(0, 0, 100, 100), (50, 50, 150, 150)]:
+                pen.moveTo((xMin, yMin))
+                pen.lineTo((xMin, yMax))
+                pen.lineTo((xMax, yMax))
+                pen.lineTo((xMax, yMin))
+                pen.closePath()
+
+        def test_overlaps_are_removed(self):
+            self.assertEqual(removeOverlaps(self.font, ['overlap', 'H']), ['overlap'])
+            self.assertEqual(len(self.font['overlap']), 1)
+            self.assertEqual(len(self.font['overlap'][0]), 8)
+
+        def test_workers_match_single_process(self):
+            glyphNames = self.font.keys()
+            copy = Font(self.font.path)
+            copy.newGlyph('overlap')
+            self.font['overlap'].drawPoints(copy['overlap'].getPointPen())
+            changedGlyphNames = removeOverlaps(self.font, glyphNames)
+            self.assertEqual(removeOverlaps(copy, glyphNames, workers=2), changedGlyphNames)
+            for glyphName in changedGlyphNames:
+                pen1, pen2 = CollectOutlinePointPen(), CollectOutlinePointPen()
+                self.font[glyphName].drawPoints(pen1)
+                copy[glyphName].drawPoints(pen2)
+                self.assertEqual(pen1.contours, pen2.contours)
+
+    unittest.main()
@@ -0,0 +1,302 @@
+#coding=utf-8
+from __future__ import division
+from math import cos, radians
+
+import fontTools.misc.bezierTools as bezierTools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mutatorScale.utilities.fontUtils import FontAnalysis, getSegments, intersectScanlines, getGlyphBox, getSlantAngle
+
+'''
+Stem analysis over a sample of glyphs.
+Many scanlines are cast across each glyph of the sample, the lengths of filled runs along them
+are collected in histograms, vertical stems from horizontal scanlines and horizontal stems from vertical ones.
+The reference stem is taken around the most frequent run length, which makes it robust
+to serifs, terminals and the odd crossing of a curve’s extremum.
+
+Filled runs are found with the nonzero winding rule from crossing directions,
+so outlines don’t need their overlaps removed first.
+
+When numpy is available, all scanlines cast in one direction across a glyph are handled at once:
+line segments are intersected in closed form, cubic segments are split at their extrema into monotonic pieces
+whose crossings are found by bisection, and runs are read from cumulative winding numbers of sorted crossings.
+Otherwise scanlines are intersected one segment at a time with intersectScanlines().
+'''
+
+defaultStemSample = ['I', 'H', 'l', 'n', 'o', 'O']
+
+epsilon = 1e-9
+
+
+def _crossingDirection(segment, t, axis):
+    """Return 1 or -1 depending on the direction in which a segment crosses a scanline, 0 if it only touches it."""
+    if len(segment) == 2:
+        delta = segment[1][axis] - segment[0][axis]
+    else:
+        a, b, c, d = bezierTools.calcCubicParameters(*segment)
+        delta = (3 * a[axis] * t + 2 * b[axis]) * t + c[axis]
+    if abs(delta) < epsilon:
+        return 0
+    return 1 if delta > 0 else -1
+
+
+def getFilledRuns(intersections, segments, axis):
+    """
+    Return the lengths of filled runs along a scanline,
+    intersections being a list of (point, contourIndex, segmentIndex, t) as returned by intersectScanlines().
+    """
+    crossings = []
+    for pt, contourIndex, segmentIndex, t in intersections:
+        direction = _crossingDirection(segments[contourIndex][segmentIndex], t, axis)
+        if direction:
+            crossings.append((pt[1 - axis], direction))
+    crossings.sort()
+    runs = []
+    winding = 0
+    start = None
+    for position, direction in crossings:
+        if winding == 0:
+            start = position
+        winding += direction
+        if winding == 0:
+            runs.append(position - start)
+    return runs
+
+
+def _evaluateCubics(coefficients, t):
+    a, b, c, d = coefficients
+    return ((a * t + b) * t + c) * t + d
+
+
+def _getFilledRunsNumpy(segments, positions, axis):
+    """
+    Return an array of the lengths of filled runs along all scanlines at positions,
+    segments being lists of line (2 points) and cubic (4 points) segments per contour, as returned by getSegments().
+    """
+    other = 1 - axis
+    positions = numpy.asarray(positions, dtype=float)
+    lines = numpy.array([segment for contour in segments for segment in contour if len(segment) == 2], dtype=float).reshape(-1, 2, 2)
+    cubics = numpy.array([segment for contour in segments for segment in contour if len(segment) == 4], dtype=float).reshape(-1, 4, 2)
+
+    # lines, with the same arithmetic as fontUtils._intersectSegment()
+    start, delta = lines[:, 0], lines[:, 1] - lines[:, 0]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = (positions[None, :] - start[:, axis, None]) / delta[:, axis, None]
+    hit = (delta[:, axis, None] != 0) & (t >= 0) & (t < 1)
+    lineIndexes, scanlineIndexes = numpy.nonzero(hit)
+    coordinates = [start[lineIndexes, other] + delta[lineIndexes, other] * t[hit]]
+    lineDirections = delta[lineIndexes, axis]
+    directions = [numpy.where(numpy.abs(lineDirections) < epsilon, 0, numpy.sign(lineDirections))]
+    scanlines = [scanlineIndexes]
+
+    if len(cubics):
+        # cubic parameters as in bezierTools.calcCubicParameters()
+        pt1, pt2, pt3, pt4 = cubics[:, 0], cubics[:, 1], cubics[:, 2], cubics[:, 3]
+        c = (pt2 - pt1) * 3.0
+        b = (pt3 - pt2) * 3.0 - c
+        a = pt4 - pt1 - c - b
+        axisCoefficients = a[:, axis], b[:, axis], c[:, axis], pt1[:, axis]
+        otherCoefficients = a[:, other], b[:, other], c[:, other], pt1[:, other]
+        # extrema along axis, where 3a*t**2 + 2b*t + c is zero, split curves in monotonic pieces
+        qa, qb, qc = 3 * a[:, axis], 2 * b[:, axis], c[:, axis]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            root = numpy.sqrt(qb * qb - 4 * qa * qc)
+            quadratic = numpy.abs(qa) >= epsilon
+            t1 = numpy.where(quadratic, (-qb + root) / (2 * qa), -qc / qb)
+            t2 = numpy.where(quadratic, (-qb - root) / (2 * qa), numpy.nan)
+            extrema = numpy.stack([t1, t2], axis=1)
+            extrema = numpy.where((extrema > 0) & (extrema < 1), extrema, 1.0)
+        breaks = numpy.concatenate([numpy.zeros((len(cubics), 1)), numpy.sort(extrema, axis=1), numpy.ones((len(cubics), 1))], axis=1)
+        values = _evaluateCubics([coefficient[:, None] for coefficient in axisCoefficients], breaks)
+        for piece in range(3):
+            low, high = breaks[:, piece], breaks[:, piece + 1]
+            lowValue, highValue = values[:, piece, None], values[:, piece + 1, None]
+            increasing = highValue > lowValue
+            where = positions[None, :]
+            # pieces cover [low, high), a scanline touching an extremum doesn’t cross the curve
+            interior = (low > 0)[:, None]
+            crossesUp = increasing & (where < highValue) & ((where > lowValue) | ((where == lowValue) & ~interior))
+            crossesDown = (highValue < lowValue) & (where > highValue) & ((where < lowValue) | ((where == lowValue) & ~interior))
+            hit = (high > low)[:, None] & (crossesUp | crossesDown)
+            cubicIndexes, scanlineIndexes = numpy.nonzero(hit)
+            if not len(cubicIndexes):
+                continue
+            sign = numpy.where(increasing[cubicIndexes, 0], 1.0, -1.0)
+            where = positions[scanlineIndexes]
+            coefficients = [coefficient[cubicIndexes] for coefficient in axisCoefficients]
+            tLow, tHigh = low[cubicIndexes], high[cubicIndexes]
+            for i in range(52):
+                tMiddle = (tLow + tHigh) / 2
+                below = (_evaluateCubics(coefficients, tMiddle) - where) * sign < 0
+                tLow = numpy.where(below, tMiddle, tLow)
+                tHigh = numpy.where(below, tHigh, tMiddle)
+            coordinates.append(_evaluateCubics([coefficient[cubicIndexes] for coefficient in otherCoefficients], (tLow + tHigh) / 2))
+            directions.append(sign)
+            scanlines.append(scanlineIndexes)
+
+    coordinates = numpy.concatenate(coordinates)
+    directions = numpy.concatenate(directions)
+    scanlines = numpy.concatenate(scanlines)
+    crossing = directions != 0
+    coordinates, directions, scanlines = coordinates[crossing], directions[crossing], scanlines[crossing]
+    if not len(coordinates):
+        return numpy.zeros(0)
+    # crossings sorted along each scanline, as in getFilledRuns()
+    order = numpy.lexsort((directions, coordinates, scanlines))
+    coordinates, directions, scanlines = coordinates[order], directions[order], scanlines[order]
+    winding = numpy.cumsum(directions)
+    before = winding - directions
+    # winding numbers restart from zero on each scanline
+    offsets = before[numpy.searchsorted(scanlines, scanlines)]
+    before -= offsets
+    after = winding - offsets
+    starts = (before == 0) & (after != 0)
+    ends = (after == 0) & (before != 0)
+    lastStarts = numpy.maximum.accumulate(numpy.where(starts, numpy.arange(len(starts)), 0))
+    return coordinates[ends] - coordinates[lastStarts[ends]]
+
+
+def _getScanlinePositions(low, high, scanlineCount, margin):
+    span = high - low
+    if scanlineCount == 1:
+        return [low + span / 2]
+    return [low + span * (margin + (1 - 2 * margin) * i / (scanlineCount - 1)) for i in range(scanlineCount)]
+
+
+def getStemHistograms(font, glyphNames=None, scanlineCount=24, margin=0.2, maxStemRatio=0.5):
+    """
+    Return two dicts counting filled run lengths (rounded to units) across a sample of glyphs of a font:
+    (verticalStems, horizontalStems).
+
+    Scanlines are spread over the central part of each glyph, margin being the portion skipped at each end.
+    Runs longer than maxStemRatio times the glyph’s advance width (for vertical stems) or height (horizontal stems)
+    are not stems but bars, bowls or full height strokes, they are left out.
+    """
+    if glyphNames is None:
+        glyphNames = defaultStemSample
+    verticalStems = {}
+    horizontalStems = {}
+
+    for glyphName in glyphNames:
+        if glyphName not in font:
+            continue
+        glyph = font[glyphName]
+        box = getGlyphBox(glyph)
+        if box is None:
+            continue
+        xMin, yMin, xMax, yMax = box
+        segments = getSegments(glyph)
+
+        for isHorizontal, low, high, maxLength, histogram in [
+            (True, yMin, yMax, glyph.width * maxStemRatio, verticalStems),
+            (False, xMin, xMax, (yMax - yMin) * maxStemRatio, horizontalStems)
+            ]:
+            axis = int(isHorizontal)
+            positions = _getScanlinePositions(low, high, scanlineCount, margin)
+            if numpy is not None:
+                runs = _getFilledRunsNumpy(segments, positions, axis)
+                # runs are positive, rounded half away from zero as round() does
+                lengths, counts = numpy.unique(numpy.floor(runs[runs <= maxLength] + 0.5).astype(int), return_counts=True)
+                for length, count in zip(lengths.tolist(), counts.tolist()):
+                    histogram[length] = histogram.get(length, 0) + count
+                continue
+            for intersections in intersectScanlines(glyph, positions, isHorizontal, segments):
+                for run in getFilledRuns(intersections, segments, axis):
+                    if run <= maxLength:
+                        length = int(round(run))
+                        histogram[length] = histogram.get(length, 0) + 1
+
+    return verticalStems, horizontalStems
+
+
+def getHistogramStem(histogram, tolerance=0.03):
+    """
+    Return the typical stem value of a run length histogram, None if it’s empty.
+    Lengths are scored by how many runs fall within a relative tolerance of them,
+    the result is the median of runs around the best scoring length.
+    """
+    if not histogram:
+        return None
+    lengths = sorted(histogram)
+    bestScore, bestLength = 0, None
+    for length in lengths:
+        window = max(1, length * tolerance)
+        score = sum([histogram[other] for other in lengths if abs(other - length) <= window])
+        if score > bestScore:
+            bestScore, bestLength = score, length
+    window = max(1, bestLength * tolerance)
+    nearLengths = [length for length in lengths if abs(length - bestLength) <= window]
+    half = sum([histogram[length] for length in nearLengths]) / 2
+    count = 0
+    for length in nearLengths:
+        count += histogram[length]
+        if count >= half:
+            return float(length)
+
+
+def getSampledRefStems(font, glyphNames=None, slantedSection=False, scanlineCount=24, analysis=None):
+    """
+    Return [vstem, hstem] reference values measured on histograms of a sample of glyphs,
+    a more robust alternative to fontUtils.getRefStems() measuring a single cut of I and H.
+    Results are cached in analysis, a fontUtils.FontAnalysis, if one is provided.
+    """
+    if glyphNames is None:
+        glyphNames = defaultStemSample
+    if analysis is None:
+        analysis = FontAnalysis(font)
+    key = ('sampledStems', tuple(glyphNames), slantedSection, scanlineCount)
+    dependencies = list(glyphNames) + ['I'] if slantedSection else glyphNames
+    return list(analysis.getMeasurement(key, dependencies, _measureSampledStems, font, glyphNames, slantedSection, scanlineCount, analysis))
+
+
+def _measureSampledStems(font, glyphNames, slantedSection, scanlineCount, analysis):
+    verticalStems, horizontalStems = getStemHistograms(font, glyphNames, scanlineCount)
+    stems = [getHistogramStem(verticalStems), getHistogramStem(horizontalStems)]
+    if slantedSection == True and stems[0] is not None:
+        stems[0] *= cos(radians(getSlantAngle(font, True, analysis)))
+    return stems
+
+
+if __name__ == '__main__':
+
+    import os
+    import unittest
+    from defcon import Font
+    from mutatorScale.utilities.fontUtils import getRefStems
+
+    class StemUtilsTests(unittest.TestCase):
+
+        def setUp(self):
+            libFolder = os.path.dirname(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
+            self.fontPaths = [os.path.join(libFolder, u'testFonts/isotropic-anisotropic', fileName) for fileName in ['regular-mid-contrast.ufo', 'bold-mid-contrast.ufo']]
+
+        def test_filled_runs_ignore_overlaps(self):
+            font = Font(self.fontPaths[0])
+            glyph = font['H']
+            segments = getSegments(glyph)
+            intersections = intersectScanlines(glyph, [glyph.width / 2], False, segments)[0]
+            self.assertEqual(getFilledRuns(intersections, segments, 0), [40])
+
+        def test_sampled_stems_match_reference_cuts(self):
+            """Test that on regular test fonts, stems sampled on several glyphs agree with single cuts of I and H."""
+            for fontPath in self.fontPaths:
+                font = Font(fontPath)
+                self.assertEqual(getSampledRefStems(font), getRefStems(font))
+
+        @unittest.skipIf(numpy is None, 'numpy is not installed')
+        def test_numpy_histograms_match_scanline_histograms(self):
+            global numpy
+            for fontPath in self.fontPaths:
+                font = Font(fontPath)
+                histograms = getStemHistograms(font, scanlineCount=60)
+                moduleNumpy, numpy = numpy, None
+                try:
+                    self.assertEqual(histograms, getStemHistograms(font, scanlineCount=60))
+                finally:
+                    numpy = moduleNumpy
+
+    unittest.main()